@@ -1,3 +1,3 @@
 sudo umount -f ~/Desktop/dropbox
 rm -r ~/Desktop/.cache/*
-rm ~/Desktop/.config/metadata.pkl
\ No newline at end of file
+rm ~/Desktop/.config/metadata.pkl ~/Desktop/.config/metadata.db*
\ No newline at end of file
@@ -1,8 +1,10 @@
 # cmd of the dropbox daemon
 from src.data.data import DropboxInterface
 from src.fuselayer.fuselayer import FuseDropBox
+from src.fuselayer.lowlevel import FuseDropBoxLL
 from src.lib.fuse import FUSE
 from src.model.model import DropBoxModel
+from src.model.metadata_store import MetadataStore
 import atexit
 import os
 import sys
@@ -152,7 +154,21 @@ def start_daemon(args):
         data = {"token": auth_token}
 
         db = DropboxInterface(auth_token)
-        model = DropBoxModel(db, rootdir, swapdir)
+        # the store only opens its database when the model first loads from it,
+        # importing an existing metadata.pkl on that first load
+        metadata_store = MetadataStore(
+            os.path.join(config.TMP_DIR, "metadata.db"),
+            legacy_pickle_path=os.path.join(config.TMP_DIR, "metadata.pkl"),
+        )
+        model = DropBoxModel(
+            db,
+            rootdir,
+            swapdir,
+            metadata_store=metadata_store,
+            background_hydrate=args.b,
+            lazy_metadata=args.l,
+            metadata_budget=args.metadata_budget,
+        )
         # model.clearAll()
         # model.downloadAll()
         # model.saveMetadataToFile()
@@ -180,17 +196,26 @@ def start_daemon(args):
         subscribe_thread.start()
 
         try:
-            fuse = FUSE(
-                FuseDropBox(rootdir, model),
-                os.path.join(WORKING_DIR, "dropbox"),
-                foreground=True,
-                allow_other=True,
-            )
+            if args.i:
+                # mounts and serves requests until unmounted, like FUSE below
+                FuseDropBoxLL(os.path.join(WORKING_DIR, "dropbox"), rootdir, model)
+            else:
+                fuse = FUSE(
+                    FuseDropBox(rootdir, model),
+                    os.path.join(WORKING_DIR, "dropbox"),
+                    foreground=True,
+                    allow_other=True,
+                    # let libfuse fill in inode numbers of listed entries; use_ino stays off
+                    # since local and remote attributes do not share a stable inode space
+                    readdir_ino=True,
+                )
         except Exception as e:
             with open(os.path.join(WORKING_DIR, "hi.txt"), "a") as file:
                 file.write(f"Error: {e}")
-            model.stop()
             sys.exit(1)
+        finally:
+            # unmounted or failed: upload what is queued and write the pending metadata
+            model.stop()
 
 
 def stop_daemon(args):
@@ -228,6 +253,27 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable test mode for the daemon pass auth token from env variable MY_APP_AUTH_TOKEN",
     )
+    parser_start.add_argument(
+        "-b",
+        action="store_true",
+        help="Mount immediately and list the remote metadata in the background",
+    )
+    parser_start.add_argument(
+        "-l",
+        action="store_true",
+        help="List remote directories only when they are visited instead of the whole account",
+    )
+    parser_start.add_argument(
+        "-i",
+        action="store_true",
+        help="Mount with the inode based low level fuse api instead of the path based one",
+    )
+    parser_start.add_argument(
+        "--metadata-budget",
+        type=int,
+        default=config.LAZY_METADATA_BUDGET,
+        help="Number of remote entries kept in memory in lazy mode before cold directories are dropped",
+    )
     parser_start.set_defaults(func=start_daemon)
 
     parser_stop = subparsers.add_parser("stop", help="Stop the dropbox daemon")
@@ -3,4 +3,21 @@ import os
 APP_KEY = "p379vmpas0tf58c"
 SUBSCRIBE_URL = "https://vcm-39026.vm.duke.edu:5002/events"
 TMP_DIR = os.path.expanduser("~/Desktop/.config")
-REDIRECT_URI = "http://localhost:5000/oauth2/callback"
\ No newline at end of file
+REDIRECT_URI = "http://localhost:5000/oauth2/callback"
+# remote entries kept in memory by the lazy metadata mode (start -l)
+LAZY_METADATA_BUDGET = 200000
+# seconds the kernel may cache attributes and name lookups of the low level layer (start -i),
+# remote changes are invalidated explicitly so these only bound missed notifications
+ATTR_TIMEOUT = 60.0
+ENTRY_TIMEOUT = 60.0
+# uploads running at the same time, and failed attempts before a file is given up
+UPLOAD_WORKERS = 8
+UPLOAD_RETRIES = 3
+# queued files up to this size are committed together, this many per call (at most 1000)
+UPLOAD_BATCH_SIZE = 100
+UPLOAD_BATCH_MAX_FILE_SIZE = 4 * 1024 * 1024
+# bytes sent per upload request, a file being uploaded holds one chunk per request in flight
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# chunks of one large file uploaded at the same time, concurrent upload sessions
+# need UPLOAD_CHUNK_SIZE to be a multiple of 4 MiB, 1 appends the chunks in order
+UPLOAD_SESSION_PARALLELISM = 4
@@ -6,8 +6,10 @@ import os
 import time
 import datetime
 import contextlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from loguru import logger
 from tzlocal import get_localzone
+import src.config.config as config
 
 
 @contextlib.contextmanager
@@ -21,33 +23,90 @@ def stopwatch(message):
         print("Total elapsed time for %s: %.3f" % (message, t1 - t0))
 
 
+class FolderListing:
+    """
+    Streams the entries of a folder listing page by page.
+
+    Iterating yields entries as each page arrives and keeps calling
+    files_list_folder_continue while has_more is set. cursor holds the cursor
+    of the last page read, so it is complete once iteration finishes.
+    """
+
+    def __init__(self, dbx, fetch_first_page):
+        self.dbx = dbx
+        self.fetch_first_page = fetch_first_page
+        self.cursor = None
+
+    def __iter__(self):
+        res = self.fetch_first_page()
+        while True:
+            yield from res.entries
+            self.cursor = res.cursor
+            if not res.has_more:
+                return
+            res = self.dbx.files_list_folder_continue(res.cursor)
+
+
+# chunks appended to a concurrent upload session must be multiples of this
+CONCURRENT_CHUNK_ALIGN = 4 * 1024 * 1024
+
+
 class DropboxInterface:
-    def __init__(self, token):
+    def __init__(
+        self,
+        token,
+        chunk_size=config.UPLOAD_CHUNK_SIZE,
+        parallelism=config.UPLOAD_SESSION_PARALLELISM,
+    ):
         self.dbx = dropbox.Dropbox(token)
+        # bytes sent per upload call, files up to one chunk are uploaded in a single call
+        self.chunk_size = chunk_size
+        # chunks of one large file in flight at a time, 1 appends them one after another
+        self.parallelism = parallelism
+        self.chunk_workers = None
+        if parallelism > 1:
+            if chunk_size % CONCURRENT_CHUNK_ALIGN:
+                logger.warning(
+                    f"chunk size {chunk_size} is not a multiple of 4 MiB, uploading chunks one at a time"
+                )
+            else:
+                self.chunk_workers = ThreadPoolExecutor(
+                    max_workers=parallelism, thread_name_prefix="upload-chunk"
+                )
 
-    def list_folder(self, path, recursive=False):
-        res = self.dbx.files_list_folder(path, recursive=recursive)
-        if res.has_more:
-            logger.error("ListFolder Error: There are more files to list")
-        rv = {}
-        for entry in res.entries:
-            rv[entry.path_display] = entry
+    def close(self):
+        """Stop the workers sending the chunks of concurrent uploads.
+
+        Waits for the chunks in flight, no upload may be started afterwards.
+        """
+        if self.chunk_workers is not None:
+            self.chunk_workers.shutdown(wait=True)
 
-        return rv, res.cursor
+    def list_folder(self, path, recursive=False):
+        return FolderListing(
+            self.dbx, lambda: self.dbx.files_list_folder(path, recursive=recursive)
+        )
 
     def getUpdates(self, cursor):
         if cursor is None:
             return self.list_folder("", recursive=True)
 
-        res = self.dbx.files_list_folder_continue(cursor)
-        rv = {}
-        for entry in res.entries:
-            rv[entry.name] = entry
-        return rv, res.cursor
+        return FolderListing(
+            self.dbx, lambda: self.dbx.files_list_folder_continue(cursor)
+        )
 
-    def upload(self, file, path, overwrite=False):
+    def get_latest_cursor(self, path, recursive=False):
+        # a cursor for the current state without listing anything
+        return self.dbx.files_list_folder_get_latest_cursor(
+            path, recursive=recursive
+        ).cursor
+
+    def upload(self, file, path, overwrite=False, progress=None):
         """Upload a file.
 
+        Files up to one chunk go up in a single call, larger ones are streamed
+        through an upload session one chunk at a time. progress(sent, size) is
+        called as the file goes up.
         Return the request response, or None in case of error.
         """
         mode = (
@@ -56,12 +115,13 @@ class DropboxInterface:
             else dropbox.files.WriteMode.add
         )
         mtime = os.path.getmtime(file)
+        size = os.stat(file).st_size
         print(file)
-        with open(file, "rb") as f:
-            data = f.read()
-        with stopwatch("upload %d bytes" % len(data)):
+        with stopwatch("upload %d bytes" % size):
             try:
-                if len(data) <= 150 * 1024 * 1024:
+                if size <= self.chunk_size:
+                    with open(file, "rb") as f:
+                        data = f.read()
                     res = self.dbx.files_upload(
                         data,
                         path,
@@ -70,40 +130,155 @@ class DropboxInterface:
                         mute=True,
                         autorename=True,
                     )
+                    if progress is not None:
+                        progress(len(data), size)
                     logger.warning(f"uploaded as {res.name}")
                     return res
                 else:
-                    res = self.upload_large_file(file, path, len(data))
+                    commit = self.commit_info(file, path, overwrite)
+                    if self.chunk_workers is not None:
+                        res = self.upload_large_file_concurrent(file, path, size, commit, progress)
+                    else:
+                        res = self.upload_large_file(file, path, size, commit, progress)
                     logger.warning(f"uploaded as {path}")
                     return res
             except dropbox.exceptions.ApiError as err:
                 print("*** API error", err)
                 return None
 
-    def upload_large_file(self, file, path, size):
-        CHUNK_SIZE = 10 * 1024 * 1024
+    def upload_large_file(self, file, path, size, commit=None, progress=None):
+        """Stream a file through an upload session.
+
+        Only the chunk being sent is held in memory. size is the size the
+        file had when the upload started, the session ends at the first chunk
+        reaching it.
+
+        Chunks are read into one buffer reused for the whole file. The SDK
+        only takes immutable bytes for a request body, so that it can resend
+        it on a retry, and each chunk is copied out of the buffer once.
+        """
+        if commit is None:
+            commit = dropbox.files.CommitInfo(
+                path=path, mode=dropbox.files.WriteMode.overwrite
+            )
         logger.warning(f"Uploading {file} to {path} with size {size}")
+        view = memoryview(bytearray(self.chunk_size))
         with open(file, "rb") as f:
-            upload_session_start_result = self.dbx.files_upload_session_start(
-                f.read(CHUNK_SIZE)
-            )
+            # the copies are passed straight on, so only the one being sent is alive
+            n = f.readinto(view)
+            upload_session_start_result = self.dbx.files_upload_session_start(bytes(view[:n]))
             cursor = dropbox.files.UploadSessionCursor(
-                session_id=upload_session_start_result.session_id, offset=f.tell()
+                session_id=upload_session_start_result.session_id, offset=n
             )
+            while True:
+                if progress is not None:
+                    progress(cursor.offset, size)
+                n = f.readinto(view)
+                if cursor.offset + n >= size or not n:
+                    res = self.dbx.files_upload_session_finish(bytes(view[:n]), cursor, commit)
+                    if progress is not None:
+                        progress(cursor.offset + n, size)
+                    return res
+                self.dbx.files_upload_session_append_v2(bytes(view[:n]), cursor)
+                cursor.offset += n
+
+    def upload_large_file_concurrent(self, file, path, size, commit=None, progress=None):
+        """Upload a file through a concurrent upload session.
+
+        Chunks are appended at their own offsets, parallelism of them at a time,
+        each read from the file by the worker sending it. The last chunk closes
+        the session once every other chunk has been acknowledged.
+        """
+        if commit is None:
             commit = dropbox.files.CommitInfo(
                 path=path, mode=dropbox.files.WriteMode.overwrite
             )
-
-            while f.tell() < size:
-                # logger.warning(f"Uploaded {f.tell()} of {size}")
-                if (size - f.tell()) <= CHUNK_SIZE:
-                    res = self.dbx.files_upload_session_finish(
-                        f.read(CHUNK_SIZE), cursor, commit
+        logger.warning(f"Uploading {file} to {path} with size {size} in concurrent chunks")
+        session_id = self.dbx.files_upload_session_start(
+            b"", session_type=dropbox.files.UploadSessionType.concurrent
+        ).session_id
+        offsets = list(range(0, size, self.chunk_size))
+        last = offsets.pop()
+        sent = 0
+        pending = set()
+        fd = os.open(file, os.O_RDONLY)
+        try:
+            for offset in offsets:
+                if len(pending) >= self.parallelism:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    sent += sum(chunk.result() for chunk in done)
+                    if progress is not None:
+                        progress(sent, size)
+                pending.add(
+                    self.chunk_workers.submit(
+                        self.append_chunk, fd, session_id, offset, self.chunk_size
                     )
-                    return res
-                else:
-                    self.dbx.files_upload_session_append_v2(f.read(CHUNK_SIZE), cursor)
-                    cursor.offset = f.tell()
+                )
+            done, pending = wait(pending)
+            sent += sum(chunk.result() for chunk in done)
+            sent += self.append_chunk(fd, session_id, last, size - last, close=True)
+        finally:
+            # no chunk may still be reading when the descriptor is closed
+            wait(pending)
+            os.close(fd)
+        if progress is not None:
+            progress(sent, size)
+        cursor = dropbox.files.UploadSessionCursor(session_id=session_id, offset=sent)
+        return self.dbx.files_upload_session_finish(b"", cursor, commit)
+
+    def append_chunk(self, fd, session_id, offset, length, close=False):
+        # read one chunk and append it at its offset, returns the bytes sent;
+        # pread hands back the bytes the SDK needs without an intermediate buffer
+        data = os.pread(fd, length, offset)
+        cursor = dropbox.files.UploadSessionCursor(session_id=session_id, offset=offset)
+        self.dbx.files_upload_session_append_v2(data, cursor, close=close)
+        return len(data)
+
+    def commit_info(self, file, path, overwrite=False):
+        # how upload commits file to path, for the session based uploads
+        mode = (
+            dropbox.files.WriteMode.overwrite
+            if overwrite
+            else dropbox.files.WriteMode.add
+        )
+        mtime = os.path.getmtime(file)
+        return dropbox.files.CommitInfo(
+            path=path,
+            mode=mode,
+            client_modified=datetime.datetime(*time.gmtime(mtime)[:6]),
+            mute=True,
+            autorename=True,
+        )
+
+    def start_batch_upload(self, file, path, overwrite=False):
+        """Send a small file in a single closed upload session.
+
+        Return the argument committing it to path in finish_batch_upload.
+        """
+        commit = self.commit_info(file, path, overwrite)
+        with open(file, "rb") as f:
+            data = f.read()
+        res = self.dbx.files_upload_session_start(data, close=True)
+        cursor = dropbox.files.UploadSessionCursor(
+            session_id=res.session_id, offset=len(data)
+        )
+        return dropbox.files.UploadSessionFinishArg(cursor=cursor, commit=commit)
+
+    def finish_batch_upload(self, entries):
+        """Commit up to 1000 sessions of start_batch_upload in one call.
+
+        Return the metadata of each committed file, or None where its commit failed.
+        """
+        with stopwatch("commit %d files" % len(entries)):
+            res = self.dbx.files_upload_session_finish_batch_v2(entries)
+        results = []
+        for entry, result in zip(entries, res.entries):
+            if result.is_success():
+                results.append(result.get_success())
+            else:
+                logger.error(f"commit of {entry.commit.path} failed: {result.get_failure()}")
+                results.append(None)
+        return results
 
     def download(self, path, file):
         self.dbx.files_download_to_file(file, path)
@@ -146,16 +321,17 @@ if __name__ == "__main__":
         sys.exit(1)
     rootPath = "/home/tq22/ece566/SmartSync-Linux/cache"
     db = DropboxInterface(sys.argv[1])
-    dic, c = db.list_folder("", recursive=True)
-
-    for k, v in dic.items():
-        print(k, v)
+    listing = db.list_folder("", recursive=True)
+    for v in listing:
+        print(v.path_display, v)
         print()
+    c = listing.cursor
     while True:
         inp = input("Press Enter to continue... (n) to exit: ")
         if inp == "n":
             break
-        update, c = db.getUpdates(c)
-        for k, v in update.items():
-            print(k, v)
+        update = db.getUpdates(c)
+        for v in update:
+            print(v.path_display, v)
             print()
+        c = update.cursor
@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class DirtyHandles:
+    """
+    Write state of the open file handles, so that a written file is handed to the
+    model once when its handle is flushed instead of after every write.
+
+    Attributes:
+        handles (dict): fh -> [path, high-water mark, mtime of the last write].
+    """
+
+    def __init__(self) -> None:
+        self.handles = {}
+        self.mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self.handles)
+
+    def mark(self, fh, path, end) -> bool:
+        """
+        record a write through fh ending at offset end, returns whether it is the first
+        write since the last flush or extends the file
+        """
+        now = time.time()
+        with self.mutex:
+            state = self.handles.get(fh)
+            if state is None:
+                self.handles[fh] = [path, end, now]
+                return True
+            state[2] = now
+            if end > state[1]:
+                state[1] = end
+                return True
+            return False
+
+    def pop(self, fh):
+        """
+        (path, high-water mark, mtime) of fh and mark it clean, None if it was not written
+        """
+        with self.mutex:
+            state = self.handles.pop(fh, None)
+        return tuple(state) if state is not None else None
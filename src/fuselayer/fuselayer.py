@@ -7,15 +7,21 @@ import errno
 import errno
 import os
 from loguru import logger
+from src.fuselayer.dirty_handles import DirtyHandles
 
 
 class FuseDropBox(LoggingMixIn, Operations):
     "Example memory filesystem. Supports only one level of files."
 
+    # read and write go straight between the kernel buffer and the cache file
+    use_buffers = True
+
     def __init__(self, rootdir, dbmodel):
         self.rootdir = rootdir
         #        print("ROOTDIR IS", rootdir)
         self.db = dbmodel
+        # written handles, uploaded once when they are flushed
+        self.dirty = DirtyHandles()
         logger.remove()
         log_path = os.path.expanduser("~/Desktop/.config/dropbox.log")
         logger.add(log_path, level="INFO")
@@ -25,6 +31,7 @@ class FuseDropBox(LoggingMixIn, Operations):
         logger.info(f"CHMOD CALLED, path: {path}")
         if path[0] == "/":
             path = path[1:]
+        self.db.invalidateAttr(path)
         path = os.path.join(self.rootdir, path)
         return os.chmod(path, mode)
 
@@ -33,6 +40,7 @@ class FuseDropBox(LoggingMixIn, Operations):
         logger.info(f"CHOWN CALLED, path: {path}")
         if path[0] == "/":
             path = path[1:]
+        self.db.invalidateAttr(path)
         path = os.path.join(self.rootdir, path)
         os.chown(path, uid, gid)
 
@@ -92,17 +100,23 @@ class FuseDropBox(LoggingMixIn, Operations):
         # logger.info(f"OPEN CALLED WITH ID {random.randint(0, 100)}, path: {path}")
         local_path = os.path.join(self.rootdir, path.lstrip("/"))
 
-        return self.db.open_file(path, local_path, flags)
+        fh = self.db.open_file(path, local_path, flags)
+        if fh == -1:
+            # read and write use the descriptor, a failed open must not hand one out
+            raise FuseOSError(errno.ENOENT)
+        return fh
 
     def read(self, path, size, offset, fh):
         # id = random.randint(0, 100)
         # logger.info(f"READ CALLED, path: {path}")
         # logger.debug(f"STARTING READ WITH ID {id}")
 
-        local_path = os.path.join(self.rootdir, path.lstrip("/"))
-        with open(local_path, "rb") as f:
-            f.seek(offset)
-            return f.read(size)
+        # reuse the descriptor from open() instead of reopening the file per callback
+        return os.pread(fh, size, offset)
+
+    def readinto(self, path, buf, offset, fh):
+        # buf is a view of the kernel buffer, fill it without an intermediate bytes copy
+        return os.preadv(fh, [buf], offset)
 
     def readdir(self, path, fh):
         logger.info(f"READDIR CALLED, path: {path}")
@@ -201,27 +215,50 @@ class FuseDropBox(LoggingMixIn, Operations):
         # logger.info(f"UTIMENS CALLED WITH ID {random.randint(0, 100)}, path: {path}")
         if path[0] == "/":
             path = path[1:]
+        self.db.invalidateAttr(path)
         os.utime(path, times)
 
     def write(self, path, data, offset, fh):
         # id = random.randint(0, 100)
         # logger.info(f"WRITE CALLED WITH ID {id}")
         ret = os.pwrite(fh, data, offset)
-        # local_path = os.path.join(self.rootdir, path)
-        # new_size = offset + ret
-        self.db.write(path, offset + ret)
-        # TODO
-        # upload and change uploaded to True
-        # self.db.upload(local_path,path, new_size)
-        # logger.warning(f"WRITE DONE ADD UPLOAD TASK")
+        # the upload is scheduled when the handle is flushed, only the cached
+        # attributes have to go when the file grows
+        if self.dirty.mark(fh, path, offset + ret):
+            self.db.invalidateAttr(path)
         return ret
 
+    def flush(self, path, fh):
+        self.schedule_upload(fh)
+        return 0
+
+    def fsync(self, path, datasync, fh):
+        logger.info(f"FSYNC CALLED, path: {path}")
+        if datasync:
+            os.fdatasync(fh)
+        else:
+            os.fsync(fh)
+        self.schedule_upload(fh)
+        return 0
+
     def release(self, path, fh):
         # logger.info(f"RELEASE CALLED WITH ID {random.randint(0, 100)}, path: {path}")
         logger.info(f"RELEASE CALLED, path: {path}")
-        os.close(fh)
+        try:
+            self.schedule_upload(fh)
+        finally:
+            os.close(fh)
         return 0
 
+    def schedule_upload(self, fh):
+        # one upload task per flushed handle instead of one per write
+        state = self.dirty.pop(fh)
+        if state is None:
+            return
+        path, _, mtime = state
+        # the high-water mark misses writes inside a longer file and truncates
+        self.db.write(path, os.fstat(fh).st_size, mtime)
+
 
 if __name__ == "__main__":
     import argparse
@@ -0,0 +1,118 @@
+import threading
+
+ROOT_INO = 1
+
+
+class InodeTable:
+    """
+    Maps the inode numbers handed to the kernel to paths in the dropbox.
+
+    Every successful lookup or create adds one reference to an inode and the kernel
+    gives them back with forget(); an inode is dropped once its count reaches zero.
+    Paths of children are built from the parent's path, so nothing is re-parsed from
+    a full path on each operation.
+
+    Attributes:
+        paths (dict): inode number -> path.
+        inodes (dict): path -> inode number.
+        lookups (dict): inode number -> references held by the kernel.
+    """
+
+    def __init__(self) -> None:
+        self.paths = {ROOT_INO: "/"}
+        self.inodes = {"/": ROOT_INO}
+        self.lookups = {ROOT_INO: 1}
+        self.next_ino = ROOT_INO + 1
+        self.mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def path(self, ino):
+        """
+        path of a known inode, raises KeyError for forgotten or unlinked inodes
+        """
+        path = self.paths[ino]
+        if path is None:
+            raise KeyError(ino)
+        return path
+
+    def child(self, parent, name):
+        """
+        path of the entry name in the directory inode parent
+        """
+        path = self.path(parent)
+        return path + name if path == "/" else path + "/" + name
+
+    def find(self, path):
+        """
+        inode number of path if the kernel may know it, None otherwise
+        """
+        return self.inodes.get(path)
+
+    def _ino(self, path):
+        ino = self.inodes.get(path)
+        if ino is None:
+            ino = self.next_ino
+            self.next_ino += 1
+            self.inodes[path] = ino
+            self.paths[ino] = path
+            self.lookups[ino] = 0
+        return ino
+
+    def remember(self, path):
+        """
+        inode number of path with one more reference held by the kernel
+        """
+        with self.mutex:
+            ino = self._ino(path)
+            # the root is never forgotten, so its references are not counted
+            if ino != ROOT_INO:
+                self.lookups[ino] += 1
+            return ino
+
+    def forget(self, ino, nlookup):
+        with self.mutex:
+            count = self.lookups.get(ino)
+            if count is None or ino == ROOT_INO:
+                return
+            if count > nlookup:
+                self.lookups[ino] = count - nlookup
+                return
+            del self.lookups[ino]
+            path = self.paths.pop(ino)
+            if self.inodes.get(path) == ino:
+                del self.inodes[path]
+
+    def rename(self, old, new):
+        """
+        move the inodes of old and everything below it to new, keeping their numbers
+        """
+        with self.mutex:
+            prefix = old.rstrip("/") + "/"
+            moved = [p for p in self.inodes if p == old or p.startswith(prefix)]
+            for path in moved:
+                ino = self.inodes.pop(path)
+                target = new + path[len(old):]
+                # an entry replaced by the rename keeps its number but no path
+                replaced = self.inodes.pop(target, None)
+                if replaced is not None:
+                    self._unlink(replaced)
+                self.inodes[target] = ino
+                self.paths[ino] = target
+
+    def discard(self, path):
+        """
+        unlink path and its subtree, inodes still referenced keep their numbers
+        """
+        with self.mutex:
+            prefix = path.rstrip("/") + "/"
+            for p in [p for p in self.inodes if p == path or p.startswith(prefix)]:
+                self._unlink(self.inodes.pop(p))
+
+    def _unlink(self, ino):
+        if self.lookups[ino]:
+            self.paths[ino] = None
+        else:
+            del self.paths[ino]
+            del self.lookups[ino]
@@ -0,0 +1,339 @@
+# the fuse interaction layer on the low level inode api
+import errno
+import os
+import threading
+from stat import S_IFDIR, S_IFMT
+from loguru import logger
+from src.lib.fusell import FUSELL
+from src.fuselayer.inode_table import InodeTable
+from src.fuselayer.dirty_handles import DirtyHandles
+import src.config.config as config
+
+
+class FuseDropBoxLL(FUSELL):
+    """
+    The dropbox filesystem on the inode based low level api of libfuse.
+
+    libfuse hands out inode numbers instead of resolving full paths for every call;
+    the inode table turns them back into model paths. Attributes and name lookups,
+    including misses, are cached by the kernel for attr_timeout and entry_timeout,
+    and file data across opens with keep_cache. Remote changes reported by the model
+    are pushed to the kernel with the notify calls, so those caches can live long.
+
+    Args:
+        mountpoint (str): where to mount, None builds the filesystem without mounting.
+        rootdir (str): local cache directory.
+        dbmodel (DropBoxModel): the model serving metadata and file contents.
+        attr_timeout (float): seconds the kernel may cache attributes.
+        entry_timeout (float): seconds the kernel may cache name lookups.
+        keep_cache (bool): keep the page cache of a file when it is opened again.
+    """
+
+    def __init__(
+        self,
+        mountpoint,
+        rootdir,
+        dbmodel,
+        attr_timeout=config.ATTR_TIMEOUT,
+        entry_timeout=config.ENTRY_TIMEOUT,
+        keep_cache=True,
+    ):
+        self.rootdir = rootdir
+        self.db = dbmodel
+        self.attr_timeout = attr_timeout
+        self.entry_timeout = entry_timeout
+        self.keep_cache = keep_cache
+        # FUSELL sets it when mounting, replies and notifications need it before that
+        self.encoding = "utf-8"
+        self.inodes = InodeTable()
+        # written handles, uploaded once when they are flushed
+        self.dirty = DirtyHandles()
+        # listings of open directories, readdir is called again for every buffer full
+        self.listings = {}
+        self.next_dir_fh = 1
+        self.dir_mutex = threading.Lock()
+        self.db.addChangeListener(self.invalidate)
+        if mountpoint is not None:
+            # mounts and serves requests until unmounted
+            super().__init__(mountpoint)
+
+    def local_path(self, path):
+        return os.path.join(self.rootdir, path.lstrip("/"))
+
+    def entry(self, path, attrs):
+        ino = self.inodes.remember(path)
+        attrs["st_ino"] = ino
+        return {
+            "ino": ino,
+            "generation": 0,
+            "attr": attrs,
+            "attr_timeout": self.attr_timeout,
+            "entry_timeout": self.entry_timeout,
+        }
+
+    def resolve(self, req, ino):
+        """
+        path of ino, replies ENOENT and returns None for inodes no longer known
+        """
+        try:
+            return self.inodes.path(ino)
+        except KeyError:
+            self.reply_err(req, errno.ENOENT)
+            return None
+
+    def invalidate(self, changes):
+        """
+        drop what the kernel caches for the (old path, new path) pairs changed remotely
+        """
+        for old, new in changes:
+            if old is None and new is None:
+                # everything was relisted, anything the kernel knows may be stale
+                for ino in list(self.inodes.paths):
+                    self.notify_inode(ino)
+                continue
+            if old is not None and old != new:
+                # moved away or deleted, the old name must be looked up again
+                ino = self.inodes.find(old)
+                self.notify_entry(old)
+                if new is None:
+                    self.inodes.discard(old)
+                else:
+                    self.inodes.rename(old, new)
+                if ino is not None:
+                    self.notify_inode(ino)
+                self.notify_inode(self.inodes.find(os.path.dirname(old)))
+            if new is not None:
+                if old != new:
+                    # the name may be cached as missing
+                    self.notify_entry(new)
+                    self.notify_inode(self.inodes.find(os.path.dirname(new)))
+                self.notify_inode(self.inodes.find(new))
+
+    def notify_inode(self, ino):
+        if ino is not None and self.chan is not None:
+            self.notify_inval_inode(ino)
+
+    def notify_entry(self, path):
+        parent, name = os.path.split(path)
+        parent_ino = self.inodes.find(parent)
+        if parent_ino is not None and self.chan is not None:
+            self.notify_inval_entry(parent_ino, name)
+
+    def lookup(self, req, parent, name):
+        try:
+            path = self.inodes.child(parent, name)
+            attrs = self.db.getattr(path)
+        except KeyError:
+            return self.reply_err(req, errno.ENOENT)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                return self.reply_err(req, e.errno or errno.EIO)
+            # inode 0 is a negative entry the kernel remembers for entry_timeout
+            return self.reply_entry(
+                req,
+                {"ino": 0, "attr": {}, "attr_timeout": 0, "entry_timeout": self.entry_timeout},
+            )
+        self.reply_entry(req, self.entry(path, attrs))
+
+    def forget(self, req, ino, nlookup):
+        self.inodes.forget(ino, nlookup)
+        self.reply_none(req)
+
+    def getattr(self, req, ino, fi):
+        path = self.resolve(req, ino)
+        if path is None:
+            return
+        try:
+            attrs = self.db.getattr(path)
+        except OSError as e:
+            return self.reply_err(req, e.errno or errno.EIO)
+        attrs["st_ino"] = ino
+        self.reply_attr(req, attrs, self.attr_timeout)
+
+    def setattr(self, req, ino, attr, to_set, fi):
+        path = self.resolve(req, ino)
+        if path is None:
+            return
+        local_path = self.local_path(path)
+        try:
+            if "st_size" in to_set:
+                os.truncate(local_path, attr["st_size"])
+                self.db.write(path, attr["st_size"])
+            if "st_mode" in to_set:
+                os.chmod(local_path, attr["st_mode"])
+            if "st_uid" in to_set or "st_gid" in to_set:
+                uid = attr["st_uid"] if "st_uid" in to_set else -1
+                gid = attr["st_gid"] if "st_gid" in to_set else -1
+                os.chown(local_path, uid, gid)
+            if "st_atime" in to_set or "st_mtime" in to_set:
+                os.utime(local_path, (attr["st_atime"], attr["st_mtime"]))
+            self.db.invalidateAttr(path)
+            attrs = self.db.getattr(path)
+        except OSError as e:
+            return self.reply_err(req, e.errno or errno.EIO)
+        attrs["st_ino"] = ino
+        self.reply_attr(req, attrs, self.attr_timeout)
+
+    def opendir(self, req, ino, fi):
+        path = self.resolve(req, ino)
+        if path is None:
+            return
+        try:
+            names = self.db.readdir(path)
+        except OSError as e:
+            return self.reply_err(req, e.errno or errno.EIO)
+        entries = []
+        for entry in names:
+            if entry == ".":
+                entries.append((entry, {"st_ino": ino, "st_mode": S_IFDIR}))
+                continue
+            if entry == "..":
+                # the root is its own parent, other parents are held like the children
+                parent = self.inodes.remember(os.path.dirname(path))
+                entries.append((entry, {"st_ino": parent, "st_mode": S_IFDIR}))
+                continue
+            name, attrs, _ = entry
+            child = path + name if path == "/" else path + "/" + name
+            # attributes of entries whose cache file is missing carry no mode
+            mode = S_IFMT(attrs.get("st_mode", 0)) if attrs else 0
+            # the listing holds a reference until releasedir, the kernel never forgets these
+            entries.append((name, {"st_ino": self.inodes.remember(child), "st_mode": mode}))
+        with self.dir_mutex:
+            fh = self.next_dir_fh
+            self.next_dir_fh += 1
+            self.listings[fh] = entries
+        fi["fh"] = fh
+        self.reply_open(req, fi)
+
+    def readdir(self, req, ino, size, off, fi):
+        entries = self.listings.get(fi["fh"])
+        if entries is None:
+            return self.reply_err(req, errno.EBADF)
+        self.reply_readdir(req, size, off, entries)
+
+    def releasedir(self, req, ino, fi):
+        with self.dir_mutex:
+            entries = self.listings.pop(fi["fh"], None)
+        for name, attrs in entries or ():
+            if name != ".":
+                self.inodes.forget(attrs["st_ino"], 1)
+        self.reply_err(req, 0)
+
+    def open(self, req, ino, fi):
+        path = self.resolve(req, ino)
+        if path is None:
+            return
+        logger.info(f"OPEN CALLED, path: {path}")
+        fh = self.db.open_file(path, self.local_path(path), fi["flags"])
+        if fh == -1:
+            return self.reply_err(req, errno.ENOENT)
+        fi["fh"] = fh
+        # remote changes invalidate the pages, local writes keep them current
+        fi["keep_cache"] = int(self.keep_cache)
+        self.reply_open(req, fi)
+
+    def read(self, req, ino, size, off, fi):
+        try:
+            data = os.pread(fi["fh"], size, off)
+        except OSError as e:
+            return self.reply_err(req, e.errno)
+        self.reply_buf(req, data)
+
+    def write(self, req, ino, buf, off, fi):
+        path = self.resolve(req, ino)
+        if path is None:
+            return
+        try:
+            ret = os.pwrite(fi["fh"], buf, off)
+        except OSError as e:
+            return self.reply_err(req, e.errno)
+        if self.dirty.mark(fi["fh"], path, off + ret):
+            self.db.invalidateAttr(path)
+        self.reply_write(req, ret)
+
+    def flush(self, req, ino, fi):
+        self.schedule_upload(fi["fh"])
+        self.reply_err(req, 0)
+
+    def fsync(self, req, ino, datasync, fi):
+        try:
+            if datasync:
+                os.fdatasync(fi["fh"])
+            else:
+                os.fsync(fi["fh"])
+        except OSError as e:
+            return self.reply_err(req, e.errno)
+        self.schedule_upload(fi["fh"])
+        self.reply_err(req, 0)
+
+    def release(self, req, ino, fi):
+        try:
+            self.schedule_upload(fi["fh"])
+        finally:
+            os.close(fi["fh"])
+        self.reply_err(req, 0)
+
+    def schedule_upload(self, fh):
+        # one upload task per flushed handle instead of one per write
+        state = self.dirty.pop(fh)
+        if state is None:
+            return
+        path, _, mtime = state
+        # the high-water mark misses writes inside a longer file and truncates
+        self.db.write(path, os.fstat(fh).st_size, mtime)
+
+    def create(self, req, parent, name, mode, fi):
+        try:
+            path = self.inodes.child(parent, name)
+        except KeyError:
+            return self.reply_err(req, errno.ENOENT)
+        logger.info(f"CREATE CALLED, path: {path}")
+        fh = self.db.createFile(path, mode)
+        if fh == -1:
+            return self.reply_err(req, errno.ENOENT)
+        try:
+            attrs = self.db.getattr(path)
+        except OSError as e:
+            os.close(fh)
+            return self.reply_err(req, e.errno or errno.EIO)
+        fi["fh"] = fh
+        self.reply_create(req, self.entry(path, attrs), fi)
+
+    def mkdir(self, req, parent, name, mode):
+        try:
+            path = self.inodes.child(parent, name)
+        except KeyError:
+            return self.reply_err(req, errno.ENOENT)
+        logger.info(f"MKDIR CALLED, path: {path}")
+        if self.db.createFolder(path.lstrip("/"), mode) == -1:
+            return self.reply_err(req, errno.ENOENT)
+        try:
+            attrs = self.db.getattr(path)
+        except OSError as e:
+            return self.reply_err(req, e.errno or errno.EIO)
+        self.reply_entry(req, self.entry(path, attrs))
+
+    def unlink(self, req, parent, name):
+        try:
+            path = self.inodes.child(parent, name)
+        except KeyError:
+            return self.reply_err(req, errno.ENOENT)
+        logger.info(f"UNLINK CALLED, path: {path}")
+        if self.db.delete(path.lstrip("/")) == -1:
+            return self.reply_err(req, errno.ENOENT)
+        self.inodes.discard(path)
+        self.reply_err(req, 0)
+
+    rmdir = unlink
+
+    def rename(self, req, parent, name, newparent, newname):
+        try:
+            old = self.inodes.child(parent, name)
+            new = self.inodes.child(newparent, newname)
+        except KeyError:
+            return self.reply_err(req, errno.ENOENT)
+        logger.info(f"RENAME CALLED, path: {old} to {new}")
+        if self.db.move(old.lstrip("/"), new.lstrip("/")) == -1:
+            return self.reply_err(req, errno.ENOENT)
+        self.inodes.rename(old, new)
+        self.reply_err(req, 0)
@@ -610,6 +610,15 @@ def fuse_exit():
     _libfuse.fuse_exit(fuse_ptr)
 
 
+def buffer_view(buf, size):
+    '''
+    Writable memoryview over size bytes of a C buffer. It is only valid for
+    the duration of the callback that received the buffer.
+    '''
+    return memoryview(
+        ctypes.cast(buf, ctypes.POINTER(ctypes.c_ubyte * size)).contents)
+
+
 class FuseOSError(OSError):
     def __init__(self, errno):
         super(FuseOSError, self).__init__(errno, os.strerror(errno))
@@ -653,6 +662,10 @@ class FUSE(object):
                 'requirements to <4.',
                 DeprecationWarning)
 
+        # with use_buffers, write gets a memoryview over the kernel buffer and
+        # read is served by readinto() filling the kernel buffer in place
+        self.use_buffers = getattr(operations, 'use_buffers', False)
+
         args = ['fuse']
 
         args.extend(flag for arg, flag in self.OPTIONS
@@ -842,6 +855,16 @@ class FUSE(object):
         else:
           fh = fip.contents.fh
 
+        if self.use_buffers:
+            if not size:
+                return 0
+            retsize = self.operations('readinto',
+                                      self._decode_optional_path(path),
+                                      buffer_view(buf, size), offset, fh)
+            assert retsize <= size, \
+                'actual amount read %d greater than expected %d' % (retsize, size)
+            return retsize
+
         ret = self.operations('read', self._decode_optional_path(path), size,
                                       offset, fh)
 
@@ -856,7 +879,10 @@ class FUSE(object):
         return retsize
 
     def write(self, path, buf, size, offset, fip):
-        data = ctypes.string_at(buf, size)
+        if self.use_buffers:
+            data = buffer_view(buf, size) if size else b''
+        else:
+            data = ctypes.string_at(buf, size)
 
         if self.raw_fi:
             fh = fip.contents
@@ -1181,6 +1207,17 @@ class Operations(object):
 
         raise FuseOSError(errno.EIO)
 
+    def readinto(self, path, buf, offset, fh):
+        '''
+        Fills the writable buffer buf with data at offset and returns the
+        number of bytes read. Only used when the operations class sets
+        use_buffers, in which case write also receives a memoryview.
+        '''
+
+        data = self.read(path, len(buf), offset, fh)
+        buf[:len(data)] = data
+        return len(data)
+
     def readdir(self, path, fh):
         '''
         Can return either a list of names, or a list of (name, attrs, offset)
@@ -1245,6 +1282,9 @@ class LoggingMixIn:
     log = logging.getLogger('fuse.log-mixin')
 
     def __call__(self, op, path, *args):
+        # repr() of read/write payloads copies them, only pay for it when logging
+        if not self.log.isEnabledFor(logging.DEBUG):
+            return getattr(self, op)(path, *args)
         self.log.debug('-> %s %s %s', op, path, repr(args))
         ret = '[Unhandled Exception]'
         try:
@@ -76,6 +76,8 @@ class LibFUSE(ctypes.CDLL):
             fuse_req_t, ctypes.c_void_p, ctypes.c_double)
         self.fuse_reply_entry.argtypes = (fuse_req_t, ctypes.c_void_p)
         self.fuse_reply_open.argtypes = (fuse_req_t, ctypes.c_void_p)
+        self.fuse_reply_create.argtypes = (
+            fuse_req_t, ctypes.c_void_p, ctypes.c_void_p)
         self.fuse_reply_buf.argtypes = (
             fuse_req_t, ctypes.c_char_p, ctypes.c_size_t)
         self.fuse_reply_none.argtypes = (fuse_req_t,)
@@ -83,6 +85,11 @@ class LibFUSE(ctypes.CDLL):
         self.fuse_reply_readlink.argtypes = (
             fuse_req_t, ctypes.c_char_p)
 
+        self.fuse_lowlevel_notify_inval_inode.argtypes = (
+            ctypes.c_void_p, fuse_ino_t, c_off_t, c_off_t)
+        self.fuse_lowlevel_notify_inval_entry.argtypes = (
+            ctypes.c_void_p, fuse_ino_t, ctypes.c_char_p, ctypes.c_size_t)
+
         self.fuse_add_direntry.argtypes = (
             ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
             ctypes.c_char_p, c_stat_p, c_off_t)
@@ -453,7 +460,7 @@ def dict_to_stat(d, use_ns=False):
             val = d[key]
 
             if use_ns:
-                sec, ns = divmod(int(val), 10 ** 9)
+                sec, nsec = divmod(int(val), 10 ** 9)
             else:
                 sec = int(val)
                 nsec = int((val - sec) * 1E9)
@@ -466,6 +473,8 @@ def setattr_mask_to_list(mask):
 
 class FUSELL(object):
     use_ns = False
+    # the mounted channel, needed by the notify methods
+    chan = None
 
     def __init__(self, mountpoint, encoding='utf-8'):
         if not self.use_ns:
@@ -493,6 +502,7 @@ class FUSELL(object):
 
         chan = self.libfuse.fuse_mount(mountpoint.encode(encoding), argv)
         assert chan
+        self.chan = chan
 
         session = self.libfuse.fuse_lowlevel_new(
             argv, ctypes.byref(fuse_ops), ctypes.sizeof(fuse_ops), None)
@@ -519,6 +529,7 @@ class FUSELL(object):
         except ValueError:
             pass
 
+        self.chan = None
         self.libfuse.fuse_session_remove_chan(chan)
         self.libfuse.fuse_session_destroy(session)
         self.libfuse.fuse_unmount(mountpoint.encode(encoding), chan)
@@ -530,12 +541,16 @@ class FUSELL(object):
         self.libfuse.fuse_reply_none(req)
 
     def reply_entry(self, req, entry):
-        entry['attr'] = c_stat(**entry['attr'])
+        entry['attr'] = dict_to_stat(entry['attr'], use_ns=self.use_ns)
         e = fuse_entry_param(**entry)
         self.libfuse.fuse_reply_entry(req, ctypes.byref(e))
 
-    def reply_create(self, req, *args):
-        pass    # XXX
+    def reply_create(self, req, entry, fi):
+        entry['attr'] = dict_to_stat(entry['attr'], use_ns=self.use_ns)
+        e = fuse_entry_param(**entry)
+        f = fuse_file_info(**fi)
+        return self.libfuse.fuse_reply_create(
+            req, ctypes.byref(e), ctypes.byref(f))
 
     def reply_attr(self, req, attr, attr_timeout):
         st = dict_to_stat(attr, use_ns=self.use_ns)
@@ -570,7 +585,7 @@ class FUSELL(object):
         for name, attr, entsize in sized_entries:
             entbuf = ctypes.cast(
                 ctypes.addressof(buf) + next, ctypes.c_char_p)
-            st = c_stat(**attr)
+            st = dict_to_stat(attr, use_ns=self.use_ns)
             next += entsize
             self.libfuse.fuse_add_direntry(
                 req, entbuf, entsize, name, ctypes.byref(st), next)
@@ -583,6 +598,20 @@ class FUSELL(object):
             return self.libfuse.fuse_reply_buf(req, None, 0)
 
 
+    # Kernel cache invalidation, may be called from any thread but not
+    # from within a request handler.
+
+    def notify_inval_inode(self, ino, off=0, length=0):
+        """Drop the cached attributes and data of an inode, all data for length 0"""
+        return self.libfuse.fuse_lowlevel_notify_inval_inode(
+            self.chan, ino, off, length)
+
+    def notify_inval_entry(self, parent, name):
+        """Drop the cached lookup of name in the directory parent"""
+        name = name.encode(self.encoding)
+        return self.libfuse.fuse_lowlevel_notify_inval_entry(
+            self.chan, parent, name, len(name))
+
     # If you override the following methods you should reply directly
     # with the self.libfuse.fuse_reply_* methods.
 
@@ -623,7 +652,7 @@ class FUSELL(object):
         self.open(req, ino, struct_to_dict(fi))
 
     def fuse_read(self, req, ino, size, off, fi):
-        self.read(req, ino, size, off, fi)
+        self.read(req, ino, size, off, struct_to_dict(fi))
 
     def fuse_write(self, req, ino, buf, size, off, fi):
         buf_str = ctypes.string_at(buf, size)
@@ -637,7 +666,7 @@ class FUSELL(object):
         self.release(req, ino, struct_to_dict(fi))
 
     def fuse_fsync(self, req, ino, datasync, fi):
-        self.fsyncdir(req, ino, datasync, struct_to_dict(fi))
+        self.fsync(req, ino, datasync, struct_to_dict(fi))
 
     def fuse_opendir(self, req, ino, fi):
         self.opendir(req, ino, struct_to_dict(fi))
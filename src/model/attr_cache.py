@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+from src.model.metadata import parent_path
+
+
+class AttrCache:
+    """
+    Short lived cache of getattr results keyed by path.
+
+    Entries expire after `ttl` seconds; everything that changes a path is expected to
+    call invalidate() so the TTL only bounds how stale an unnoticed change can get.
+    The cache holds at most `maxsize` paths and drops the least recently used ones.
+    Every invalidation bumps `generation`; attributes computed before an invalidation
+    are not cached.
+
+    Attributes:
+        hits (int): lookups answered from the cache.
+        misses (int): lookups that had to be computed.
+        generation (int): number of invalidations so far.
+    """
+
+    def __init__(self, ttl=1.0, maxsize=65536) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.mutex = threading.Lock()
+
+    def get(self, path):
+        """
+        cached attributes of path, None when missing or expired
+        """
+        with self.mutex:
+            cached = self.entries.get(path)
+            if cached is None or cached[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return dict(cached[1])
+
+    def put(self, path, attrs, generation=None):
+        """
+        cache attributes of path, unless the cache was invalidated since generation was read
+        """
+        with self.mutex:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[path] = (time.monotonic() + self.ttl, attrs)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, path, subtree=False):
+        """
+        forget path, and everything below it when subtree is set
+        """
+        with self.mutex:
+            self.generation += 1
+            self.entries.pop(path, None)
+            if subtree:
+                prefix = path.rstrip("/") + "/"
+                for key in [k for k in self.entries if k.startswith(prefix)]:
+                    del self.entries[key]
+
+    def clear(self):
+        with self.mutex:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+class NegativeCache:
+    """
+    Bounded set of paths getattr found missing, so repeated probes fail at once.
+
+    Paths are indexed by their parent directory: anything that may add a child to a
+    directory calls invalidate_dir() and every remembered miss in it is forgotten.
+    Every invalidation bumps `generation`; a miss computed before an invalidation is
+    not remembered, and misses expire after `ttl` seconds in case one slips through.
+
+    Attributes:
+        hits (int): lookups answered with ENOENT from the cache.
+        generation (int): number of invalidations so far.
+    """
+
+    def __init__(self, ttl=5.0, maxsize=16384) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # path -> (parent, expiry)
+        self.entries = OrderedDict()
+        self.by_parent = {}
+        self.hits = 0
+        self.generation = 0
+        self.mutex = threading.Lock()
+
+    def __contains__(self, path):
+        with self.mutex:
+            cached = self.entries.get(path)
+            if cached is None:
+                return False
+            if cached[1] < time.monotonic():
+                self._drop(path)
+                return False
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return True
+
+    def add(self, path, generation=None):
+        """
+        remember a miss, unless the cache was invalidated since generation was read
+        """
+        with self.mutex:
+            if generation is not None and generation != self.generation:
+                return
+            if path in self.entries:
+                self._drop(path)
+            parent = parent_path(path)
+            self.entries[path] = (parent, time.monotonic() + self.ttl)
+            self.by_parent.setdefault(parent, set()).add(path)
+            while len(self.entries) > self.maxsize:
+                self._drop(next(iter(self.entries)))
+
+    def _drop(self, path):
+        parent, _ = self.entries.pop(path)
+        siblings = self.by_parent[parent]
+        siblings.discard(path)
+        if not siblings:
+            del self.by_parent[parent]
+
+    def discard(self, path):
+        with self.mutex:
+            self.generation += 1
+            if path in self.entries:
+                self._drop(path)
+
+    def invalidate_dir(self, path, subtree=False):
+        """
+        forget the misses directly in the directory, or anywhere below it with subtree
+        """
+        with self.mutex:
+            self.generation += 1
+            if subtree:
+                prefix = path.rstrip("/") + "/"
+                stale = [p for p in self.entries if p.startswith(prefix)]
+            else:
+                stale = list(self.by_parent.get(path, ()))
+            for p in stale:
+                self._drop(p)
+
+    def clear(self):
+        with self.mutex:
+            self.generation += 1
+            self.entries.clear()
+            self.by_parent.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "size": len(self.entries)}
@@ -0,0 +1,77 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+
+class DownloadManager:
+    """
+    Downloads files in a small thread pool, with at most one download per path in flight.
+
+    download() returns a future; callers asking for a path that is already being
+    downloaded get the same future and wait for that transfer instead of starting
+    another one. Files are written next to their target and renamed into place, so a
+    partial download is never mistaken for a cached file.
+
+    Args:
+        interface (DropboxInterface): used for the transfers.
+        workers (int): number of downloads running at the same time.
+
+    Attributes:
+        started (int): downloads started.
+        shared (int): requests answered with a download already in flight.
+    """
+
+    def __init__(self, interface, workers=4) -> None:
+        self.dbx = interface
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download")
+        self.inflight = {}
+        self.started = 0
+        self.shared = 0
+        self.mutex = threading.Lock()
+
+    def download(self, path, local_path, on_done=None):
+        """
+        future of the download of path to local_path; on_done runs in the worker once
+        the file is in place, before the future resolves
+        """
+        with self.mutex:
+            future = self.inflight.get(path)
+            if future is not None:
+                self.shared += 1
+                return future
+            future = self.executor.submit(self._download, path, local_path, on_done)
+            self.inflight[path] = future
+            self.started += 1
+        future.add_done_callback(lambda f: self._finish(path, f))
+        return future
+
+    def _download(self, path, local_path, on_done):
+        logger.info(f"downloading {path}")
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        partial = f"{local_path}.part"
+        try:
+            self.dbx.download(path, partial)
+            os.replace(partial, local_path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        if on_done is not None:
+            on_done()
+        logger.info(f"finish downloading {path}")
+
+    def _finish(self, path, future):
+        with self.mutex:
+            if self.inflight.get(path) is future:
+                del self.inflight[path]
+
+    def stop(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self.mutex:
+            return {
+                "started": self.started,
+                "shared": self.shared,
+                "inflight": len(self.inflight),
+            }
@@ -195,8 +195,8 @@ class DownloadingThread():
         ans = {}
         deleteList = []
         # get the list of files from dropbox
-        files, self.cursor = self.dbx.getUpdates(self.cursor)
-        for k,v in files.items():
+        files = self.dbx.getUpdates(self.cursor)
+        for v in files:
             if isinstance(v, dropbox.files.FileMetadata):
                 if not self.verifyFileResponse(v):
                     logger.error(f"Invalid file response from server: {v}")
@@ -206,6 +206,7 @@ class DownloadingThread():
                 pass
             elif isinstance(v, dropbox.files.DeletedMetadata):
                 deleteList.append(v.path_display)
+        self.cursor = files.cursor
         return {"download": ans, "delete" : deleteList}
 
     def verifyFileResponse(self, fileResponse:dropbox.files.FileMetadata) -> bool:
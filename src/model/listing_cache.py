@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+
+class DirectoryListingCache:
+    """
+    Tracks which directories have their complete remote listing in full_metadata.
+
+    Directories are kept in least recently used order together with the number of
+    entries their listing added. When a budget is set and the total goes over it,
+    pop_victim() hands out the coldest directory so its children can be dropped.
+
+    Attributes:
+        budget (int): maximum number of listed entries to keep, None for no limit.
+        entries (int): number of entries currently accounted to listed directories.
+        evictions (int): number of directories evicted so far.
+    """
+
+    def __init__(self, budget=None) -> None:
+        self.budget = budget
+        self.dirs = OrderedDict()
+        self.entries = 0
+        self.evictions = 0
+        self.mutex = threading.Lock()
+
+    def __contains__(self, path):
+        return path in self.dirs
+
+    def __len__(self):
+        return len(self.dirs)
+
+    def __iter__(self):
+        return iter(list(self.dirs))
+
+    def touch(self, path) -> bool:
+        """
+        mark the directory as recently used, returns whether it is listed
+        """
+        with self.mutex:
+            if path not in self.dirs:
+                return False
+            self.dirs.move_to_end(path)
+            return True
+
+    def add(self, path, count):
+        with self.mutex:
+            self.entries -= self.dirs.pop(path, 0)
+            self.dirs[path] = count
+            self.entries += count
+
+    def discard(self, path):
+        with self.mutex:
+            self.entries -= self.dirs.pop(path, 0)
+
+    def discard_all(self, paths):
+        with self.mutex:
+            for path in paths:
+                self.entries -= self.dirs.pop(path, 0)
+
+    def clear(self):
+        with self.mutex:
+            self.dirs.clear()
+            self.entries = 0
+
+    def pop_victim(self, keep="/"):
+        """
+        remove and return the coldest directory while over budget, None otherwise;
+        keep and its ancestors are never chosen since that would drop keep itself
+        """
+        with self.mutex:
+            if self.budget is None or self.entries <= self.budget:
+                return None
+            for path in self.dirs:
+                if path == keep or keep.startswith(path.rstrip("/") + "/"):
+                    continue
+                self.entries -= self.dirs.pop(path)
+                self.evictions += 1
+                return path
+            return None
@@ -1,77 +1,470 @@
+import posixpath
+import sys
 import uuid
+from collections.abc import Mapping
+from enum import Enum
+
+# id of the root directory node, the root never has an entry of its own
+ROOT_ID = "/"
+_EMPTY = {}
+
+
+def parent_path(path):
+    # parent directory of a metadata key, "/" for top-level entries
+    return posixpath.dirname(path) or "/"
+
+
+def split_path(path):
+    # "/a/b" -> ["a", "b"], the root is []
+    return [name for name in path.split("/") if name]
+
+
+class EntryType(str, Enum):
+    FILE = "file"
+    FOLDER = "folder"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class MetadataEntry:
+    """
+    Compact record for one file or folder.
+
+    Uses __slots__ instead of a per-entry dict, an EntryType enum for the type and
+    interned names, so large containers do not pay for six dict keys per entry.
+    Supports item access (entry["size"]) like the dicts it replaces.
+    """
+
+    __slots__ = ("name", "size", "type", "mtime", "uploaded", "path")
+
+    def __init__(self, name, size, type, mtime, uploaded, path) -> None:
+        self.name = sys.intern(name) if isinstance(name, str) else name
+        self.size = size
+        self.type = EntryType(type)
+        self.mtime = mtime
+        self.uploaded = uploaded
+        self.path = path
+
+    @classmethod
+    def from_dict(cls, value):
+        return cls(
+            value.get("name"),
+            value.get("size", 0),
+            value.get("type", EntryType.FILE),
+            value.get("mtime", 0),
+            value.get("uploaded", False),
+            value.get("path"),
+        )
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        if key == "name" and isinstance(value, str):
+            value = sys.intern(value)
+        elif key == "type":
+            value = EntryType(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        if isinstance(other, MetadataEntry):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()})"
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def copy(self):
+        return MetadataEntry(
+            self.name, self.size, self.type, self.mtime, self.uploaded, self.path
+        )
+
+
+class PathIndex(Mapping):
+    """
+    Read-only path -> id view of a MetadataContainer, paths are resolved on lookup.
+    """
+
+    def __init__(self, container) -> None:
+        self.container = container
+
+    def __getitem__(self, path):
+        id = self.container.lookup(path)
+        if id is None or id not in self.container.id_metadata:
+            raise KeyError(path)
+        return id
+
+    def __contains__(self, path):
+        return self.container.lookup(path) in self.container.id_metadata
+
+    def __iter__(self):
+        for path, id in self.container.walk(ROOT_ID, ""):
+            if id in self.container.id_metadata:
+                yield path
+
+    def __len__(self):
+        return len(self.container.id_metadata)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [
+            (path, id)
+            for path, id in self.container.walk(ROOT_ID, "")
+            if id in self.container.id_metadata
+        ]
 
 
 class MetadataContainer:
+    """
+    Hierarchical metadata: every node is linked to its parent id under its name, like
+    an inode in a directory, and full paths are derived when they are looked up.
+
+    Renaming a directory relinks a single node and its descendants follow untouched.
+    Directories that only exist as the parent of an entry are kept as placeholder nodes
+    without an entry. Derived directory paths are cached, the cache is invalidated by
+    bumping a generation counter whenever a directory moves.
+
+    Writers are serialized by the caller, readers take no lock: a directory's children
+    are copied before they are iterated so a concurrent insert cannot break a listing.
+    """
+
     def __init__(self) -> None:
-        self.path_to_id = {}
         self.id_metadata = {}
-        pass
+        # id -> (parent id, name) for every node, placeholders included
+        self.links = {}
+        # directory id -> {name: child id}
+        self.children = {}
+        # directory id -> (generation, path), valid while the generation matches
+        self.path_cache = {}
+        self.generation = 0
+        # ids changed or removed since the last drain_changes(), used by
+        # MetadataStore to persist only the rows that were touched
+        self.dirty_ids = set()
+        self.removed_ids = set()
+        self.path_to_id = PathIndex(self)
+
+    def __setstate__(self, state):
+        if "links" in state:
+            self.__dict__.update(state)
+            return
+        # containers pickled before the hierarchical layout are rebuilt from their paths
+        self.__init__()
+        for path, id in state["path_to_id"].items():
+            self.insert(path, state["id_metadata"][id], id)
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        # build a container from (id, parent id, name, entry or None) rows
+        metadata = cls()
+        for id, parent, name, entry in nodes:
+            metadata.links[id] = (parent, sys.intern(name))
+            metadata.children.setdefault(parent, {})[name] = id
+            if entry is not None:
+                metadata.id_metadata[id] = entry
+        for id, entry in metadata.id_metadata.items():
+            entry.path = metadata.path_of(id)
+        return metadata
+
+    def lookup(self, path):
+        # id of the node at path, placeholders included, None if there is none
+        node = ROOT_ID
+        for name in split_path(path):
+            node = self.children.get(node, _EMPTY).get(name)
+            if node is None:
+                return None
+        return node
+
+    def path_of(self, id):
+        # derive the full path of a node, None if it is not linked
+        if id == ROOT_ID:
+            return "/"
+        chain = []
+        node = id
+        prefix = ""
+        while node != ROOT_ID:
+            cached = self.path_cache.get(node)
+            if cached is not None and cached[0] == self.generation:
+                prefix = cached[1]
+                break
+            link = self.links.get(node)
+            if link is None:
+                return None
+            chain.append((node, link[1]))
+            node = link[0]
+        for node, name in reversed(chain):
+            prefix = f"{prefix}/{name}"
+            if node in self.children:
+                self.path_cache[node] = (self.generation, prefix)
+        return prefix
+
+    def walk(self, node, prefix):
+        # yield (path, id) for every node below node, prefix being the path of node
+        stack = [(node, prefix)]
+        while stack:
+            node, prefix = stack.pop()
+            for name, child in list(self.children.get(node, _EMPTY).items()):
+                path = f"{prefix}/{name}"
+                yield path, child
+                if child in self.children:
+                    stack.append((child, path))
+
+    def _link(self, id, parent, name):
+        self.links[id] = (parent, sys.intern(name))
+        self.children.setdefault(parent, {})[name] = id
+        self._touch(id)
+
+    def _unlink(self, id):
+        # detach id from its parent, placeholders left without children go as well
+        parent, name = self.links.pop(id)
+        siblings = self.children.get(parent)
+        if siblings is None or siblings.get(name) != id:
+            return
+        del siblings[name]
+        if siblings:
+            return
+        del self.children[parent]
+        if parent != ROOT_ID and parent not in self.id_metadata:
+            self._unlink(parent)
+            self.path_cache.pop(parent, None)
+            self._mark_removed(parent)
+
+    def _ensure_dir(self, names):
+        # id of the directory at names, linking placeholders for missing ones
+        node = ROOT_ID
+        for name in names:
+            child = self.children.get(node, _EMPTY).get(name)
+            if child is None:
+                child = uuid.uuid4()
+                self._link(child, node, name)
+            node = child
+        return node
+
+    def _absorb(self, old, new):
+        # new takes the place and the children of old
+        parent, name = self.links.pop(old)
+        self.links[new] = (parent, name)
+        self.children[parent][name] = new
+        self._touch(new)
+        kids = self.children.pop(old, None)
+        if kids:
+            target = self.children.setdefault(new, {})
+            for child_name, child in kids.items():
+                target[child_name] = child
+                self.links[child] = (new, child_name)
+                self._touch(child)
+        self.id_metadata.pop(old, None)
+        self.path_cache.pop(old, None)
+        self._mark_removed(old)
+
+    def _place(self, id, path):
+        # link id at path, replacing the node there; a linked id is moved with its subtree
+        moved = False
+        if id in self.links:
+            if self.lookup(path) == id:
+                return
+            self._unlink(id)
+            # a directory emptied since its path was cached still has a cache entry
+            moved = True
+        names = split_path(path)
+        parent = self._ensure_dir(names[:-1])
+        existing = self.children.get(parent, _EMPTY).get(names[-1])
+        if existing is not None:
+            self._absorb(existing, id)
+        else:
+            self._link(id, parent, names[-1])
+        if moved:
+            # the node's cached path and every one below it are stale now
+            self.generation += 1
+            self.path_cache.pop(id, None)
+
+    def _remove(self, id):
+        # drop the node of an entry that was just removed, unless it still has children
+        self.path_cache.pop(id, None)
+        if id in self.children:
+            self._touch(id)
+            return
+        self._unlink(id)
+        self._mark_removed(id)
+
+    @staticmethod
+    def _entry(value):
+        if isinstance(value, dict):
+            return MetadataEntry.from_dict(value)
+        if not isinstance(value, MetadataEntry):
+            raise TypeError(value)
+        return value
+
+    def _touch(self, id):
+        self.removed_ids.discard(id)
+        self.dirty_ids.add(id)
+
+    def _mark_removed(self, id):
+        self.dirty_ids.discard(id)
+        self.removed_ids.add(id)
+
+    def mark_dirty(self, path):
+        # record that the entry at path has to be written out again
+        id = self.lookup(path)
+        if id is not None and id != ROOT_ID:
+            self._touch(id)
+
+    def drain_changes(self):
+        # return (dirty, removed) ids since the last call and reset them
+        dirty, removed = self.dirty_ids, self.removed_ids
+        self.dirty_ids, self.removed_ids = set(), set()
+        return dirty, removed
+
+    def requeue_changes(self, dirty, removed):
+        # put back changes whose write failed, unless they were superseded meanwhile
+        for id in dirty:
+            if id not in self.removed_ids:
+                self.dirty_ids.add(id)
+        for id in removed:
+            if id not in self.dirty_ids:
+                self.removed_ids.add(id)
+
+    def children_of(self, path):
+        # direct children of the given directory path
+        node = self.lookup(path)
+        kids = self.children.get(node) if node is not None else None
+        if not kids:
+            return []
+        prefix = "" if node == ROOT_ID else path.rstrip("/")
+        return [f"{prefix}/{name}" for name, id in list(kids.items()) if id in self.id_metadata]
+
+    def descendants(self, path):
+        # every path below the given directory, in O(size of the subtree)
+        node = self.lookup(path)
+        if node is None:
+            return []
+        prefix = "" if node == ROOT_ID else path.rstrip("/")
+        return [p for p, id in self.walk(node, prefix) if id in self.id_metadata]
 
     def update_id(self, path, new_id):
         # update id of the given path
-        if self.path_to_id.get(path, None) is None:
-            raise KeyError(path)
         old_id = self.path_to_id[path]
-        self.path_to_id[path] = new_id
-        self.id_metadata[new_id] = self.id_metadata.pop(old_id)
+        if old_id == new_id:
+            return
+        entry = self.id_metadata[old_id]
+        self._absorb(old_id, new_id)
+        self.id_metadata[new_id] = entry
 
     def update_path(self, old_path, new_path):
-        # update path of the given id
-        # if self.id_metadata.get(id, None) is None:
-        #     raise KeyError(id)
-        if self.path_to_id.get(old_path, None) is None:
+        # move the node at old_path, its subtree follows without being touched
+        id = self.lookup(old_path)
+        if id is None or id == ROOT_ID:
             return
-        id = self.path_to_id[old_path]
-        self.path_to_id[new_path] = id
-        self.id_metadata[id]["path"] = new_path
-        del self.path_to_id[old_path]
+        self._place(id, new_path)
+        entry = self.id_metadata.get(id)
+        if entry is not None:
+            entry.path = new_path
+
+    def insert(self, path, value, id):
+        # set the entry at path under a known id, e.g. a dropbox id
+        value = self._entry(value)
+        self._place(id, path)
+        self.id_metadata[id] = value
+        self._touch(id)
 
     def __getitem__(self, path):
-        if self.path_to_id.get(path, None) is None:
+        entry = self.id_metadata.get(self.lookup(path))
+        if entry is None:
             raise KeyError(path)
-        return self.id_metadata[self.path_to_id[path]]
+        entry.path = path
+        return entry
 
     def __setitem__(self, path, value):
-        if not isinstance(value, dict):
-            raise TypeError(value)
-        tmp_id = uuid.uuid4()
-        if self.path_to_id.get(path, None) is None:
-            self.path_to_id[path] = tmp_id
-        else:
-            tmp_id = self.path_to_id[path]
-        self.id_metadata[tmp_id] = value
+        value = self._entry(value)
+        id = self.lookup(path)
+        if id is None or id == ROOT_ID:
+            id = uuid.uuid4()
+            self._place(id, path)
+        self.id_metadata[id] = value
+        self._touch(id)
 
     def __delitem__(self, path):
-        id = self.path_to_id[path]
-        del self.path_to_id[path]
-        del self.id_metadata[id]
+        if self.pop(path) is None:
+            raise KeyError(path)
 
     def __contains__(self, path):
-        return path in self.path_to_id
+        return self.lookup(path) in self.id_metadata
 
     def __len__(self):
-        return len(self.path_to_id)
+        return len(self.id_metadata)
 
     def __repr__(self) -> str:
-        return f"{self.__class__.__name__}({self.path_to_id}, {self.id_metadata})"
+        return f"{self.__class__.__name__}({dict(self.path_to_id.items())}, {self.id_metadata})"
 
     def __str__(self) -> str:
-        return f"{self.path_to_id}, {self.id_metadata}"
+        return f"{dict(self.path_to_id.items())}, {self.id_metadata}"
 
     def items(self):
-        return [(path, self.id_metadata[id]) for path, id in self.path_to_id.items()]
+        items = []
+        for path, id in self.path_to_id.items():
+            entry = self.id_metadata[id]
+            entry.path = path
+            items.append((path, entry))
+        return items
 
     def pop(self, path):
-        if self.path_to_id.get(path, None) is None:
+        id = self.lookup(path)
+        if id is None or id not in self.id_metadata:
             return None
-        id = self.path_to_id[path]
-        del self.path_to_id[path]
-        return self.id_metadata.pop(id)
+        entry = self.id_metadata.pop(id)
+        self._remove(id)
+        return entry
+
+    def pop_subtree(self, path):
+        # remove path and everything below it, returns the removed paths
+        node = self.lookup(path)
+        if node is None:
+            return []
+        prefix = "" if node == ROOT_ID else path.rstrip("/")
+        nodes = list(self.walk(node, prefix))
+        if node != ROOT_ID:
+            nodes.append((prefix, node))
+        removed = [p for p, id in nodes if id in self.id_metadata]
+        if node == ROOT_ID:
+            self.children.pop(ROOT_ID, None)
+        else:
+            self._unlink(node)
+        for _, id in nodes:
+            self.links.pop(id, None)
+            self.children.pop(id, None)
+            self.path_cache.pop(id, None)
+            self.id_metadata.pop(id, None)
+            self._mark_removed(id)
+        return removed
 
     def get(self, path, default=None):
-        if self.path_to_id.get(path, None) is None:
+        entry = self.id_metadata.get(self.lookup(path))
+        if entry is None:
             return default
-        return self.id_metadata[self.path_to_id[path]]
+        entry.path = path
+        return entry
 
     def keys(self):
         return self.path_to_id.keys()
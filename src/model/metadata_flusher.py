@@ -0,0 +1,97 @@
+import threading
+import time
+from loguru import logger
+
+
+class MetadataFlusher:
+    """
+    Single long-lived writer that coalesces metadata flush requests.
+
+    Every request() bumps a dirty generation counter. The writer thread waits until
+    no new request arrived for `debounce` seconds (or `maxDelay` seconds passed since
+    the first pending one) and then calls `flush` once for the whole burst.
+
+    Attributes:
+        requested (int): number of flushes requested.
+        performed (int): number of flushes actually written.
+    """
+
+    def __init__(self, flush, debounce=0.5, maxDelay=5) -> None:
+        self.flush = flush
+        self.debounce = debounce
+        self.maxDelay = maxDelay
+        self.cond = threading.Condition()
+        self.writeLock = threading.Lock()
+        self.generation = 0
+        self.flushedGeneration = 0
+        self.requested = 0
+        self.performed = 0
+        self._stop = False
+        self.thread = threading.Thread(target=self, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def __call__(self):
+        """
+        flush loop
+        """
+        while True:
+            with self.cond:
+                while not self._stop and self.generation == self.flushedGeneration:
+                    self.cond.wait()
+                if self._stop:
+                    return
+                first = time.time()
+                # debounce: keep waiting while requests are still coming in
+                while not self._stop:
+                    seen = self.generation
+                    remaining = self.maxDelay - (time.time() - first)
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(min(self.debounce, remaining))
+                    if self.generation == seen:
+                        break
+            self.flush_now()
+
+    def request(self):
+        """
+        mark the metadata dirty, the write happens later on the flusher thread
+        """
+        with self.cond:
+            self.generation += 1
+            self.requested += 1
+            self.cond.notify()
+
+    def flush_now(self):
+        """
+        write pending changes on the calling thread, must not hold the model lock
+        """
+        with self.writeLock:
+            with self.cond:
+                target = self.generation
+            if target == self.flushedGeneration:
+                return
+            try:
+                self.flush()
+                self.performed += 1
+            except Exception as e:
+                logger.error(f"Error flushing metadata: {e}")
+                return
+            with self.cond:
+                self.flushedGeneration = max(self.flushedGeneration, target)
+                self.cond.notify_all()
+
+    def stop(self):
+        """
+        flush what is pending and stop the writer thread
+        """
+        self.flush_now()
+        with self.cond:
+            self._stop = True
+            self.cond.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def stats(self) -> dict:
+        return {"requested": self.requested, "performed": self.performed}
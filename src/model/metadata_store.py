@@ -0,0 +1,258 @@
+# sqlite persistence for the metadata container
+import os
+import pickle
+import sqlite3
+import threading
+import uuid
+from loguru import logger
+from src.model.metadata import MetadataContainer, MetadataEntry
+
+
+# local_metadata lives in "metadata", the last full_metadata snapshot in "remote_metadata"
+# and the cursor it corresponds to in "state"; rows are nodes linked to their parent id,
+# placeholder directories without an entry have a NULL type
+TABLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    type TEXT,
+    mtime REAL,
+    uploaded INTEGER
+)
+"""
+PARENT_INDEX = "CREATE INDEX IF NOT EXISTS {table}_parent ON {table} (parent)"
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+)
+"""
+LOCAL_TABLE = "metadata"
+REMOTE_TABLE = "remote_metadata"
+
+
+def encode_id(id):
+    return str(id)
+
+
+def decode_id(value):
+    # dropbox ids look like "id:..."; everything else is a local uuid placeholder
+    if value.startswith("id:"):
+        return value
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return value
+
+
+class MetadataStore:
+    """
+    Row-level persistence of a MetadataContainer in an SQLite database running in WAL mode.
+
+    Only the ids reported by MetadataContainer.drain_changes() are written on each save,
+    so a single mutation costs a single row update instead of rewriting the whole container.
+    Rows store the parent id and name rather than the full path, so renaming a directory
+    rewrites one row however large the subtree below it is.
+    The remote snapshot and its list_folder cursor are saved in the same transaction so a
+    restart can continue from the cursor instead of listing the whole account again.
+
+    Args:
+        db_path (str): location of the sqlite database.
+        legacy_pickle_path (str): metadata.pkl written by older versions, imported once
+            when the database is still empty.
+    """
+
+    def __init__(self, db_path, legacy_pickle_path=None) -> None:
+        self.db_path = db_path
+        self.legacy_pickle_path = legacy_pickle_path
+        self._conn = None
+        self.mutex = threading.Lock()
+
+    @property
+    def conn(self):
+        """
+        open the database on first use
+        """
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+            for table in (LOCAL_TABLE, REMOTE_TABLE):
+                self._upgrade_table(table)
+                conn.execute(TABLE_SCHEMA.format(table=table))
+                conn.execute(PARENT_INDEX.format(table=table))
+            conn.execute(STATE_SCHEMA)
+            conn.commit()
+        return self._conn
+
+    def _upgrade_table(self, table):
+        """
+        rewrite a table from the old path-keyed schema into parent/name rows
+        """
+        columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+        if "path" not in columns:
+            return
+        metadata = MetadataContainer()
+        rows = self._conn.execute(
+            f"SELECT id, path, name, size, type, mtime, uploaded FROM {table}"
+        )
+        for id, path, name, size, type, mtime, uploaded in rows:
+            metadata.insert(
+                path,
+                MetadataEntry(name, size, type, mtime, bool(uploaded), path),
+                decode_id(id),
+            )
+        logger.info(f"upgrading {len(metadata)} rows of {table} to parent/name rows")
+        with self._conn:
+            self._conn.execute(f"DROP TABLE {table}")
+            self._conn.execute(TABLE_SCHEMA.format(table=table))
+            self._write_rows(
+                table, [self._row(metadata, id) for id in metadata.links], []
+            )
+
+    def close(self):
+        with self.mutex:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def load(self) -> MetadataContainer:
+        """
+        build a container from the database, importing the legacy pickle the first time
+        """
+        with self.mutex:
+            self.migrate()
+            return self._load_table(LOCAL_TABLE)
+
+    def load_snapshot(self):
+        """
+        return (full_metadata, cursor) saved by save_snapshot, or (None, None)
+        """
+        with self.mutex:
+            row = self.conn.execute(
+                "SELECT value FROM state WHERE key = 'cursor'"
+            ).fetchone()
+            if row is None:
+                return None, None
+            return self._load_table(REMOTE_TABLE), row[0]
+
+    def save_snapshot(self, metadata: MetadataContainer, cursor, replace=False):
+        """
+        write the changed rows of the remote snapshot together with its cursor,
+        replace drops the previous snapshot first (after a full listing)
+        """
+        with self.mutex:
+            if replace:
+                metadata.drain_changes()
+                rows = [self._row(metadata, id) for id in metadata.links]
+                removed = []
+            else:
+                rows, removed = self.collect(metadata)
+            try:
+                with self.conn:
+                    if replace:
+                        self.conn.execute(f"DELETE FROM {REMOTE_TABLE}")
+                    self._write_rows(REMOTE_TABLE, rows, removed)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO state VALUES ('cursor', ?)", (cursor,)
+                    )
+            except Exception:
+                self.requeue(metadata, (rows, removed))
+                raise
+
+    def _load_table(self, table):
+        rows = self.conn.execute(
+            f"SELECT id, parent, name, size, type, mtime, uploaded FROM {table}"
+        )
+        nodes = []
+        for id, parent, name, size, type, mtime, uploaded in rows:
+            entry = None
+            if type is not None:
+                entry = MetadataEntry(name, size, type, mtime, bool(uploaded), None)
+            nodes.append((decode_id(id), decode_id(parent), name, entry))
+        return MetadataContainer.from_nodes(nodes)
+
+    def migrate(self):
+        """
+        import metadata.pkl into an empty database and move the pickle out of the way
+        """
+        if self.legacy_pickle_path is None or not os.path.exists(
+            self.legacy_pickle_path
+        ):
+            return
+        if (
+            self.conn.execute(f"SELECT 1 FROM {LOCAL_TABLE} LIMIT 1").fetchone()
+            is not None
+        ):
+            return
+        try:
+            with open(self.legacy_pickle_path, "rb") as f:
+                legacy = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Error loading legacy metadata from file: {e}")
+            return
+        logger.info(f"migrating {len(legacy)} entries from {self.legacy_pickle_path}")
+        rows = [self._row(legacy, id) for id in legacy.links]
+        with self.conn:
+            self._write_rows(LOCAL_TABLE, rows, [])
+        os.replace(self.legacy_pickle_path, self.legacy_pickle_path + ".migrated")
+
+    def collect(self, metadata: MetadataContainer):
+        """
+        snapshot the rows changed since the last collect, call with the model lock held
+        """
+        dirty, removed = metadata.drain_changes()
+        rows = [self._row(metadata, id) for id in dirty if id in metadata.links]
+        return rows, list(removed)
+
+    @staticmethod
+    def requeue(metadata: MetadataContainer, changes):
+        """
+        hand the changes of a failed write back to the container
+        """
+        rows, removed = changes
+        metadata.requeue_changes([decode_id(row[0]) for row in rows], removed)
+
+    def write(self, changes):
+        """
+        apply the rows returned by collect() in one transaction
+        """
+        rows, removed = changes
+        if not rows and not removed:
+            return
+        with self.conn:
+            self._write_rows(LOCAL_TABLE, rows, removed)
+
+    def _write_rows(self, table, rows, removed):
+        self.conn.executemany(
+            f"DELETE FROM {table} WHERE id = ?", [(encode_id(id),) for id in removed]
+        )
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def save(self, metadata: MetadataContainer):
+        with self.mutex:
+            self.write(self.collect(metadata))
+
+    @staticmethod
+    def _row(metadata, id):
+        parent, name = metadata.links[id]
+        v = metadata.id_metadata.get(id)
+        if v is None:
+            # placeholder directory, only there to link its children
+            return (encode_id(id), encode_id(parent), name, None, None, None, 0)
+        return (
+            encode_id(id),
+            encode_id(parent),
+            name,
+            v.get("size"),
+            str(v.get("type")),
+            v.get("mtime"),
+            int(bool(v.get("uploaded"))),
+        )
@@ -14,13 +14,16 @@ import dropbox
 from functools import wraps
 from loguru import logger
 import json
-import fcntl
 from datetime import datetime
 from stat import S_IFDIR, S_IFREG
 import errno
-from pathlib import Path
-import pickle
-from src.model.metadata import MetadataContainer
+from src.model.metadata import MetadataContainer, MetadataEntry, EntryType, parent_path
+from src.model.metadata_store import MetadataStore
+from src.model.metadata_flusher import MetadataFlusher
+from src.model.listing_cache import DirectoryListingCache
+from src.model.attr_cache import AttrCache, NegativeCache
+from src.model.path_locks import PathLockManager
+from src.model.download_manager import DownloadManager
 
 
 def lockWrapper(func):
@@ -34,35 +37,117 @@ def lockWrapper(func):
     return wrapper
 
 
+def pathLockWrapper(func):
+    # serialize calls on the same path, the first argument, not the whole model
+    @wraps(func)
+    def wrapper(self, path, *args, **kwargs):
+        with self.locks.path(path):
+            return func(self, path, *args, **kwargs)
+
+    return wrapper
+
+
+def subtreeLockWrapper(func):
+    # lock every path argument together with everything below it
+    @wraps(func)
+    def wrapper(self, *paths):
+        with self.locks.subtree(*paths):
+            return func(self, *paths)
+
+    return wrapper
+
+
+def treeLockWrapper(func):
+    # wait for every path operation to finish and keep new ones out
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.locks.subtree("/"), self.mutex:
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
 class DropBoxModel:
-    def __init__(self, interface, rootdir, swapdir) -> None:
+    def __init__(
+        self,
+        interface,
+        rootdir,
+        swapdir,
+        metadata_store=None,
+        background_hydrate=False,
+        lazy_metadata=False,
+        metadata_budget=None,
+        attr_cache=None,
+        negative_cache=None,
+    ) -> None:
         log_path = os.path.expanduser("~/Desktop/.config/dropbox.log")
         logger.add(log_path, level="INFO")
         self.dbx = interface
         self.rootdir = rootdir
         self.swapdir = swapdir
-        self.mutex = threading.Lock()
+        # operations lock the paths they work on, the mutex is only held while the
+        # in-memory metadata is changed and never across network or disk i/o
+        self.locks = PathLockManager()
+        self.mutex = threading.RLock()
+        self.downloads = DownloadManager(self.dbx)
         self.local_metadata = MetadataContainer()
-        self.local_metadata_file_path = os.path.expanduser("~/Desktop/.config/metadata.pkl")
+        if metadata_store is None:
+            metadata_store = MetadataStore(
+                os.path.expanduser("~/Desktop/.config/metadata.db"),
+                legacy_pickle_path=os.path.expanduser("~/Desktop/.config/metadata.pkl"),
+            )
+        self.metadata_store = metadata_store
         self.cursor = None  # state cursor for dropbox
-        self.full_metadata = self.fetchAllMetadata()
-        logger.info(f"Full metadata: {self.full_metadata.path_to_id}")
+        self.snapshot_metadata = None  # container the saved snapshot was written from
+        # until hydrated is set, directories are listed on demand and recorded in listed_dirs;
+        # in lazy mode that is all that ever happens and cold listings are evicted past the budget
+        self.hydrated = threading.Event()
+        self.lazy_metadata = lazy_metadata
+        self.listed_dirs = DirectoryListingCache(metadata_budget if lazy_metadata else None)
+        self.listing_lock = threading.Lock()
+        self.listing_inflight = {}
+        self.pending_update = False
+        # getattr results, dropped explicitly by every operation that changes a path
+        self.attr_cache = attr_cache if attr_cache is not None else AttrCache()
+        # paths getattr found missing, dropped per directory when something may appear there
+        self.negative_cache = (
+            negative_cache if negative_cache is not None else NegativeCache()
+        )
+        # (old path, new path) pairs changed remotely, handed to the change listeners
+        # once the update is applied and the lock is released
+        self.pending_changes = []
+        self.change_listeners = []
+        if lazy_metadata:
+            self.startLazy()
+        else:
+            self.full_metadata = self.loadSnapshot()
 
-        if os.path.exists(self.local_metadata_file_path):
-            with open(self.local_metadata_file_path, "rb") as f:
-                try:
-                    self.local_metadata = pickle.load(f)
-                except Exception as e:
-                    logger.error(f"Error loading metadata from file: {e}")
+        try:
+            self.local_metadata = self.metadata_store.load()
+        except Exception as e:
+            logger.error(f"Error loading metadata from store: {e}")
+        self.flusher = MetadataFlusher(
+            lambda: self.flushMetadata(self.local_metadata)
+        )
+        self.flusher.start()
 
         # add some logics here to handle the metadata
-        self.initLocalMetadata()
+        if lazy_metadata:
+            # nothing to reconcile against, directories are listed when they are visited
+            pass
+        elif background_hydrate:
+            # serve the snapshot and local cache right away, list remotely in the background
+            self.hydrateThread = threading.Thread(target=self.hydrate, daemon=True)
+            self.hydrateThread.start()
+        else:
+            self.hydrate()
         for k, v in self.local_metadata.items():
-            if v["type"] == "file":
+            if v["type"] == "file" and not v["uploaded"]:
                 v["uploaded"] = True
+                self.local_metadata.mark_dirty(k)
 
         self.synchronizeThread = UploadingThread(
-            self.dbx, self.mutex, self.local_metadata
+            self.dbx, self.mutex, self.local_metadata, locks=self.locks
         )
         self.downloadingThread = DownloadingThread(self.dbx, self.swapdir, self.rootdir)
         self.thread = threading.Thread(target=self.synchronizeThread)
@@ -75,9 +160,20 @@ class DropBoxModel:
     def stop(self):
         self.synchronizeThread.stop()
         self.downloadingThread.stop()
+        self.downloads.stop()
         self.thread.join()
+        # the uploads are drained, nothing sends chunks any more
+        self.dbx.close()
+        self.flush_now()
+        self.flusher.stop()
 
-    @lockWrapper
+    def flush_now(self):
+        """
+        write pending metadata changes synchronously
+        """
+        self.flusher.flush_now()
+
+    @treeLockWrapper
     def initLocalMetadata(self):
         try:
             tmp = self.local_metadata
@@ -85,12 +181,12 @@ class DropBoxModel:
                 path = k
                 id = v
                 logger.error(f"initLocalMetadata: {id}, {path}")
-                if id not in self.full_metadata.id_metadata.keys() and path not in self.full_metadata.path_to_id.keys():
+                if id not in self.full_metadata.id_metadata and path not in self.full_metadata:
                     logger.error(f"initLocalMetadata: ready to delete {path}")
                     self.deleteLocal(path.lstrip('/'))
                     logger.error(f"finished deleting {path}")
                 else:
-                    remote_path = self.full_metadata.id_metadata[id]["path"]
+                    remote_path = self.full_metadata.path_of(id)
                     logger.error(f"remote_path: {remote_path}")
                     if remote_path != path:
                         logger.error(f"initLocalMetadata: ready to move {path} to {remote_path}")
@@ -98,19 +194,193 @@ class DropBoxModel:
         except Exception as e:
             logger.error(e)
 
-    @lockWrapper
+    def addChangeListener(self, listener):
+        """
+        call listener(changes) with the (old path, new path) pairs of every remote update,
+        old path is None for new entries, new path None for deleted ones and both are None
+        when everything was relisted
+        """
+        self.change_listeners.append(listener)
+
     def updateFullMetadata(self):
+        self.fetchUpdates()
+        self.notifyChanges()
+
+    def notifyChanges(self):
+        """
+        hand the collected remote changes to the listeners, outside of the model lock
+        since they may wait on filesystem calls that need it
+        """
+        with self.mutex:
+            changes, self.pending_changes = self.pending_changes, []
+        if not changes:
+            return
+        for listener in self.change_listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"Error notifying remote changes: {e}")
+
+    @treeLockWrapper
+    def fetchUpdates(self):
         # self.full_metadata = self.fetchAllMetadata()
+        if not self.lazy_metadata and not self.hydrated.is_set():
+            # the hydrating listing is still running, catch up once it is done
+            self.pending_update = True
+            return
         try:
             self.full_metadata = self.fetchUpdateMetadata()
+            self.saveSnapshot()
         except Exception as e:
             logger.error(e)
 
+    def loadSnapshot(self):
+        """
+        load the saved full_metadata snapshot and its cursor, an empty container if there is none
+        """
+        try:
+            snapshot, cursor = self.metadata_store.load_snapshot()
+        except Exception as e:
+            logger.error(f"Error loading metadata snapshot: {e}")
+            snapshot, cursor = None, None
+        if snapshot is None:
+            return MetadataContainer()
+        logger.info(f"Loaded snapshot of {len(snapshot)} entries")
+        self.cursor = cursor
+        self.snapshot_metadata = snapshot
+        return snapshot
+
+    def hydrate(self):
+        """
+        warm start: catch up from the saved cursor, cold start: stream the full listing
+        into full_metadata, then reconcile the local metadata with it
+        """
+        if self.cursor is not None:
+            pending = self.markHydrated()
+            self.updateFullMetadata()
+        else:
+            full_metadata = self.fetchAllMetadata(self.full_metadata)
+            if full_metadata is not None:
+                self.full_metadata = full_metadata
+            self.saveSnapshot()
+            pending = self.markHydrated()
+        logger.info(f"Full metadata: {len(self.full_metadata)} entries")
+        self.listed_dirs.clear()
+        self.initLocalMetadata()
+        if pending:
+            self.updateFullMetadata()
+
+    @lockWrapper
+    def markHydrated(self):
+        # returns whether webhook events were deferred while hydrating
+        self.hydrated.set()
+        pending, self.pending_update = self.pending_update, False
+        return pending
+
+    def startLazy(self):
+        """
+        lazy mode: list nothing up front, only remember where the change feed starts
+        """
+        self.full_metadata = MetadataContainer()
+        self.snapshot_metadata = None
+        self.listed_dirs.clear()
+        self.attr_cache.clear()
+        self.negative_cache.clear()
+        try:
+            self.cursor = self.dbx.get_latest_cursor("", recursive=True)
+        except Exception as e:
+            logger.error(f"Error getting latest cursor: {e}")
+            self.cursor = None
+
+    def ensureListed(self, path):
+        """
+        block until the remote children of the directory are known, needed while the
+        hydrating listing is still running and all the time in lazy mode
+        """
+        if not self.lazy_metadata and self.hydrated.is_set():
+            return
+        if self.listed_dirs.touch(path):
+            return
+        with self.listing_lock:
+            if path in self.listed_dirs:
+                return
+            # one listing per directory, other callers wait for it
+            event = self.listing_inflight.get(path)
+            owner = event is None
+            if owner:
+                event = self.listing_inflight[path] = threading.Event()
+        if not owner:
+            event.wait()
+            return
+        try:
+            listed = self.fetchDirMetadata(path)
+            if listed is None:
+                return
+            # the container is also written by fetchUpdates and the hydrating listing
+            with self.mutex:
+                for child, entry in listed.items():
+                    self.full_metadata.insert(child, entry, listed.path_to_id[child])
+                self.listed_dirs.add(path, len(listed))
+                self.negative_cache.invalidate_dir(path)
+                self.dropLazyChanges()
+            self.evictListings(path)
+        finally:
+            with self.listing_lock:
+                self.listing_inflight.pop(path, None)
+            event.set()
+
+    def evictListings(self, keep):
+        """
+        drop the children of the coldest listed directories until the budget is met again
+        """
+        while True:
+            victim = self.listed_dirs.pop_victim(keep)
+            if victim is None:
+                return
+            removed = []
+            with self.mutex:
+                for child in self.full_metadata.children_of(victim):
+                    removed.extend(self.full_metadata.pop_subtree(child))
+                self.dropLazyChanges()
+            # listed directories below the victim went with it
+            self.listed_dirs.discard_all(removed)
+            logger.info(f"evicted {len(removed)} cached entries under {victim}")
+
+    def dropLazyChanges(self):
+        """
+        forget the changes tracked in full_metadata in lazy mode, call with the model lock held
+        """
+        # nothing ever saves the lazy container, its change sets would only grow
+        if self.lazy_metadata:
+            self.full_metadata.drain_changes()
+
+    def saveSnapshot(self):
+        """
+        persist full_metadata together with the cursor it is current for
+        """
+        if self.full_metadata is not None and self.lazy_metadata:
+            # a partial lazy listing is not a snapshot that can be resumed from
+            with self.mutex:
+                self.dropLazyChanges()
+            return
+        if self.full_metadata is None or self.cursor is None:
+            return
+        # a new container means a full listing happened, the old snapshot is stale
+        replace = self.full_metadata is not self.snapshot_metadata
+        try:
+            # model lock before the store's, like every other path taking both
+            with self.mutex:
+                self.metadata_store.save_snapshot(self.full_metadata, self.cursor, replace)
+                self.snapshot_metadata = self.full_metadata
+        except Exception as e:
+            logger.error(f"Error saving metadata snapshot: {e}")
+
     def fetchUpdateMetadata(self):
+        if self.cursor is None or self.full_metadata is None:
+            # nothing to continue from, list everything
+            return self.relistAll()
 
         logger.info("Fetching update metadata")
-        res, self.cursor = self.dbx.getUpdates(self.cursor)
-        logger.info(f"Got update metadata: {res}")
         # get a delete file list
 
         # def cleanPath(path):
@@ -142,58 +412,139 @@ class DropBoxModel:
             # cleanPath(path)
             # self.local_metadata.pop(path)
             self.moveLocal(path.lstrip("/"), new_path.lstrip("/"))
-            logger.info(
-                f"updated {id} from {path} to {new_path}, current metadata: {self.local_metadata}"
-            )
+            logger.info(f"updated {id} from {path} to {new_path}")
 
+        def handleLocal(file):
+            if isinstance(file, dropbox.files.DeletedMetadata):
+                path = file.path_display
+                if path in self.local_metadata:
+                    # clean the file
+                    # cleanPath(path)
+                    # update the metadata
+                    # self.local_metadata.pop(path)
+                    self.deleteLocal(path.lstrip("/"))
+                    dList.append(path)
+                    # self.flushMetadataAsync(self.local_metadata)
+            elif isinstance(file, dropbox.files.FileMetadata) or isinstance(
+                file, dropbox.files.FolderMetadata
+            ):
+
+                # dealing with move
+                path = file.path_display
+                id = file.id
+                # if data moved
+                local_path = (
+                    self.local_metadata.path_of(id)
+                    if id in self.local_metadata.id_metadata
+                    else None
+                )
+                if local_path is not None and path != local_path:
+                    logger.info(f"moving file from {local_path} to {path}")
+                    handleMove(id, local_path, path)
+                else:
+                    logger.info(f"adding file {path}")
+
+        # entries are applied one by one as the pages stream in
         dList = []
+        count = 0
         try:
-            for k, file in res.items():
-                if isinstance(file, dropbox.files.DeletedMetadata):
-                    path = file.path_display
-                    if path in self.local_metadata:
-                        # clean the file
-                        # cleanPath(path)
-                        # update the metadata
-                        # self.local_metadata.pop(path)
-                        self.deleteLocal(path.lstrip("/"))
-                        dList.append(k)
-                        # self.flushMetadataAsync(self.local_metadata)
-                elif isinstance(file, dropbox.files.FileMetadata) or isinstance(
-                    file, dropbox.files.FolderMetadata
-                ):
-
-                    # dealing with move
-                    path = file.path_display
-                    id = file.id
-                    # if data moved
-                    if (
-                        id in self.local_metadata.id_metadata
-                        and path != self.local_metadata.id_metadata[id]["path"]
-                    ):
-                        logger.info(
-                            f"moving file from {self.local_metadata.id_metadata[id]['path']} to {path}"
-                        )
-                        handleMove(
-                            id, self.local_metadata.id_metadata[id]["path"], path
-                        )
-                    else:
-                        logger.info(f"adding file {path}")
-            logger.info(f"Deleted files & dirs: {dList}")
-            for k in dList:
-                res.pop(k)
-        except Exception as e:
+            updates = self.dbx.getUpdates(self.cursor)
+            for file in updates:
+                try:
+                    handleLocal(file)
+                except Exception as e:
+                    logger.error(e)
+                self.applyUpdateEntry(file)
+                count += 1
+        except dropbox.exceptions.ApiError as e:
+            if (
+                isinstance(e.error, dropbox.files.ListFolderContinueError)
+                and e.error.is_reset()
+            ):
+                logger.warning("Cursor was reset by dropbox, listing everything")
+                self.cursor = None
+                return self.relistAll()
             logger.error(e)
+            return self.full_metadata
+        logger.info(f"Applied {count} updates, deleted files & dirs: {dList}")
+        # only move past the changes once all pages were applied
+        self.cursor = updates.cursor
+        return self.full_metadata
 
-        return self.fetchAllMetadata()
+    def relistAll(self):
+        """
+        start over without a cursor: a full listing, or an empty cache in lazy mode
+        """
+        self.pending_changes.append((None, None))
+        if self.lazy_metadata:
+            self.startLazy()
+            return self.full_metadata
+        self.full_metadata = self.fetchAllMetadata()
+        # lookups during the listing cached what the old metadata said
+        self.attr_cache.clear()
+        self.negative_cache.clear()
+        return self.full_metadata
+
+    def applyUpdateEntry(self, v):
+        """
+        apply one list_folder_continue entry to full_metadata in place
+        """
+        # scanning the cache for a subtree is only worth it when there can be one
+        self.attr_cache.invalidate(v.path_display, subtree=self.mayHaveChildren(v))
+        if isinstance(v, dropbox.files.DeletedMetadata):
+            # a deleted folder takes everything below it along
+            removed = self.full_metadata.pop_subtree(v.path_display)
+            self.listed_dirs.discard_all(removed)
+            self.pending_changes.append((v.path_display, None))
+            logger.info(f"removed {len(removed)} entries under {v.path_display}")
+        elif isinstance(v, (dropbox.files.FileMetadata, dropbox.files.FolderMetadata)):
+            # a moved entry keeps its id, drop it from the old path first
+            old_path = None
+            if v.id in self.full_metadata.id_metadata:
+                old_path = self.full_metadata.path_of(v.id)
+            if old_path is not None and old_path != v.path_display:
+                self.attr_cache.invalidate(old_path, subtree=True)
+                self.listed_dirs.discard_all(self.full_metadata.pop_subtree(old_path))
+            elif v.path_display in self.full_metadata:
+                old_path = v.path_display
+            self.pending_changes.append((old_path, v.path_display))
+            if (
+                self.lazy_metadata
+                and v.path_display not in self.full_metadata
+                and parent_path(v.path_display) not in self.listed_dirs
+            ):
+                # the directory is not cached, it is listed fresh when visited
+                self.negative_cache.invalidate_dir(parent_path(v.path_display))
+                return
+            self.full_metadata.insert(v.path_display, self.formatEntry(v), v.id)
+            # something appeared in the parent, forget the misses once it can be found
+            self.negative_cache.invalidate_dir(parent_path(v.path_display))
+
+    def mayHaveChildren(self, v):
+        """
+        whether the entry of a delta may have cached attributes below it
+        """
+        if isinstance(v, dropbox.files.FolderMetadata):
+            return True
+        if isinstance(v, dropbox.files.FileMetadata):
+            return False
+        # a deletion does not say what it deleted, only a known folder has children
+        for metadata in (self.full_metadata, self.local_metadata):
+            entry = metadata.get(v.path_display)
+            if entry is not None and entry["type"] == "folder":
+                return True
+        return False
 
-    def fetchAllMetadata(self):
+    def fetchAllMetadata(self, metadata=None):
         """
         List all files and folders in the Dropbox and save their metadata to a file in JSON format.
+        Entries are streamed into metadata when given, so they are visible while the listing runs.
         """
         try:
-            files, _ = self.dbx.list_folder("", recursive=True)
-            return self.formatMetadata(files)
+            listing = self.dbx.list_folder("", recursive=True)
+            metadata = self.formatMetadata(listing, metadata)
+            self.cursor = listing.cursor
+            return metadata
         except Exception as e:
             print(e)
             return None
@@ -203,8 +554,7 @@ class DropBoxModel:
         get the metadata of the file
         """
         try:
-            file = {path: self.dbx.getmetadata(path)}
-            return self.formatMetadata(file)
+            return self.formatMetadata([self.dbx.getmetadata(path)])
         except Exception as e:
             logger.error(e)
             return None
@@ -215,70 +565,122 @@ class DropBoxModel:
         """
         list_folder_path = path if path != "/" else ""
         try:
-            files, _ = self.dbx.list_folder(list_folder_path)
-            return self.formatMetadata(files)
+            return self.formatMetadata(self.dbx.list_folder(list_folder_path))
         except Exception as e:
             logger.error(e)
             return None
 
-    def formatMetadata(self, files) -> dict:
-        """
-        format the metadata to the format that the fuse layer can understand
-        """
-        metadata = MetadataContainer()
-        local_zone = get_localzone()
-        for k, v in files.items():
-            if isinstance(v, dropbox.files.FileMetadata):
-                mtime = max(v.client_modified, v.server_modified)
-                utc_time = mtime.replace(tzinfo=ZoneInfo("UTC"))
-                # local_time = utc_time.astimezone(local_zone)
-
-                metadata[v.path_display] = {
-                    "name": v.name,
-                    "size": v.size,
-                    "type": "file",
-                    "mtime": utc_time.timestamp(),
-                    "uploaded": True,
-                    "path": v.path_display,
-                }
-            elif isinstance(v, dropbox.files.FolderMetadata):
-                metadata[v.path_display] = {
-                    "name": v.name,
-                    "size": 4096,
-                    "type": "folder",
-                    "mtime": time.time(),
-                    "uploaded": True,
-                    "path": v.path_display,
-                }
-            metadata.update_id(v.path_display, v.id)
+    def formatMetadata(self, files, metadata=None) -> dict:
+        """
+        format the metadata to the format that the fuse layer can understand,
+        files is an iterable of dropbox metadata and is consumed as it streams in
+        """
+        # a container passed in is already shared with readers and other writers
+        shared = metadata is not None
+        if metadata is None:
+            metadata = MetadataContainer()
+        for v in files:
+            entry = self.formatEntry(v)
+            if entry is None:
+                continue
+            if shared:
+                with self.mutex:
+                    metadata.insert(v.path_display, entry, v.id)
+            else:
+                metadata.insert(v.path_display, entry, v.id)
         return metadata
 
+    def formatEntry(self, v):
+        """
+        convert one dropbox metadata object to a MetadataEntry
+        """
+        if isinstance(v, dropbox.files.FileMetadata):
+            mtime = max(v.client_modified, v.server_modified)
+            utc_time = mtime.replace(tzinfo=ZoneInfo("UTC"))
+            # local_time = utc_time.astimezone(local_zone)
+            return MetadataEntry(
+                v.name,
+                v.size,
+                EntryType.FILE,
+                utc_time.timestamp(),
+                True,
+                v.path_display,
+            )
+        elif isinstance(v, dropbox.files.FolderMetadata):
+            return MetadataEntry(
+                v.name,
+                4096,
+                EntryType.FOLDER,
+                time.time(),
+                True,
+                v.path_display,
+            )
+        return None
+
     def flushMetadata(self, metadata: MetadataContainer):
         """
-        flush the metadata to the file
+        flush the changed metadata rows to the store
 
         """
-        logger.warning(f"Ready to flush, metadata: {metadata}")
-        with open(self.local_metadata_file_path, "wb") as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
-            try:
-                logger.warning(f"Flushing metadata to file, metadata: {metadata}")
-                self.mutex.acquire()
-                pickle.dump(metadata, f)
-            finally:
-                self.mutex.release()
-                fcntl.flock(f, fcntl.LOCK_UN)
+        # the flusher serializes flushes; the locks are always taken model first, then
+        # store, and the store write happens after the model lock is released
+        with self.mutex:
+            changes = self.metadata_store.collect(metadata)
+        logger.info(
+            f"Flushing {len(changes[0])} changed and {len(changes[1])} removed metadata rows"
+        )
+        try:
+            with self.metadata_store.mutex:
+                self.metadata_store.write(changes)
+        except Exception:
+            with self.mutex:
+                self.metadata_store.requeue(metadata, changes)
+            raise
 
     def flushMetadataAsync(self, metadata: MetadataContainer):
         """
-        flush the metadata to the file asynchronously
+        flush the metadata to the store asynchronously,
+        bursts of calls are coalesced into one write by the flusher thread
         """
-        logger.warning(f"Going to Flushing metadata to file, metadata: {metadata}")
-        flushThread = threading.Thread(target=self.flushMetadata, args=(metadata,))
-        flushThread.start()
+        self.flusher.request()
 
     def getattr(self, path: str):
         logger.info(f"GETATTR MODEL CALLED, path: {path}")
+        if path in self.negative_cache:
+            raise OSError(errno.ENOENT, "No such file or directory")
+        # a path created while the miss is computed must not be remembered as missing
+        generation = self.negative_cache.generation
+        try:
+            return self.cachedAttrs(path)
+        except FileNotFoundError:
+            self.negative_cache.add(path, generation)
+            raise
+
+    def cachedAttrs(self, path: str):
+        """
+        attributes of path from the attribute cache, computed and cached on a miss
+        """
+        attrs = self.attr_cache.get(path)
+        if attrs is not None:
+            return attrs
+        # a path changed while its attributes are computed must not be cached
+        generation = self.attr_cache.generation
+        attrs = self.statPath(path)
+        self.attr_cache.put(path, attrs, generation)
+        return dict(attrs)
+
+    def invalidateAttr(self, path: str, subtree=False):
+        """
+        drop the cached attributes of a path changed outside the model
+        """
+        if len(path) == 0 or path[0] != "/":
+            path = "/" + path
+        self.attr_cache.invalidate(path, subtree)
+
+    def statPath(self, path: str):
+        """
+        compute the attributes of path from the local cache and the remote metadata
+        """
         local_path = os.path.join(self.rootdir, path.lstrip("/"))
         now = time.time()
         default_attrs = {
@@ -290,17 +692,19 @@ class DropBoxModel:
         }
         if path == "/":
             return {"st_mode": (S_IFDIR | 0o755), **default_attrs}
+        self.ensureListed(parent_path(path))
         # remote_metadata = self.fetchOneMetadata(path)
         # remote_metadata = remote_metadata.get(path) if remote_metadata is not None else None
         remote_metadata = self.full_metadata.get(path)
         if path in self.local_metadata:
             local_v = self.local_metadata.get(path)
-            if os.path.exists(local_path):
+            try:
                 ret = os.stat(local_path)
+            except FileNotFoundError:
+                ret = None
 
             if local_v is not None:
-                if os.path.exists(local_path):
-                    ret = os.stat(local_path)
+                if ret is not None:
                     return {
                         "st_atime": ret.st_atime,
                         "st_ctime": ret.st_ctime,
@@ -351,16 +755,7 @@ class DropBoxModel:
         raise OSError(errno.ENOENT, "No such file or directory")
 
     def readdir(self, path: str):
-        def is_direct_subpath(parent_path, child_path):
-            parent = Path(parent_path)
-            child = Path(child_path)
-            try:
-                relative = child.relative_to(parent)
-                # if there is only one part in the relative path, then child is a direct subpath of parent
-                return len(relative.parts) == 1
-            except ValueError:
-                return False
-
+        self.ensureListed(path)
         remote_metadata = self.full_metadata
         # print("full: ", self.full_metadata)
         local_path = os.path.join(self.rootdir, path.lstrip("/"))
@@ -369,45 +764,53 @@ class DropBoxModel:
 
         # print(self.local_metadata)
         direntries = [".", ".."]
-        for local_key in list(self.local_metadata.keys()):
-            print(
-                f"readdir local_key: {local_key}, is_direct_subpath of {path}, {is_direct_subpath(path, local_key)}",
-                file=sys.stderr,
-            )
-            if not is_direct_subpath(path, local_key):
-                continue
+        children = []
+        seen = set(direntries)
+        for local_key in self.local_metadata.children_of(path):
             # if not self.local_metadata[local_key][
             #     "uploaded"
             # ]:  # False if file hasn't been uploaded
             m_name = self.local_metadata[local_key]["name"]
-            direntries.append(m_name)
+            seen.add(m_name)
+            children.append((m_name, local_key))
         if remote_metadata is not None:
-            for m_path in remote_metadata.keys():
-                if os.path.dirname(m_path.lstrip("/")) == path.lstrip("/"):
-                    m_name = remote_metadata[m_path]["name"]
-                    if m_name not in direntries:
-                        direntries.append(m_name)
+            for m_path in remote_metadata.children_of(path):
+                m_name = remote_metadata[m_path]["name"]
+                if m_name not in seen:
+                    seen.add(m_name)
+                    children.append((m_name, m_path))
+        # entries carry their attributes, which also primes the attribute cache
+        # for the getattr calls that follow a listing
+        for m_name, m_path in children:
+            try:
+                attrs = self.cachedAttrs(m_path)
+            except FileNotFoundError:
+                attrs = None
+            direntries.append((m_name, attrs, 0))
         return direntries
 
-    @lockWrapper
-    def write(self, path: str, new_size) -> int:
+    @pathLockWrapper
+    def write(self, path: str, new_size, mtime=None) -> int:
         """
-        upload the file to dropbox
+        upload the file to dropbox, mtime being the time of the last write
         """
-        # self.metadata[path]["uploaded"] = False
-        self.local_metadata[path]["size"] = new_size
-        self.local_metadata[path]["mtime"] = time.time()
-        if len(path) == 0 or path[0] != "/":
-            path = "/" + path
-        try:
-            self.synchronizeThread.addTask(self.rootdir + path, path)
-            return 0
-        except Exception as e:
-            logger.error(self.local_metadata)
-            logger.error(e)
-            return -1
+        with self.mutex:
+            # self.metadata[path]["uploaded"] = False
+            self.local_metadata[path]["size"] = new_size
+            self.local_metadata[path]["mtime"] = mtime if mtime is not None else time.time()
+            self.local_metadata.mark_dirty(path)
+            if len(path) == 0 or path[0] != "/":
+                path = "/" + path
+            self.attr_cache.invalidate(path)
+            try:
+                self.synchronizeThread.addTask(self.rootdir + path, path)
+                return 0
+            except Exception as e:
+                logger.error(self.local_metadata)
+                logger.error(e)
+                return -1
 
-    @lockWrapper
+    @pathLockWrapper
     def createFolder(self, path: str, mode) -> int:
         """
         create a folder in the dropbox
@@ -423,39 +826,36 @@ class DropBoxModel:
             logger.info(f"folder created locally")
             dir_name = os.path.basename("/" + path)
             logger.info("dir name: " + dir_name)
-            new_file_metadata = {
-                "name": dir_name,
-                "size": 4096,
-                "type": "folder",
-                "mtime": time.time(),
-                "uploaded": False,
-                "path": "/" + path,
-            }
-            self.local_metadata["/" + path] = new_file_metadata
-            # record the id of the folder to facilitate the update
-            self.local_metadata.update_id("/" + path, res.id)
-            self.flushMetadataAsync(self.local_metadata)
+            new_file_metadata = MetadataEntry(
+                dir_name, 4096, EntryType.FOLDER, time.time(), False, "/" + path
+            )
+            with self.mutex:
+                self.local_metadata["/" + path] = new_file_metadata
+                # record the id of the folder to facilitate the update
+                self.local_metadata.update_id("/" + path, res.id)
+                self.attr_cache.invalidate("/" + path)
+                self.negative_cache.invalidate_dir(parent_path("/" + path))
+                self.flushMetadataAsync(self.local_metadata)
         except Exception as e:
             logger.error(e)
             return -1
         return 0
 
-    @lockWrapper
+    @pathLockWrapper
     def createFile(self, path: str, mode) -> int:
         try:
             local_path = os.path.join(self.rootdir, path.lstrip("/"))
-            ret = os.open(local_path, os.O_CREAT | os.O_WRONLY, mode)
+            # read-write: reads on the handle returned by create() use it as well
+            ret = os.open(local_path, os.O_CREAT | os.O_RDWR, mode)
             file_name = os.path.basename(path)
-            new_file_metadata = {
-                "name": file_name,
-                "size": 0,
-                "type": "file",
-                "mtime": time.time(),
-                "uploaded": False,
-                "path": path,
-            }
-            self.local_metadata[path] = new_file_metadata
-            self.flushMetadataAsync(self.local_metadata)
+            new_file_metadata = MetadataEntry(
+                file_name, 0, EntryType.FILE, time.time(), False, path
+            )
+            with self.mutex:
+                self.local_metadata[path] = new_file_metadata
+                self.attr_cache.invalidate(path)
+                self.negative_cache.invalidate_dir(parent_path(path))
+                self.flushMetadataAsync(self.local_metadata)
         except Exception as e:
             logger.error(e)
             return -1
@@ -474,27 +874,26 @@ class DropBoxModel:
             except Exception as e:
                 logger.error(e)
                 return -1
-            # update metadata
+            # update metadata, a directory takes its subtree along
             try:
-                self.local_metadata.pop("/" + path)
+                with self.mutex:
+                    if deleting_dir:
+                        self.local_metadata.pop_subtree("/" + path)
+                    else:
+                        self.local_metadata.pop("/" + path)
             except Exception as e:
                 logger.error("failed to delete metadata")
                 return -1
-            if deleting_dir:
-                keys_to_delete = [
-                    k for k in self.local_metadata.keys() if k.startswith("/" + path + "/")
-                ]
-                for key in keys_to_delete:
-                    self.local_metadata.pop(key)
             #flush metadata
             try:
                 self.flushMetadataAsync(self.local_metadata)
             except Exception as e:
                 logger.error(e)
                 return -1
+        self.attr_cache.invalidate("/" + path, subtree=True)
         return 0
 
-    @lockWrapper
+    @subtreeLockWrapper
     def delete(self, path: str) -> int:
         """
         delete a file in the dropbox
@@ -510,38 +909,39 @@ class DropBoxModel:
         # remove locally
         return self.deleteLocal(path)
 
-    @lockWrapper
     def open_file(self, path, local_path, flags):
         logger.info(f"Opening {path}")
         try:
-            # remote_metadata = self.fetchOneMetadata(path)
-            # remote_metadata = remote_metadata.get(path) if remote_metadata is not None else None
-            remote_metadata = self.full_metadata.get(path)
-            if remote_metadata is None:
-                return -1
-            logger.warning(f"remote metadata: {remote_metadata}")
-            if not os.path.exists(local_path):
-                logger.warning(f"local file not exists: {local_path}")
-                self.download_file(path, local_path)  # trigger download
-                self.local_metadata[path] = remote_metadata
-                self.local_metadata.update_id(path, self.full_metadata.path_to_id[path])
-                self.flushMetadataAsync(self.local_metadata)
-
-                # self.metadata[path] = metadata_from_db[path]
-            else:
-                local_v = self.local_metadata.get(path)
-                if local_v is not None:
-                    # db_v = metadata_from_db.get(path)
-                    # if db_v is None:
-                    #     raise FuseOSError(errno.ENOENT)
-                    lct = local_v["mtime"]
-                    rmt = remote_metadata["mtime"]
-                    if rmt > lct:
-                        # self.metadata[path] = metadata_from_db[path]
-                        # self.metadata[path] = remote_metadata
-                        self.download_file(path, local_path)
-                        self.local_metadata[path] = remote_metadata
-                        self.flushMetadataAsync(self.local_metadata)
+            with self.locks.path(path):
+                # remote_metadata = self.fetchOneMetadata(path)
+                # remote_metadata = remote_metadata.get(path) if remote_metadata is not None else None
+                remote_metadata = self.full_metadata.get(path)
+                if remote_metadata is None:
+                    return -1
+                logger.warning(f"remote metadata: {remote_metadata}")
+                download = None
+                if not os.path.exists(local_path):
+                    logger.warning(f"local file not exists: {local_path}")
+                    download = self.downloads.download(
+                        path,
+                        local_path,
+                        lambda: self.downloaded(path, remote_metadata, True),
+                    )
+                else:
+                    local_v = self.local_metadata.get(path)
+                    if local_v is not None:
+                        lct = local_v["mtime"]
+                        rmt = remote_metadata["mtime"]
+                        if rmt > lct:
+                            download = self.downloads.download(
+                                path,
+                                local_path,
+                                lambda: self.downloaded(path, remote_metadata, False),
+                            )
+            if download is not None:
+                # waited for without the path lock: other operations go on meanwhile
+                # and concurrent opens of the file share this download
+                download.result()
         except FileNotFoundError as e:
             logger.error(f"Error opening file: {e}")
             return -1
@@ -555,28 +955,18 @@ class DropBoxModel:
             logger.error(f"Error opening file: {e}")
             return -1
 
-    def download_file(self, path, local_path):
-        logger.info(f"downloading {path}")
-        lockfile_path = f"{local_path}.lock"
-        lockfile_dir_path = os.path.dirname(lockfile_path)
-        if not os.path.exists(lockfile_dir_path):
-            os.makedirs(lockfile_dir_path, exist_ok=True)
-        with open(lockfile_path, "w") as lockfile:
-            try:
-                fcntl.flock(
-                    lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB
-                )  # throw an exception if the file is locked
-                self.dbx.download(path, local_path)
-            except BlockingIOError:
-                fcntl.flock(
-                    lockfile, fcntl.LOCK_EX
-                )  # blocked until the file is unlocked
-            finally:
-                if os.path.exists(lockfile_path):
-                    os.remove(lockfile_path)
-        logger.info(f"finish downloading {path}")
+    def downloaded(self, path, remote_metadata, first):
+        """
+        record a finished download of path, first when there was no local copy before
+        """
+        with self.locks.path(path), self.mutex:
+            self.attr_cache.invalidate(path)
+            self.local_metadata[path] = remote_metadata.copy()
+            if first:
+                self.local_metadata.update_id(path, self.full_metadata.path_to_id[path])
+            self.flushMetadataAsync(self.local_metadata)
 
-    @lockWrapper
+    @subtreeLockWrapper
     def move(self, old: str, new: str) -> int:
         """
         rename a file in the dropbox
@@ -615,14 +1005,17 @@ class DropBoxModel:
             logger.info(f"moved {old_path} to {new_path}")
             # metadata update
             try:
+                self.mutex.acquire()
                 new = "/" + new
                 old = "/" + old
                 # if old in self.local_metadata:
                 # self.local_metadata[new] = self.local_metadata.pop(old)
                 try:
+                    # the subtree of a folder moves along with its node
                     self.local_metadata.update_path(old, new)
-                    self.local_metadata[new]["name"] = os.path.basename(new_path)
-                    self.local_metadata[new]["mtime"] = time.time()
+                    if new in self.local_metadata:
+                        self.local_metadata[new]["name"] = os.path.basename(new_path)
+                        self.local_metadata[new]["mtime"] = time.time()
                 except Exception as e:
                     logger.error(f"Error moving file from metadata: {e}")
                 # else:
@@ -631,23 +1024,16 @@ class DropBoxModel:
                 #     if remote_metadata is not None:
                 #         self.local_metadata[new] = remote_metadata.get(new)
                 logger.info(f"old path is {old_path}, and it's a dir: {moving_dir}")
-                if moving_dir:
-                    logger.info(f"moving folder from {old} to {new}!")
-                    old_prefix = old + "/"
-                    new_prefix = new + "/"
-                    keys_to_update = [
-                        k
-                        for k in self.local_metadata.keys()
-                        if k.startswith(old_prefix)
-                    ]
-                    for key in keys_to_update:
-                        new_key = new_prefix + key[len(old_prefix) :]
-                        self.local_metadata.update_path(key, new_key)
-                        self.local_metadata[new_key]["mtime"] = time.time()
+                self.attr_cache.invalidate(old, subtree=True)
+                self.attr_cache.invalidate(new, subtree=True)
+                self.negative_cache.invalidate_dir(parent_path(new))
+                self.negative_cache.invalidate_dir(new, subtree=True)
                 self.flushMetadataAsync(self.local_metadata)
             except Exception as e:
                 logger.error(f"Error moving file: {e}")
                 return -1
+            finally:
+                self.mutex.release()
         return 0
 
     def getSpaceUsage(self) -> dict:
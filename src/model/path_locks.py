@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+
+
+def normalize(path):
+    # model paths come with and without the leading slash
+    return "/" + path.strip("/")
+
+
+def covers(root, path):
+    # whether path is root or somewhere below it
+    return root == "/" or path == root or path.startswith(root + "/")
+
+
+class PathLockManager:
+    """
+    Striped per-path locks with exclusive subtree locks on top.
+
+    An operation on a single path holds the lock its path hashes onto, so operations
+    on paths in different stripes run in parallel. Moves and deletes lock subtrees: a
+    subtree lock keeps new path locks below it out, waits for the ones already held
+    and is exclusive with every overlapping subtree lock.
+
+    Args:
+        stripes (int): number of locks the paths are spread over.
+
+    Attributes:
+        waits (int): path lock acquisitions that had to wait for a subtree lock.
+    """
+
+    def __init__(self, stripes=64) -> None:
+        self.stripes = [threading.Lock() for _ in range(stripes)]
+        self.cond = threading.Condition()
+        # path -> number of path locks held or being acquired on it
+        self.active = {}
+        # roots of the subtree locks held or waiting for path locks to drain
+        self.subtrees = []
+        self.waits = 0
+
+    def stripe(self, path):
+        return self.stripes[hash(normalize(path)) % len(self.stripes)]
+
+    @contextmanager
+    def path(self, path):
+        path = normalize(path)
+        with self.cond:
+            if self._blocked(path):
+                self.waits += 1
+                self.cond.wait_for(lambda: not self._blocked(path))
+            self.active[path] = self.active.get(path, 0) + 1
+        try:
+            with self.stripe(path):
+                yield
+        finally:
+            with self.cond:
+                count = self.active.pop(path) - 1
+                if count:
+                    self.active[path] = count
+                self.cond.notify_all()
+
+    @contextmanager
+    def subtree(self, *paths):
+        """
+        lock every path together with everything below it
+        """
+        roots = [normalize(path) for path in paths]
+        with self.cond:
+            self.cond.wait_for(lambda: not any(self._overlaps(root) for root in roots))
+            # claimed before draining, so a steady stream of path locks cannot starve it
+            self.subtrees.extend(roots)
+            self.cond.wait_for(
+                lambda: not any(covers(root, p) for root in roots for p in self.active)
+            )
+        try:
+            yield
+        finally:
+            with self.cond:
+                for root in roots:
+                    self.subtrees.remove(root)
+                self.cond.notify_all()
+
+    def _blocked(self, path):
+        return any(covers(root, path) for root in self.subtrees)
+
+    def _overlaps(self, root):
+        return any(covers(other, root) or covers(root, other) for other in self.subtrees)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "active": sum(self.active.values()),
+                "subtrees": len(self.subtrees),
+                "waits": self.waits,
+            }
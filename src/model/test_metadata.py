@@ -1,5 +1,7 @@
+import sys
+import tracemalloc
 import unittest
-from metadata import MetadataContainer
+from metadata import EntryType, MetadataContainer, MetadataEntry
 
 
 class TestMetadataContainer(unittest.TestCase):
@@ -12,9 +14,8 @@ class TestMetadataContainer(unittest.TestCase):
         path = "/path/to/file.txt"
         old_id = "old_id"
         new_id = "new_id"
-        metadata = {"name": "file.txt", "size": 100}
-        self.container.path_to_id[path] = old_id
-        self.container.id_metadata[old_id] = metadata
+        metadata = MetadataEntry("file.txt", 100, "file", 1.0, True, None)
+        self.container.insert(path, metadata, old_id)
 
         self.container.update_id(path, new_id)
 
@@ -32,9 +33,8 @@ class TestMetadataContainer(unittest.TestCase):
     def test_getitem(self):
         # Test getting metadata of an existing path
         path = "/path/to/file.txt"
-        metadata = {"name": "file.txt", "size": 100}
-        self.container.path_to_id[path] = "id"
-        self.container.id_metadata["id"] = metadata
+        metadata = MetadataEntry("file.txt", 100, "file", 1.0, True, None)
+        self.container.insert(path, metadata, "id")
 
         result = self.container[path]
 
@@ -50,7 +50,7 @@ class TestMetadataContainer(unittest.TestCase):
     def test_setitem(self):
         # Test setting metadata for a new path
         path = "/path/to/new_file.txt"
-        metadata = {"name": "new_file.txt", "size": 200}
+        metadata = MetadataEntry("new_file.txt", 200, "file", 1.0, False, path)
 
         self.container[path] = metadata
 
@@ -66,10 +66,9 @@ class TestMetadataContainer(unittest.TestCase):
         path = "/path/to/file.txt"
         old_id = "old_id"
         new_id = "new_id"
-        old_metadata = {"name": "file.txt", "size": 100}
-        new_metadata = {"name": "file.txt", "size": 150}
-        self.container.path_to_id[path] = old_id
-        self.container.id_metadata[old_id] = old_metadata
+        old_metadata = MetadataEntry("file.txt", 100, "file", 1.0, False, path)
+        new_metadata = MetadataEntry("file.txt", 150, "file", 2.0, False, path)
+        self.container.insert(path, old_metadata, old_id)
 
         self.container[path] = new_metadata
 
@@ -88,9 +87,8 @@ class TestMetadataContainer(unittest.TestCase):
         # Test deleting metadata of an existing path
         path = "/path/to/file.txt"
         id = "id"
-        metadata = {"name": "file.txt", "size": 100}
-        self.container.path_to_id[path] = id
-        self.container.id_metadata[id] = metadata
+        metadata = MetadataEntry("file.txt", 100, "file", 1.0, True, None)
+        self.container.insert(path, metadata, id)
 
         del self.container[path]
 
@@ -108,12 +106,10 @@ class TestMetadataContainer(unittest.TestCase):
         # Test retrieving items from the container
         path1 = "/path/to/file1.txt"
         path2 = "/path/to/file2.txt"
-        metadata1 = {"name": "file1.txt", "size": 100}
-        metadata2 = {"name": "file2.txt", "size": 200}
-        self.container.path_to_id[path1] = "id1"
-        self.container.path_to_id[path2] = "id2"
-        self.container.id_metadata["id1"] = metadata1
-        self.container.id_metadata["id2"] = metadata2
+        metadata1 = MetadataEntry("file1.txt", 100, "file", 1.0, True, None)
+        metadata2 = MetadataEntry("file2.txt", 200, "file", 1.0, True, None)
+        self.container.insert(path1, metadata1, "id1")
+        self.container.insert(path2, metadata2, "id2")
 
         result = self.container.items()
 
@@ -123,9 +119,8 @@ class TestMetadataContainer(unittest.TestCase):
         # Test popping metadata of an existing path
         path = "/path/to/file.txt"
         id = "id"
-        metadata = {"name": "file.txt", "size": 100}
-        self.container.path_to_id[path] = id
-        self.container.id_metadata[id] = metadata
+        metadata = MetadataEntry("file.txt", 100, "file", 1.0, True, None)
+        self.container.insert(path, metadata, id)
 
         result = self.container.pop(path)
 
@@ -144,9 +139,8 @@ class TestMetadataContainer(unittest.TestCase):
     def test_get(self):
         # Test getting metadata of an existing path with default value
         path = "/path/to/file.txt"
-        metadata = {"name": "file.txt", "size": 100}
-        self.container.path_to_id[path] = "id"
-        self.container.id_metadata["id"] = metadata
+        metadata = MetadataEntry("file.txt", 100, "file", 1.0, True, None)
+        self.container.insert(path, metadata, "id")
 
         result = self.container.get(path, default=None)
 
@@ -165,16 +159,251 @@ class TestMetadataContainer(unittest.TestCase):
         # Test retrieving keys from the container
         path1 = "/path/to/file1.txt"
         path2 = "/path/to/file2.txt"
-        metadata1 = {"name": "file1.txt", "size": 100}
-        metadata2 = {"name": "file2.txt", "size": 200}
-        self.container.path_to_id[path1] = "id1"
-        self.container.path_to_id[path2] = "id2"
-        self.container.id_metadata["id1"] = metadata1
-        self.container.id_metadata["id2"] = metadata2
+        metadata1 = MetadataEntry("file1.txt", 100, "file", 1.0, True, None)
+        metadata2 = MetadataEntry("file2.txt", 200, "file", 1.0, True, None)
+        self.container.insert(path1, metadata1, "id1")
+        self.container.insert(path2, metadata2, "id2")
 
         result = self.container.keys()
 
-        self.assertEqual(result, {path1, path2})
+        self.assertEqual(set(result), {path1, path2})
+
+    def test_children_index(self):
+        # Test the parent -> children index follows insertions and removals
+        self.container["/dir"] = {"name": "dir", "type": "folder"}
+        self.container["/dir/a.txt"] = {"name": "a.txt", "type": "file"}
+        self.container["/dir/b.txt"] = {"name": "b.txt", "type": "file"}
+        self.container["/dir/sub/c.txt"] = {"name": "c.txt", "type": "file"}
+
+        self.assertEqual(self.container.children_of("/"), ["/dir"])
+        self.assertEqual(
+            set(self.container.children_of("/dir")), {"/dir/a.txt", "/dir/b.txt"}
+        )
+        self.assertEqual(self.container.children_of("/dir/sub"), ["/dir/sub/c.txt"])
+
+        self.container.pop("/dir/a.txt")
+        del self.container["/dir/b.txt"]
+
+        self.assertEqual(self.container.children_of("/dir"), [])
+        self.assertEqual(self.container.children_of("/missing"), [])
+
+    def test_children_index_update_path(self):
+        # Test moving an entry re-parents it in the children index
+        self.container["/a/file.txt"] = {"name": "file.txt", "path": "/a/file.txt"}
+
+        self.container.update_path("/a/file.txt", "/b/file.txt")
+
+        self.assertEqual(self.container.children_of("/a"), [])
+        self.assertEqual(self.container.children_of("/b"), ["/b/file.txt"])
+        self.assertEqual(self.container["/b/file.txt"]["path"], "/b/file.txt")
+
+    def test_children_index_rebuilt_on_unpickle(self):
+        # Test containers pickled with the old path-keyed layout get rebuilt on load
+        state = {
+            "path_to_id": {"/dir/file.txt": "id1"},
+            "id_metadata": {"id1": {"name": "file.txt", "path": "/dir/file.txt"}},
+        }
+        restored = MetadataContainer.__new__(MetadataContainer)
+
+        restored.__setstate__(state)
+
+        self.assertEqual(restored.children_of("/dir"), ["/dir/file.txt"])
+        self.assertEqual(restored.path_to_id["/dir/file.txt"], "id1")
+
+    def test_pop_subtree(self):
+        # Test removing a folder removes everything below it and nothing else
+        for path in ["/a", "/a/x", "/a/b", "/a/b/y", "/ab", "/z"]:
+            self.container[path] = {"name": path.rsplit("/", 1)[1]}
+
+        removed = self.container.pop_subtree("/a")
+
+        self.assertEqual(set(removed), {"/a", "/a/x", "/a/b", "/a/b/y"})
+        self.assertEqual(set(self.container.keys()), {"/ab", "/z"})
+        self.assertEqual(self.container.pop_subtree("/missing"), [])
+
+    def test_descendants_without_intermediate_entries(self):
+        # Test the subtree query reaches paths whose parent directories have no entry
+        for path in ["/a", "/a/b/c/x", "/a/y", "/ab/z"]:
+            self.container[path] = {"name": path.rsplit("/", 1)[1]}
+
+        self.assertEqual(
+            set(self.container.descendants("/a")), {"/a/b/c/x", "/a/y"}
+        )
+        self.assertEqual(self.container.descendants("/a/b"), ["/a/b/c/x"])
+        self.assertEqual(self.container.children_of("/a"), ["/a/y"])
+
+        self.container.pop("/a/b/c/x")
+
+        # emptied placeholder directories are pruned, entries are kept
+        self.assertIsNone(self.container.lookup("/a/b"))
+        self.assertIsNotNone(self.container.lookup("/a"))
+        self.assertIsNotNone(self.container.lookup("/ab"))
+
+    def test_update_path_moves_subtree(self):
+        # Test renaming a folder relinks one node and its subtree follows untouched
+        for path in ["/a", "/a/x", "/a/b/y", "/ab"]:
+            self.container[path] = {"name": path.rsplit("/", 1)[1], "path": path}
+        ids = {p: self.container.path_to_id[p] for p in ["/a", "/a/x", "/a/b/y"]}
+        self.assertEqual(self.container.path_of(ids["/a/b/y"]), "/a/b/y")
+        self.container.drain_changes()
+
+        self.container.update_path("/a", "/c")
+
+        self.assertEqual(set(self.container.keys()), {"/c", "/c/x", "/c/b/y", "/ab"})
+        self.assertEqual(self.container.path_to_id["/c/b/y"], ids["/a/b/y"])
+        self.assertEqual(self.container.path_of(ids["/a/b/y"]), "/c/b/y")
+        self.assertEqual(self.container["/c/x"]["path"], "/c/x")
+        self.assertEqual(self.container.descendants("/a"), [])
+        # only the moved node has to be written again
+        self.assertEqual(self.container.drain_changes(), ({ids["/a"]}, set()))
+
+    def test_update_path_of_emptied_folder(self):
+        # Test a folder whose children are gone does not keep its old cached path
+        self.container.insert("/x", {"name": "x", "type": "folder"}, "id:x")
+        self.container.insert("/x/f", {"name": "f"}, "id:f")
+        self.assertEqual(self.container.path_of("id:f"), "/x/f")
+        self.container.pop("/x/f")
+
+        self.container.update_path("/x", "/y")
+        self.container.insert("/y/g", {"name": "g"}, "id:g")
+
+        self.assertEqual(self.container.path_of("id:x"), "/y")
+        self.assertEqual(self.container.path_of("id:g"), "/y/g")
+        self.assertEqual(set(self.container.keys()), {"/y", "/y/g"})
+
+    def test_insert_promotes_placeholder_dir(self):
+        # Test a folder listed after its children takes over their placeholder parent
+        self.container.insert("/a/x", {"name": "x"}, "id:x")
+        self.assertNotIn("/a", self.container)
+
+        self.container.insert("/a", {"name": "a", "type": "folder"}, "id:a")
+
+        self.assertEqual(self.container.children_of("/a"), ["/a/x"])
+        self.assertEqual(self.container.links["id:x"], ("id:a", "x"))
+        self.assertEqual(len(self.container.links), 2)
+
+    def test_insert_known_id_moves_it(self):
+        # Test inserting an id that is already linked elsewhere moves it with its subtree
+        self.container.insert("/a", {"name": "a", "type": "folder"}, "id:a")
+        self.container.insert("/a/x", {"name": "x"}, "id:x")
+
+        self.container.insert("/b", {"name": "b", "type": "folder"}, "id:a")
+
+        self.assertEqual(set(self.container.keys()), {"/b", "/b/x"})
+        self.assertEqual(self.container.path_to_id["/b/x"], "id:x")
+
+    def test_insert_with_id(self):
+        # Test inserting under a known id, replacing the id of an existing path
+        entry = MetadataEntry("a.txt", 1, "file", 1.0, True, "/dir/a.txt")
+        self.container["/dir/a.txt"] = entry
+        tmp_id = self.container.path_to_id["/dir/a.txt"]
+
+        self.container.insert("/dir/a.txt", entry, "id:a")
+        self.container.insert("/dir/b.txt", {"name": "b.txt"}, "id:b")
+
+        self.assertEqual(self.container.path_to_id["/dir/a.txt"], "id:a")
+        self.assertNotIn(tmp_id, self.container.id_metadata)
+        self.assertIs(self.container.id_metadata["id:a"], entry)
+        self.assertIsInstance(self.container["/dir/b.txt"], MetadataEntry)
+        self.assertEqual(
+            set(self.container.children_of("/dir")), {"/dir/a.txt", "/dir/b.txt"}
+        )
+        with self.assertRaises(TypeError):
+            self.container.insert("/dir/c.txt", "invalid", "id:c")
+
+    def test_setitem_converts_dict(self):
+        # Test plain dict entries are stored as compact MetadataEntry records
+        path = "/path/to/file.txt"
+        value = {
+            "name": "file.txt",
+            "size": 1,
+            "type": "folder",
+            "mtime": 1.0,
+            "uploaded": True,
+            "path": path,
+        }
+
+        self.container[path] = value
+
+        entry = self.container[path]
+        self.assertIsInstance(entry, MetadataEntry)
+        self.assertEqual(entry, value)
+        self.assertIs(entry["type"], EntryType.FOLDER)
+        self.assertEqual(entry["type"], "folder")
+
+
+class TestMetadataEntry(unittest.TestCase):
+
+    def test_item_access(self):
+        entry = MetadataEntry("a.txt", 1, "file", 1.0, False, "/a.txt")
+
+        entry["size"] = 10
+        entry["uploaded"] = True
+
+        self.assertEqual(entry["size"], 10)
+        self.assertTrue(entry.get("uploaded"))
+        self.assertIsNone(entry.get("missing"))
+        with self.assertRaises(KeyError):
+            entry["missing"]
+        with self.assertRaises(AttributeError):
+            entry.extra = 1
+
+    def test_names_are_interned(self):
+        a = MetadataEntry("".join(["read", "me.md"]), 1, "file", 1.0, True, "/a/readme.md")
+        b = MetadataEntry("".join(["readme", ".md"]), 1, "file", 1.0, True, "/b/readme.md")
+
+        self.assertIs(a.name, b.name)
+
+    def test_copy_is_independent(self):
+        entry = MetadataEntry("a.txt", 1, "file", 1.0, False, "/a.txt")
+
+        copied = entry.copy()
+        copied["path"] = "/b.txt"
+
+        self.assertEqual(entry["path"], "/a.txt")
+
+
+class TestMetadataEntryMemory(unittest.TestCase):
+    """
+    Benchmark: bytes per metadata entry for the old dict layout and MetadataEntry.
+    """
+
+    N = 20000
+
+    def measure(self, make):
+        # names repeat across folders the way they do in real accounts
+        names = [f"file{i % 100}.txt" for i in range(self.N)]
+        paths = [f"/dir{i // 100}/{names[i]}" for i in range(self.N)]
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        entries = [make(f"file{i % 100}.txt", paths[i]) for i in range(self.N)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.assertEqual(len(entries), self.N)
+        return (after - before) / self.N
+
+    def test_bytes_per_entry(self):
+        dict_bytes = self.measure(
+            lambda name, path: {
+                "name": name,
+                "size": 4096,
+                "type": "file",
+                "mtime": 1700000000.5,
+                "uploaded": True,
+                "path": path,
+            }
+        )
+        entry_bytes = self.measure(
+            lambda name, path: MetadataEntry(
+                name, 4096, EntryType.FILE, 1700000000.5, True, path
+            )
+        )
+        print(
+            f"bytes per entry: dict {dict_bytes:.0f}, MetadataEntry {entry_bytes:.0f}",
+            file=sys.stderr,
+        )
+
+        self.assertLess(entry_bytes, dict_bytes * 0.6)
 
 
 if __name__ == "__main__":
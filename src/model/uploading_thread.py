@@ -1,7 +1,11 @@
 import sys
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from loguru import logger
+from src.model.path_locks import PathLockManager
+import src.config.config as config
 
 
 class UploadingThread:
@@ -12,6 +16,11 @@ class UploadingThread:
         metadata,
         synchronizeInterval=5,
         maxSynchronizeInterval=60,
+        workers=config.UPLOAD_WORKERS,
+        retries=config.UPLOAD_RETRIES,
+        batchSize=config.UPLOAD_BATCH_SIZE,
+        batchMaxFileSize=config.UPLOAD_BATCH_MAX_FILE_SIZE,
+        locks=None,
     ) -> None:
         self.outstandingQueue = {}
         self.synInterval = synchronizeInterval
@@ -22,6 +31,23 @@ class UploadingThread:
         self.mutex = lock
         self.uploadingQueue = []
         self.metadata = metadata
+        # uploads of one synchronization run in parallel on these workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        # the model's path locks, so a finished upload only waits for its own file
+        self.locks = locks if locks is not None else PathLockManager()
+        # (path, file) -> failed attempts, a file is given up after retries failures
+        self.retries = retries
+        self.failures = {}
+        # files up to batchMaxFileSize are committed batchSize at a time, 0 turns it off
+        self.batchSize = batchSize
+        self.batchMaxFileSize = batchMaxFileSize
+        self.uploaded = 0
+        self.failed = 0
+        self.batches = 0
+        # file -> (bytes sent, size) of the uploads in flight
+        self.progress = {}
+        # one synchronization at a time, so stop can drain the queue before the pool shuts down
+        self.syncing = threading.Lock()
         log_path = os.path.expanduser("~/Desktop/.config/dropbox.log")
         logger.add(log_path, level="ERROR")
 
@@ -32,15 +58,20 @@ class UploadingThread:
         while not self._stop:
             time.sleep(self.synInterval)
             # logger.warning("Synchronization Tiggered")
-            self.synchronize()
+            with self.syncing:
+                # stop drained the queue while we were asleep
+                if self._stop:
+                    break
+                self.synchronize()
 
-    def synchronize(self):
+    def synchronize(self, force=False):
         """
         synchronize all the files in the queue
         if the time is greater than the max synchronization interval, then upload all the files in the queue
         otherwise, only upload the files that are older than the synchronization interval
+        force uploads all the files in the queue
         """
-        maxSync = time.time() - self.lastMaxSyncTime > self.maxSynInterval
+        maxSync = force or time.time() - self.lastMaxSyncTime > self.maxSynInterval
         if maxSync:
             # logger.warning("Max synchronization interval reached, uploading all files")
             self.lastMaxSyncTime = time.time()
@@ -61,47 +92,156 @@ class UploadingThread:
             self.mutex.release()
 
         # logger.warning(f"Uploading {len(self.uploadingQueue)} files")
-        successList = []
+        uploads = []
+        small = []
         while len(self.uploadingQueue) > 0:
             path, file = self.uploadingQueue.pop()
-            logger.warning(f"Uploading {path} {file}")
+            if self.batchable(path):
+                small.append((path, file))
+            else:
+                uploads.append(self.executor.submit(self.uploadFile, path, file))
+        if len(small) == 1:
+            uploads.append(self.executor.submit(self.uploadFile, *small.pop()))
+        if small:
+            # every session is started before the first commit, so batches do not wait for each other
+            batches = [
+                self.startBatch(small[i : i + self.batchSize])
+                for i in range(0, len(small), self.batchSize)
+            ]
+            for batch in batches:
+                self.commitBatch(batch)
+        wait(uploads)
 
-            try:
-                res = self.dbx.upload(path, file, True)
-                successList.append(file)
-                if res is None:
-                    logger.error(f"Upload {path} {file} failed")
-                else:
-                    remote_id = res.id
-                    self.mutex.acquire()
-                    try:
-                        logger.info(f"{path} {file} uploaded as {res}")
-                        self.metadata.update_id(file, remote_id)
-                        logger.info(f"metadata of {file} updated to {remote_id}")
-                    except Exception as e:
-                        # print to stderr
-                        print(e, file=sys.stderr)
-
-                    self.mutex.release()
+    def batchable(self, path: str) -> bool:
+        """
+        whether the file is small enough to be uploaded as part of a batch
+        """
+        # a batch of one is no better than a single upload
+        if self.batchSize < 2:
+            return False
+        try:
+            return os.path.getsize(path) <= self.batchMaxFileSize
+        except OSError:
+            # gone already, the single upload reports it
+            return False
 
+    def startBatch(self, batch):
+        """
+        send the files of a batch in upload sessions, in parallel on the workers
+        """
+        return [
+            (path, file, self.executor.submit(self.dbx.start_batch_upload, path, file, True))
+            for path, file in batch
+        ]
+
+    def commitBatch(self, batch):
+        """
+        commit the started sessions of a batch with one call and record each result
+        """
+        started = []
+        entries = []
+        for path, file, start in batch:
+            try:
+                entries.append(start.result())
+                started.append((path, file))
             except Exception as e:
                 # print to stderr
                 print(e, file=sys.stderr)
-                return
-            # logger.warning(f"Upload {path} {file} done")
-        self.mutex.acquire()
+                self.uploadFailed(path, file)
+        if not entries:
+            return
+        try:
+            results = self.dbx.finish_batch_upload(entries)
+            self.batches += 1
+        except Exception as e:
+            # print to stderr
+            print(e, file=sys.stderr)
+            results = [None] * len(entries)
+        for (path, file), res in zip(started, results):
+            if res is None:
+                self.uploadFailed(path, file)
+            else:
+                self.uploadDone(path, file, res)
+
+    def uploadFile(self, path: str, file: str):
+        """
+        upload one file and record the result in its metadata
+        """
+        logger.warning(f"Uploading {path} {file}")
         try:
-            for k in successList:
-                self.metadata[k]["uploaded"] = True
-                print(f"metadata of {k} is true", file=sys.stderr)
+            res = self.dbx.upload(
+                path, file, True, progress=lambda sent, size: self.reportProgress(file, sent, size)
+            )
         except Exception as e:
             # print to stderr
             print(e, file=sys.stderr)
+            res = None
         finally:
-            self.mutex.release()
+            self.progress.pop(file, None)
+        if res is None:
+            self.uploadFailed(path, file)
+        else:
+            self.uploadDone(path, file, res)
+
+    def uploadDone(self, path: str, file: str, res):
+        """
+        record the remote id of an uploaded file and mark it uploaded
+        """
+        with self.locks.path(file), self.mutex:
+            self.uploaded += 1
+            self.failures.pop((path, file), None)
+            try:
+                logger.info(f"{path} {file} uploaded as {res}")
+                self.metadata.update_id(file, res.id)
+                # a file written again during the upload is still waiting for the next one
+                if (path, file) not in self.outstandingQueue:
+                    self.metadata[file]["uploaded"] = True
+                    self.metadata.mark_dirty(file)
+            except Exception as e:
+                # deleted or moved while it was uploading
+                print(e, file=sys.stderr)
+
+    def reportProgress(self, file: str, sent: int, size: int):
+        """
+        record how much of an uploading file has been sent
+        """
+        self.progress[file] = (sent, size)
+        logger.info(f"{file}: {sent} of {size} bytes sent")
+
+    def uploadFailed(self, path: str, file: str):
+        """
+        queue a failed upload for the next synchronization, or give up after too many failures
+        """
+        with self.mutex:
+            self.failed += 1
+            attempts = self.failures.get((path, file), 0) + 1
+            if attempts > self.retries:
+                logger.error(f"Upload {path} {file} failed {attempts} times, giving up")
+                self.failures.pop((path, file), None)
+                return
+            logger.error(f"Upload {path} {file} failed, retrying")
+            self.failures[(path, file)] = attempts
+            # unless it was written again meanwhile, retry it at the next synchronization
+            self.outstandingQueue.setdefault((path, file), 0)
 
     def stop(self):
-        self._stop = True
+        """
+        stop the synchronization loop and upload what is still queued before the workers shut down
+        """
+        with self.syncing:
+            self._stop = True
+            self.synchronize(force=True)
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self.mutex:
+            return {
+                "queued": len(self.outstandingQueue),
+                "uploaded": self.uploaded,
+                "failed": self.failed,
+                "retrying": len(self.failures),
+                "batches": self.batches,
+            }
 
     def addTask(self, path: str, file: str):
         """
@@ -110,6 +250,6 @@ class UploadingThread:
         """
         # logger.warning(f"Task Added {path} {file}")
         self.outstandingQueue[(path, file)] = time.time()
-        logger.error(self.metadata)
         # change the uploaded metadata to false
         self.metadata[file]["uploaded"] = False
+        self.metadata.mark_dirty(file)
@@ -17,13 +17,16 @@ class TestDropboxInterface(unittest.TestCase):
         mock_entry = MagicMock()
         mock_entry.name = 'test_file.txt'
         mock_response.entries = [mock_entry]
+        mock_response.has_more = False
+        mock_response.cursor = 'cursor'
         mock_dropbox.return_value.files_list_folder.return_value = mock_response
 
         dbx_interface = DropboxInterface('fake_token')
-        result = dbx_interface.list_folder('')
+        listing = dbx_interface.list_folder('')
+        result = list(listing)
  
-        self.assertIn('test_file.txt', result)
-        self.assertEqual(mock_entry, result['test_file.txt'])
+        self.assertEqual(result, [mock_entry])
+        self.assertEqual(listing.cursor, 'cursor')
 
 
     @patch('data.dropbox.files.WriteMode')
@@ -0,0 +1,89 @@
+# the opt-in buffer mode of FUSE.read/FUSE.write against the copying mode
+import ctypes
+import os
+import time
+import pytest
+
+try:
+    from src.lib.fuse import FUSE, Operations, fuse_file_info
+    from src.fuselayer.fuselayer import FuseDropBox
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+FILE_SIZE = 32 * 1024 * 1024
+CHUNK = 128 * 1024
+
+
+class FakeModel:
+    def write(self, path, new_size, mtime=None):
+        return 0
+
+    def invalidateAttr(self, path, subtree=False):
+        pass
+
+
+class DescriptorOps(Operations):
+    # bare descriptor I/O, so the benchmark measures the wrapper and not logging
+    def read(self, path, size, offset, fh):
+        return os.pread(fh, size, offset)
+
+    def readinto(self, path, buf, offset, fh):
+        return os.preadv(fh, [buf], offset)
+
+    def write(self, path, data, offset, fh):
+        return os.pwrite(fh, data, offset)
+
+
+def make_fuse(operations, use_buffers):
+    # the callbacks are exercised directly, nothing is mounted
+    fuse = FUSE.__new__(FUSE)
+    fuse.operations = operations
+    fuse.raw_fi = False
+    fuse.encoding = "utf-8"
+    fuse.use_buffers = use_buffers
+    return fuse
+
+
+@pytest.fixture
+def video(tmp_path):
+    with open(tmp_path / "video.bin", "wb") as f:
+        f.write(os.urandom(FILE_SIZE))
+    fi = fuse_file_info()
+    fi.fh = os.open(tmp_path / "video.bin", os.O_RDWR)
+    yield str(tmp_path), ctypes.pointer(fi)
+    os.close(fi.fh)
+
+
+def stream(fuse, fip, op):
+    buf = (ctypes.c_byte * CHUNK)()
+    ptr = ctypes.cast(buf, ctypes.POINTER(ctypes.c_byte))
+    start = time.perf_counter()
+    for offset in range(0, FILE_SIZE, CHUNK):
+        assert getattr(fuse, op)(b"/video.bin", ptr, CHUNK, offset, fip) == CHUNK
+    return FILE_SIZE / (time.perf_counter() - start) / (1024 * 1024)
+
+
+@pytest.mark.parametrize("op", ["read", "write"])
+def test_buffer_mode_throughput(video, op):
+    rootdir, fip = video
+    copying = stream(make_fuse(DescriptorOps(), False), fip, op)
+    buffers = stream(make_fuse(DescriptorOps(), True), fip, op)
+    print(f"{op}: copying {copying:.0f} MB/s, buffers {buffers:.0f} MB/s")
+
+
+def test_buffer_mode_round_trip(video):
+    rootdir, fip = video
+    fuse = make_fuse(FuseDropBox(rootdir, FakeModel()), True)
+    data = (ctypes.c_byte * 10).from_buffer_copy(b"0123456789")
+    ptr = ctypes.cast(data, ctypes.POINTER(ctypes.c_byte))
+
+    assert fuse.write(b"/video.bin", ptr, 10, 100, fip) == 10
+
+    out = (ctypes.c_byte * 10)()
+    n = fuse.read(b"/video.bin", ctypes.cast(out, ctypes.POINTER(ctypes.c_byte)), 10, 100, fip)
+    assert n == 10
+    assert bytes(out) == b"0123456789"
+    # reading past the end fills only what is there
+    n = fuse.read(b"/video.bin", ctypes.cast(out, ctypes.POINTER(ctypes.c_byte)), 10, FILE_SIZE - 4, fip)
+    assert n == 4
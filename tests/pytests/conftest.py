@@ -1,6 +1,57 @@
 import os
 import sys
+import threading
+from unittest.mock import MagicMock
+import pytest
 
 # add src to sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 print(sys.path)
+
+
+@pytest.fixture
+def bare_model(tmp_path):
+    """
+    DropBoxModel with every field __init__ sets, but no threads, remote calls or store;
+    tests replace what they exercise
+    """
+    try:
+        from src.model.model import DropBoxModel
+        from src.model.metadata import MetadataContainer
+        from src.model.attr_cache import AttrCache, NegativeCache
+        from src.model.path_locks import PathLockManager
+        from src.model.listing_cache import DirectoryListingCache
+    except (ImportError, OSError) as e:
+        # src.lib needs libfuse to be installed
+        pytest.skip(f"fuse not available: {e}")
+
+    model = DropBoxModel.__new__(DropBoxModel)
+    model.dbx = MagicMock()
+    model.rootdir = str(tmp_path)
+    model.swapdir = str(tmp_path / ".swap")
+    model.locks = PathLockManager()
+    model.mutex = threading.RLock()
+    model.downloads = MagicMock()
+    model.local_metadata = MetadataContainer()
+    model.metadata_store = MagicMock()
+    model.cursor = None
+    model.snapshot_metadata = None
+    model.hydrated = threading.Event()
+    model.hydrated.set()
+    model.lazy_metadata = False
+    model.listed_dirs = DirectoryListingCache(None)
+    model.listing_lock = threading.Lock()
+    model.listing_inflight = {}
+    model.pending_update = False
+    model.attr_cache = AttrCache()
+    model.negative_cache = NegativeCache()
+    model.pending_changes = []
+    model.change_listeners = []
+    model.full_metadata = MetadataContainer()
+    model.flusher = MagicMock()
+    model.synchronizeThread = MagicMock()
+    model.downloadingThread = MagicMock()
+    model.thread = MagicMock()
+    model.dthread = MagicMock()
+    return model
+
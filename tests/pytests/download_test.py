@@ -0,0 +1,96 @@
+# opens share in-flight downloads and do not hold up other operations
+import os
+import threading
+import time
+from unittest.mock import MagicMock
+import pytest
+
+try:
+    from src.model.metadata import MetadataEntry, EntryType
+    from src.model.download_manager import DownloadManager
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+DELAY = 0.5
+
+
+class DelayedDropbox:
+    # a DropboxInterface whose downloads take DELAY seconds
+    def __init__(self):
+        self.downloads = []
+        self.fail = False
+
+    def download(self, path, file):
+        self.downloads.append(path)
+        time.sleep(DELAY)
+        if self.fail:
+            raise ConnectionError("download interrupted")
+        with open(file, "wb") as f:
+            f.write(path.encode())
+
+    def mkdir(self, path):
+        return MagicMock(id=f"id:{path}")
+
+
+@pytest.fixture
+def model(bare_model):
+    # only what open_file and its neighbours touch, no threads or remote listing
+    model = bare_model
+    model.dbx = DelayedDropbox()
+    model.downloads = DownloadManager(model.dbx)
+    model.full_metadata.insert(
+        "/big.bin", MetadataEntry("big.bin", 10, EntryType.FILE, 1.0, True, "/big.bin"), "id:big.bin"
+    )
+    yield model
+    model.downloads.stop()
+
+
+def open_file(model, name):
+    return model.open_file(f"/{name}", os.path.join(model.rootdir, name), os.O_RDONLY)
+
+
+def test_concurrent_opens_share_one_download(model):
+    fds = []
+    threads = [threading.Thread(target=lambda: fds.append(open_file(model, "big.bin"))) for _ in range(5)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - start < 2 * DELAY
+    assert model.dbx.downloads == ["/big.bin"]
+    assert model.downloads.stats() == {"started": 1, "shared": 4, "inflight": 0}
+    assert all(os.pread(fd, 20, 0) == b"/big.bin" for fd in fds)
+    assert model.local_metadata.path_to_id["/big.bin"] == "id:big.bin"
+    for fd in fds:
+        os.close(fd)
+
+
+def test_other_operations_go_on_during_a_download(model):
+    thread = threading.Thread(target=open_file, args=(model, "big.bin"))
+    thread.start()
+    time.sleep(DELAY / 5)
+
+    start = time.monotonic()
+    assert model.createFolder("dir", 0o755) == 0
+    fd = model.createFile("/dir/new.txt", 0o644)
+    assert model.write("/dir/new.txt", 3) == 0
+    # even the file being downloaded can be looked at
+    assert model.getattr("/big.bin")["st_size"] == 10
+    assert time.monotonic() - start < DELAY / 2
+
+    thread.join()
+    os.close(fd)
+
+
+def test_failed_download_is_retried(model):
+    model.dbx.fail = True
+    assert open_file(model, "big.bin") == -1
+    assert os.listdir(model.rootdir) == []
+
+    model.dbx.fail = False
+    fd = open_file(model, "big.bin")
+    assert os.pread(fd, 20, 0) == b"/big.bin"
+    os.close(fd)
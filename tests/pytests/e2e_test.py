@@ -25,17 +25,23 @@ class TestDropBox:
         token = os.environ.get("MY_APP_AUTH_TOKEN")
         self.dropbox = DropboxInterface(token)
 
+    def list_folder(self, path, recursive=False):
+        return {
+            e.path_display: e
+            for e in self.dropbox.list_folder(path, recursive=recursive)
+        }
+
     def test_write_rm_file(self):
         # upload a file
         os.system("echo 'hello world' > ~/Desktop/dropbox/testfile.txt")
         time.sleep(10)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         print(res)
         assert len(res) == 1
         # remove the file
         os.system("rm ~/Desktop/dropbox/testfile.txt")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
 
     def test_multiple_write(self):
@@ -43,13 +49,13 @@ class TestDropBox:
         for i in range(10):
             os.system(f"echo 'hello world {i}' > ~/Desktop/dropbox/testfile{i}.txt")
         time.sleep(20)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 10
         # remove the files
         for i in range(10):
             os.system(f"rm ~/Desktop/dropbox/testfile{i}.txt")
         time.sleep(5)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         time.sleep(5)
 
@@ -57,12 +63,12 @@ class TestDropBox:
         # create a directory
         os.system("mkdir ~/Desktop/dropbox/testdir")
         time.sleep(10)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # remove the directory
         os.system("rm -r ~/Desktop/dropbox/testdir")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         time.sleep(5)
 
@@ -70,7 +76,7 @@ class TestDropBox:
         # create a directory
         os.system("mkdir ~/Desktop/dropbox/testdir")
         time.sleep(10)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # create a file
         os.system("echo 'hello world' > ~/Desktop/dropbox/testfile.txt")
@@ -87,20 +93,20 @@ class TestDropBox:
                 f"echo 'hello world {i}' > ~/Desktop/dropbox/testdir/testdir2/testfile2{i}.txt"
             )
         time.sleep(40)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 2
-        res, _ = self.dropbox.list_folder("", recursive=True)
+        res = self.list_folder("", recursive=True)
         print(res.keys())
         assert len(res) == 18
         # remove the directory
         os.system("rm -r ~/Desktop/dropbox/testdir")
         time.sleep(5)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # remove the file
         os.system("rm ~/Desktop/dropbox/testfile.txt")
         time.sleep(5)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         time.sleep(5)
 
@@ -108,7 +114,7 @@ class TestDropBox:
         # create a directory
         os.system("mkdir ~/Desktop/dropbox/testdir")
         time.sleep(10)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # create a file
         os.system("echo 'hello world' > ~/Desktop/dropbox/testfile.txt")
@@ -125,20 +131,20 @@ class TestDropBox:
                 f"echo 'hello world {i}' > ~/Desktop/dropbox/testdir/testdir/testfile{i}.txt"
             )
         time.sleep(40)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 2
-        res, _ = self.dropbox.list_folder("", recursive=True)
+        res = self.list_folder("", recursive=True)
         print(res.keys())
         assert len(res) == 18
         # remove the directory
         os.system("rm -r ~/Desktop/dropbox/testdir")
         time.sleep(5)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # remove the file
         os.system("rm ~/Desktop/dropbox/testfile.txt")
         time.sleep(5)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         time.sleep(5)
 
@@ -146,19 +152,19 @@ class TestDropBox:
         # create a file
         os.system("echo 'hello world' > ~/Desktop/dropbox/testfile.txt")
         time.sleep(10)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert res["/testfile.txt"].name == "testfile.txt"
         assert len(res) == 1
         # move the file
         os.system("mv ~/Desktop/dropbox/testfile.txt ~/Desktop/dropbox/testfile2.txt")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert res["/testfile2.txt"].name == "testfile2.txt"
         assert len(res) == 1
         # remove the file
         os.system("rm ~/Desktop/dropbox/testfile2.txt")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         time.sleep(5)
 
@@ -166,32 +172,32 @@ class TestDropBox:
         # create a file
         os.system("echo 'hello world' > ~/Desktop/dropbox/testfile.txt")
         time.sleep(10)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert res["/testfile.txt"].name == "testfile.txt"
         assert len(res) == 1
         # create a directory
         os.system("mkdir ~/Desktop/dropbox/testdir")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 2
         # move the file to the directory
         os.system(
             "mv ~/Desktop/dropbox/testfile.txt ~/Desktop/dropbox/testdir/testfile.txt"
         )
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
-        res, _ = self.dropbox.list_folder("", recursive=True)
+        res = self.list_folder("", recursive=True)
         assert len(res) == 2
         # remove the directory
         os.system("rm -r ~/Desktop/dropbox/testdir")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         # remove the file
         os.system("rm ~/Desktop/dropbox/testfile.txt")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         time.sleep(5)
 
@@ -199,29 +205,29 @@ class TestDropBox:
         # create a directory
         os.system("mkdir ~/Desktop/dropbox/testdir")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # create a file in the directory
         os.system("echo 'hello world' > ~/Desktop/dropbox/testdir/testfile.txt")
         time.sleep(10)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # move the file out of the directory
         os.system(
             "mv ~/Desktop/dropbox/testdir/testfile.txt ~/Desktop/dropbox/testfile.txt"
         )
         time.sleep(2)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 2
         # remove the directory
         os.system("rm -r ~/Desktop/dropbox/testdir")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 1
         # remove the file
         os.system("rm ~/Desktop/dropbox/testfile.txt")
         time.sleep(1)
-        res, _ = self.dropbox.list_folder("")
+        res = self.list_folder("")
         assert len(res) == 0
         time.sleep(5)
 
@@ -0,0 +1,47 @@
+# lazy mode keeps full_metadata within its budget, change tracking included
+import pytest
+
+try:
+    from src.model.metadata import MetadataContainer, MetadataEntry, EntryType
+    from src.model.listing_cache import DirectoryListingCache
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+BUDGET = 10
+
+
+@pytest.fixture
+def model(bare_model):
+    # only what the lazy listings touch, no threads or remote calls
+    model = bare_model
+    model.lazy_metadata = True
+    model.hydrated.clear()
+    model.cursor = "cursor"
+    model.listed_dirs = DirectoryListingCache(BUDGET)
+
+    def fetchDirMetadata(path):
+        listed = MetadataContainer()
+        for i in range(BUDGET // 2):
+            child = f"{path}/f{i}"
+            listed.insert(child, MetadataEntry(f"f{i}", 1, EntryType.FILE, 1.0, True, child), f"id:{child}")
+        return listed
+
+    model.fetchDirMetadata = fetchDirMetadata
+    return model
+
+
+def test_evicted_listings_leave_no_change_tracking(model):
+    for i in range(20):
+        model.ensureListed(f"/d{i}")
+
+    assert len(model.full_metadata) <= BUDGET + BUDGET // 2 + 1
+    assert not model.full_metadata.dirty_ids
+    assert not model.full_metadata.removed_ids
+
+
+def test_lazy_snapshot_is_never_saved(model):
+    model.full_metadata.insert("/a", MetadataEntry("a", 1, EntryType.FILE, 1.0, True, "/a"), "id:a")
+    model.saveSnapshot()
+    model.metadata_store.save_snapshot.assert_not_called()
+    assert not model.full_metadata.dirty_ids
@@ -0,0 +1,296 @@
+# benchmark: per operation latency of the inode based layer against the path based one
+import ctypes
+import errno
+import os
+import time
+import pytest
+
+try:
+    from src.lib.fuse import FUSE, c_stat, fuse_file_info
+    from src.fuselayer.fuselayer import FuseDropBox
+    from src.fuselayer.lowlevel import FuseDropBoxLL
+    from src.fuselayer.inode_table import ROOT_INO
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+DEPTH = 6
+ROUNDS = 2000
+
+
+class FakeModel:
+    # answers from the local directory the way the model does for cached files
+    def __init__(self, rootdir):
+        self.rootdir = rootdir
+        self.written = []
+
+    def local(self, path):
+        return os.path.join(self.rootdir, path.lstrip("/"))
+
+    def getattr(self, path):
+        st = os.stat(self.local(path))
+        return {
+            key: getattr(st, key)
+            for key in ("st_atime", "st_ctime", "st_mtime", "st_mode", "st_nlink", "st_size", "st_uid", "st_gid")
+        }
+
+    def readdir(self, path):
+        entries = [".", ".."]
+        for name in sorted(os.listdir(self.local(path))):
+            entries.append((name, self.getattr(path.rstrip("/") + "/" + name), 0))
+        return entries
+
+    def open_file(self, path, local_path, flags):
+        return os.open(local_path, flags)
+
+    def createFile(self, path, mode):
+        return os.open(self.local(path), os.O_CREAT | os.O_WRONLY, mode)
+
+    def write(self, path, new_size, mtime=None):
+        self.written.append((path, new_size))
+        return 0
+
+    def invalidateAttr(self, path, subtree=False):
+        pass
+
+    def addChangeListener(self, listener):
+        self.listener = listener
+
+
+class FakeLibFUSE:
+    # stands in for the reply functions of libfuse and records what was sent
+    def __init__(self):
+        self.replies = []
+
+    def fuse_add_direntry(self, req, buf, bufsize, name, st, off):
+        return 24 + len(name)
+
+    def __getattr__(self, name):
+        def reply(req, *args):
+            self.replies.append((name, args))
+            return 0
+        return reply
+
+
+def make_lowlevel(rootdir):
+    fs = FuseDropBoxLL(None, rootdir, FakeModel(rootdir))
+    fs.libfuse = FakeLibFUSE()
+    return fs
+
+
+def make_highlevel(rootdir):
+    # the callbacks are exercised directly, nothing is mounted
+    fuse = FUSE.__new__(FUSE)
+    fuse.operations = FuseDropBox(rootdir, FakeModel(rootdir))
+    fuse.raw_fi = False
+    fuse.encoding = "utf-8"
+    fuse.use_buffers = False
+    fuse.use_ns = False
+    return fuse
+
+
+def last_reply(fs):
+    name, args = fs.libfuse.replies[-1]
+    return name, [getattr(arg, "_obj", arg) for arg in args]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    parts = [f"d{i}" for i in range(DEPTH)]
+    directory = tmp_path.joinpath(*parts)
+    directory.mkdir(parents=True)
+    (directory / "file.txt").write_bytes(os.urandom(64 * 1024))
+    return str(tmp_path), parts
+
+
+def test_lowlevel_round_trip(tree):
+    rootdir, parts = tree
+    fs = make_lowlevel(rootdir)
+
+    ino = ROOT_INO
+    for name in parts:
+        fs.lookup(None, ino, name)
+        _, (entry,) = last_reply(fs)
+        assert entry.attr_timeout == fs.attr_timeout
+        ino = entry.ino
+
+    fs.lookup(None, ino, "missing.txt")
+    name, (entry,) = last_reply(fs)
+    assert (name, entry.ino, entry.entry_timeout) == ("fuse_reply_entry", 0, fs.entry_timeout)
+
+    fs.create(None, ino, "new.txt", 0o644, {"flags": os.O_WRONLY, "fh": 0})
+    name, (entry, fi) = last_reply(fs)
+    assert name == "fuse_reply_create"
+    new_ino = entry.ino
+    assert fs.inodes.path(new_ino) == "/" + "/".join(parts) + "/new.txt"
+
+    fs.write(None, new_ino, b"hel", 0, {"fh": fi.fh})
+    fs.write(None, new_ino, b"lo", 3, {"fh": fi.fh})
+    assert last_reply(fs) == ("fuse_reply_write", [2])
+    # the writes are handed to the model once, when the handle goes away
+    assert fs.db.written == []
+    fs.release(None, new_ino, {"fh": fi.fh})
+    assert fs.db.written == [(fs.inodes.path(new_ino), 5)]
+
+    fs.open(None, new_ino, {"flags": os.O_RDONLY, "fh": 0})
+    _, (fi,) = last_reply(fs)
+    fs.read(None, new_ino, 10, 1, {"fh": fi.fh})
+    assert last_reply(fs) == ("fuse_reply_buf", [b"ello", 4])
+    fs.release(None, new_ino, {"fh": fi.fh})
+
+    fs.getattr(None, new_ino, {})
+    name, (st, timeout) = last_reply(fs)
+    assert (name, st.st_size, st.st_ino) == ("fuse_reply_attr", 5, new_ino)
+
+    fs.opendir(None, ino, {"flags": 0, "fh": 0})
+    _, (fi,) = last_reply(fs)
+    names = [entry[0] for entry in fs.listings[fi.fh]]
+    assert names == [".", "..", "file.txt", "new.txt"]
+    assert fs.listings[fi.fh][3][1]["st_ino"] == new_ino
+    fs.releasedir(None, ino, {"fh": fi.fh})
+    assert not fs.listings
+
+    fs.forget(None, new_ino, 1)
+    fs.getattr(None, new_ino, {})
+    assert last_reply(fs) == ("fuse_reply_err", [errno.ENOENT])
+
+
+def test_listing_leaves_no_inodes_behind(tree):
+    rootdir, parts = tree
+    fs = make_lowlevel(rootdir)
+    for i in range(100):
+        open(os.path.join(rootdir, f"f{i}.txt"), "wb").close()
+    known = len(fs.inodes)
+
+    for _ in range(3):
+        fs.opendir(None, ROOT_INO, {"flags": 0, "fh": 0})
+        _, (fi,) = last_reply(fs)
+        assert len(fs.inodes) == known + 101
+        fs.releasedir(None, ROOT_INO, {"fh": fi.fh})
+    assert len(fs.inodes) == known
+
+    # an entry the kernel looked up meanwhile keeps the number the listing reported
+    fs.opendir(None, ROOT_INO, {"flags": 0, "fh": 0})
+    _, (fi,) = last_reply(fs)
+    listed = dict(fs.listings[fi.fh][2:])
+    fs.lookup(None, ROOT_INO, "f7.txt")
+    _, (entry,) = last_reply(fs)
+    assert entry.ino == listed["f7.txt"]["st_ino"]
+    fs.releasedir(None, ROOT_INO, {"fh": fi.fh})
+    assert fs.inodes.path(entry.ino) == "/f7.txt"
+    assert len(fs.inodes) == known + 1
+
+
+def test_listing_reports_the_parent_and_entries_without_a_mode(tree):
+    rootdir, parts = tree
+    fs = make_lowlevel(rootdir)
+    fs.lookup(None, ROOT_INO, "d0")
+    _, (d0,) = last_reply(fs)
+    fs.lookup(None, d0.ino, "d1")
+    _, (d1,) = last_reply(fs)
+    # what the model answers for a local entry whose cache file is missing
+    fs.db.getattr = lambda path: {"st_atime": 0, "st_ctime": 0, "st_mtime": 0, "st_uid": 0, "st_gid": 0}
+    known = len(fs.inodes)
+
+    for ino, parent in ((ROOT_INO, ROOT_INO), (d1.ino, d0.ino)):
+        fs.opendir(None, ino, {"flags": 0, "fh": 0})
+        name, (fi,) = last_reply(fs)
+        assert name == "fuse_reply_open"
+        entries = dict(fs.listings[fi.fh])
+        assert entries["."]["st_ino"] == ino
+        assert entries[".."]["st_ino"] == parent
+        assert entries["d2" if ino == d1.ino else "d0"]["st_mode"] == 0
+        fs.releasedir(None, ino, {"fh": fi.fh})
+    assert len(fs.inodes) == known
+    assert fs.inodes.path(d0.ino) == "/d0"
+
+
+def test_remote_changes_invalidate_kernel_cache(tree):
+    rootdir, parts = tree
+    fs = make_lowlevel(rootdir)
+    fs.chan = 1
+    fs.lookup(None, ROOT_INO, "d0")
+    d0 = last_reply(fs)[1][0].ino
+    fs.lookup(None, d0, "d1")
+    d1 = last_reply(fs)[1][0].ino
+    fs.libfuse.replies.clear()
+
+    # the model reports through the listener the layer registered,
+    # the recorded arguments leave out the channel
+    fs.db.listener([("/d0/d1", "/d0/d1"), (None, "/d0/new.txt")])
+    assert fs.libfuse.replies == [
+        ("fuse_lowlevel_notify_inval_inode", (d1, 0, 0)),
+        ("fuse_lowlevel_notify_inval_entry", (d0, b"new.txt", 7)),
+        ("fuse_lowlevel_notify_inval_inode", (d0, 0, 0)),
+    ]
+
+    fs.libfuse.replies.clear()
+    fs.invalidate([("/d0/d1", "/moved")])
+    assert fs.libfuse.replies[0] == ("fuse_lowlevel_notify_inval_entry", (d0, b"d1", 2))
+    assert ("fuse_lowlevel_notify_inval_entry", (ROOT_INO, b"moved", 5)) in fs.libfuse.replies
+    assert fs.inodes.path(d1) == "/moved"
+
+    fs.invalidate([("/moved", None)])
+    fs.getattr(None, d1, {})
+    assert last_reply(fs) == ("fuse_reply_err", [errno.ENOENT])
+
+    fs.libfuse.replies.clear()
+    fs.invalidate([(None, None)])
+    assert {args[0] for _, args in fs.libfuse.replies} == {ROOT_INO, d0, d1}
+
+
+def per_op(fn):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def test_operation_latency(tree):
+    rootdir, parts = tree
+    path = "/" + "/".join(parts) + "/file.txt"
+    fuse = make_highlevel(rootdir)
+    fs = make_lowlevel(rootdir)
+
+    ino = ROOT_INO
+    for name in parts + ["file.txt"]:
+        parent = ino
+        fs.lookup(None, parent, name)
+        ino = last_reply(fs)[1][0].ino
+    fs.inodes.lookups[ino] += 10 * ROUNDS
+
+    st = ctypes.pointer(c_stat())
+    fi = fuse_file_info(flags=os.O_RDONLY)
+    fip = ctypes.pointer(fi)
+    buf = ctypes.create_string_buffer(4096)
+    bufp = ctypes.cast(buf, ctypes.POINTER(ctypes.c_byte))
+
+    def path_open_read_release():
+        fuse.open(path.encode(), fip)
+        fuse.read(path.encode(), bufp, 4096, 0, fip)
+        fuse.release(path.encode(), fip)
+
+    def inode_open_read_release():
+        fs.open(None, ino, {"flags": os.O_RDONLY, "fh": 0})
+        fh = last_reply(fs)[1][0].fh
+        fs.read(None, ino, 4096, 0, {"fh": fh})
+        fs.release(None, ino, {"fh": fh})
+
+    results = {
+        "getattr": (
+            per_op(lambda: fuse.getattr(path.encode(), st)),
+            per_op(lambda: fs.getattr(None, ino, {})),
+        ),
+        # the path api answers a kernel lookup with a getattr on the joined path
+        "lookup": (
+            per_op(lambda: fuse.getattr(path.encode(), st)),
+            per_op(lambda: fs.lookup(None, parent, "file.txt")),
+        ),
+        "open+read+release": (
+            per_op(path_open_read_release),
+            per_op(inode_open_read_release),
+        ),
+    }
+    for op, (by_path, by_inode) in results.items():
+        print(f"{op}: path {by_path:.1f} us, inode {by_inode:.1f} us")
+    assert st.contents.st_size == 64 * 1024
@@ -0,0 +1,161 @@
+# operations on disjoint paths of the model no longer wait for each other
+import threading
+import time
+from unittest.mock import MagicMock
+import pytest
+
+try:
+    from src.model.metadata import MetadataContainer
+    from src.model.metadata_store import MetadataStore
+    from src.model.listing_cache import DirectoryListingCache
+    from src.model.metadata import MetadataEntry, EntryType
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+DELAY = 0.3
+
+
+class SlowDropbox:
+    # every remote call takes DELAY seconds
+    def mkdir(self, path):
+        time.sleep(DELAY)
+        return MagicMock(id=f"id:{path}")
+
+    def delete(self, path):
+        time.sleep(DELAY)
+
+    def move(self, old, new):
+        time.sleep(DELAY)
+
+
+@pytest.fixture
+def model(bare_model):
+    # only what the locked operations touch, no threads or remote listing
+    bare_model.dbx = SlowDropbox()
+    return bare_model
+
+
+def run_all(*calls):
+    results = [None] * len(calls)
+
+    def run(i, fn, args):
+        results[i] = fn(*args)
+
+    threads = [threading.Thread(target=run, args=(i, fn, args)) for i, (fn, args) in enumerate(calls)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start, results
+
+
+def test_disjoint_creates_run_in_parallel(model):
+    elapsed, results = run_all(
+        (model.createFolder, ("a", 0o755)),
+        (model.createFolder, ("b", 0o755)),
+        (model.createFolder, ("c", 0o755)),
+    )
+
+    assert results == [0, 0, 0]
+    assert elapsed < 2 * DELAY
+    assert sorted(model.local_metadata.keys()) == ["/a", "/b", "/c"]
+
+
+def test_write_is_not_blocked_by_a_slow_folder_create(model):
+    model.createFile("/x", 0o644)
+
+    thread = threading.Thread(target=model.createFolder, args=("slow", 0o755))
+    thread.start()
+    time.sleep(DELAY / 3)
+    start = time.monotonic()
+    assert model.write("/x", 5) == 0
+    assert time.monotonic() - start < DELAY / 3
+    thread.join()
+    assert model.local_metadata["/x"]["size"] == 5
+
+
+def test_move_waits_for_operations_in_its_subtree(model):
+    model.createFolder("d", 0o755)
+    model.createFile("/d/f", 0o644)
+
+    thread = threading.Thread(target=model.createFolder, args=("d/sub", 0o755))
+    start = time.monotonic()
+    thread.start()
+    time.sleep(DELAY / 3)
+    assert model.move("d", "e") == 0
+    thread.join()
+
+    # the move waited for the create below it before doing its own remote call
+    assert time.monotonic() - start >= 2 * DELAY
+    assert "/e/f" in model.local_metadata
+    assert "/e/sub" in model.local_metadata
+
+
+def test_flush_and_snapshot_take_the_locks_in_one_order(model, tmp_path):
+    model.metadata_store = MetadataStore(str(tmp_path / "metadata.db"))
+    model.lazy_metadata = False
+    model.hydrated = threading.Event()
+    model.hydrated.set()
+    model.cursor = "cursor"
+    model.snapshot_metadata = model.full_metadata
+    model.createFile("/x", 0o644)
+    fetching = threading.Event()
+    fetched = threading.Event()
+
+    def fetchUpdateMetadata():
+        fetching.set()
+        fetched.wait()
+        return model.full_metadata
+
+    model.fetchUpdateMetadata = fetchUpdateMetadata
+    # a remote update holds the model lock and is about to save its snapshot
+    update = threading.Thread(target=model.fetchUpdates, daemon=True)
+    update.start()
+    fetching.wait()
+    flush = threading.Thread(target=model.flushMetadata, args=(model.local_metadata,), daemon=True)
+    flush.start()
+    time.sleep(DELAY / 3)
+    fetched.set()
+
+    update.join(2 * DELAY)
+    flush.join(2 * DELAY)
+    assert not update.is_alive() and not flush.is_alive()
+    assert model.metadata_store.load()["/x"]["size"] == 0
+    model.metadata_store.close()
+
+
+def test_lazy_listing_inserts_under_the_model_lock(model):
+    model.lazy_metadata = True
+    model.listed_dirs = DirectoryListingCache(None)
+    model.listing_lock = threading.Lock()
+    model.listing_inflight = {}
+    listed = MetadataContainer()
+    listed.insert("/d/a", MetadataEntry("a", 1, EntryType.FILE, 1.0, True, "/d/a"), "id:a")
+    model.fetchDirMetadata = lambda path: listed
+
+    # e.g. fetchUpdates applying a delta to the same container
+    model.mutex.acquire()
+    thread = threading.Thread(target=model.ensureListed, args=("/d",))
+    thread.start()
+    time.sleep(DELAY / 3)
+    assert "/d/a" not in model.full_metadata
+    model.mutex.release()
+    thread.join()
+    assert model.full_metadata.path_to_id["/d/a"] == "id:a"
+
+
+def test_stop_writes_the_metadata_after_the_uploads(bare_model):
+    model = bare_model
+    calls = MagicMock()
+    model.synchronizeThread = calls.uploads
+    model.downloadingThread = calls.downloading
+    model.downloads = calls.downloads
+    model.thread = calls.thread
+    model.dbx = calls.dbx
+    model.flusher = calls.flusher
+    model.stop()
+    names = [name for name, _, _ in calls.mock_calls]
+    assert names.index("uploads.stop") < names.index("thread.join") < names.index("dbx.close")
+    assert names.index("dbx.close") < names.index("flusher.flush_now") < names.index("flusher.stop")
@@ -0,0 +1,70 @@
+# benchmark: FuseDropBox.read on the open descriptor vs reopening the file per read
+import os
+import random
+import time
+import pytest
+
+try:
+    from src.fuselayer.fuselayer import FuseDropBox
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+FILE_SIZE = 64 * 1024 * 1024
+CHUNK = 128 * 1024
+
+
+def legacy_read(rootdir, path, size, offset, fh):
+    # the read path FuseDropBox used before, kept here for comparison
+    local_path = os.path.join(rootdir, path.lstrip("/"))
+    with open(local_path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+@pytest.fixture
+def video(tmp_path):
+    with open(tmp_path / "video.bin", "wb") as f:
+        f.write(os.urandom(FILE_SIZE))
+    fs = FuseDropBox(str(tmp_path), None)
+    fh = os.open(tmp_path / "video.bin", os.O_RDONLY)
+    yield fs, fh
+    os.close(fh)
+
+
+def throughput(read, offsets):
+    start = time.perf_counter()
+    total = 0
+    for offset in offsets:
+        total += len(read("/video.bin", CHUNK, offset))
+    return total / (time.perf_counter() - start) / (1024 * 1024)
+
+
+@pytest.mark.parametrize("pattern", ["sequential", "random"])
+def test_read_throughput(video, pattern):
+    fs, fh = video
+    offsets = list(range(0, FILE_SIZE, CHUNK))
+    if pattern == "random":
+        random.Random(0).shuffle(offsets)
+
+    legacy = throughput(
+        lambda path, size, offset: legacy_read(fs.rootdir, path, size, offset, fh),
+        offsets,
+    )
+    pread = throughput(lambda path, size, offset: fs.read(path, size, offset, fh), offsets)
+    print(f"{pattern} reads: legacy {legacy:.0f} MB/s, pread {pread:.0f} MB/s")
+
+    for offset in offsets[:16]:
+        assert fs.read("/video.bin", CHUNK, offset, fh) == legacy_read(
+            fs.rootdir, "/video.bin", CHUNK, offset, fh
+        )
+
+
+def test_created_file_can_be_read_back(bare_model):
+    # open("w+") reads through the handle create() returned
+    fs = FuseDropBox(bare_model.rootdir, bare_model)
+
+    fh = fs.create("/new.txt", 0o644)
+    os.pwrite(fh, b"hello", 0)
+    assert fs.read("/new.txt", 5, 0, fh) == b"hello"
+    os.close(fh)
@@ -0,0 +1,132 @@
+# applying remote deltas keeps the attribute caches cheap and correct
+import datetime
+import dropbox
+import pytest
+
+try:
+    from src.model.metadata import MetadataContainer
+    from src.model.attr_cache import AttrCache
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+MODIFIED = datetime.datetime(2020, 1, 1)
+
+
+def file_entry(path, id):
+    name = path.rsplit("/", 1)[1]
+    return dropbox.files.FileMetadata(
+        name=name, id=id, client_modified=MODIFIED, server_modified=MODIFIED,
+        rev="0123456789", size=3, path_display=path, path_lower=path.lower(),
+    )
+
+
+def folder_entry(path, id):
+    name = path.rsplit("/", 1)[1]
+    return dropbox.files.FolderMetadata(name=name, id=id, path_display=path, path_lower=path.lower())
+
+
+def deleted_entry(path):
+    name = path.rsplit("/", 1)[1]
+    return dropbox.files.DeletedMetadata(name=name, path_display=path, path_lower=path.lower())
+
+
+class CountingAttrCache(AttrCache):
+    def __init__(self):
+        super().__init__()
+        self.scans = 0
+
+    def invalidate(self, path, subtree=False):
+        self.scans += subtree
+        super().invalidate(path, subtree)
+
+
+@pytest.fixture
+def model(bare_model):
+    # only what applyUpdateEntry touches
+    model = bare_model
+    model.attr_cache = CountingAttrCache()
+    for i in range(100):
+        model.attr_cache.put(f"/d/f{i}", {"st_size": 1})
+    model.applyUpdateEntry(folder_entry("/d", "id:d"))
+    model.attr_cache.scans = 0
+    return model
+
+
+def test_file_updates_do_not_scan_the_cache(model):
+    for i in range(100):
+        model.applyUpdateEntry(file_entry(f"/d/f{i}", f"id:f{i}"))
+    model.applyUpdateEntry(deleted_entry("/d/f0"))
+
+    assert model.attr_cache.scans == 0
+    assert model.attr_cache.get("/d/f1") is None
+    assert "/d/f0" not in model.full_metadata
+
+
+def test_folder_deletes_and_moves_drop_the_subtree(model):
+    model.applyUpdateEntry(file_entry("/d/f1", "id:f1"))
+    model.attr_cache.put("/d/f2", {"st_size": 1})
+    model.applyUpdateEntry(folder_entry("/e", "id:d"))
+    assert model.attr_cache.get("/d/f2") is None
+
+    model.attr_cache.put("/e/f1", {"st_size": 1})
+    model.applyUpdateEntry(deleted_entry("/e"))
+    assert model.attr_cache.get("/e/f1") is None
+    assert "/e/f1" not in model.full_metadata
+
+
+def test_miss_racing_a_remote_create_is_not_remembered(model):
+    def statPath(path):
+        # the file shows up while getattr is still computing its miss
+        model.applyUpdateEntry(file_entry("/d/new", "id:new"))
+        raise FileNotFoundError(path)
+
+    model.statPath = statPath
+    with pytest.raises(FileNotFoundError):
+        model.getattr("/d/new")
+    assert "/d/new" not in model.negative_cache
+
+
+def stat_from_full_metadata(model):
+    def statPath(path):
+        if path not in model.full_metadata:
+            raise FileNotFoundError(path)
+        return {"st_mode": 0o40755 if model.full_metadata[path]["type"] == "folder" else 0o100644}
+
+    return statPath
+
+
+def test_attrs_cached_during_a_relist_are_dropped(model):
+    model.statPath = stat_from_full_metadata(model)
+
+    def fetchAllMetadata():
+        # served from the old listing while the new one streams in
+        assert model.getattr("/d")["st_mode"] == 0o40755
+        listed = MetadataContainer()
+        listed.insert("/d", model.formatEntry(file_entry("/d", "id:d")), "id:d")
+        return listed
+
+    model.fetchAllMetadata = fetchAllMetadata
+    model.relistAll()
+    assert model.attr_cache.get("/d") is None
+    assert model.getattr("/d")["st_mode"] == 0o100644
+
+
+def test_lookup_during_a_relist_does_not_hide_new_entries(model):
+    model.statPath = stat_from_full_metadata(model)
+
+    def fetchAllMetadata():
+        # a name missing from the old listing, looked up while the new one streams in
+        with pytest.raises(FileNotFoundError):
+            model.getattr("/d/new")
+        assert "/d/new" in model.negative_cache
+        listed = MetadataContainer()
+        listed.insert("/d", model.formatEntry(folder_entry("/d", "id:d")), "id:d")
+        listed.insert("/d/new", model.formatEntry(file_entry("/d/new", "id:new")), "id:new")
+        return listed
+
+    model.fetchAllMetadata = fetchAllMetadata
+    model.relistAll()
+    assert "/d/new" not in model.negative_cache
+    assert model.getattr("/d/new")["st_mode"] == 0o100644
+
@@ -0,0 +1,339 @@
+# benchmark: synchronizing many small files with one upload worker, a pool, and batched commits
+import os
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+import pytest
+from src.data.data import DropboxInterface
+from src.model.uploading_thread import UploadingThread
+from src.model.metadata import MetadataContainer, MetadataEntry, EntryType
+
+FILES = 200
+LATENCY = 0.02
+COMMIT = 0.01
+LARGE_FILE = 64 * 1024 * 1024
+CHUNK = 1024 * 1024
+# concurrent upload sessions take multiples of 4 MiB
+SESSION_CHUNK = 4 * 1024 * 1024
+APPEND_LATENCY = 0.05
+
+
+class LatencyDropbox:
+    # a DropboxInterface whose uploads take LATENCY seconds, like one small-file round trip
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self.mutex = threading.Lock()
+
+    def upload(self, path, file, overwrite=False, progress=None):
+        time.sleep(LATENCY)
+        with self.mutex:
+            self.calls.append(file)
+            if file in self.fail:
+                self.fail.discard(file)
+                raise ConnectionError(f"upload of {file} interrupted")
+        return SimpleNamespace(id=f"id:{file}")
+
+
+class CommitDropbox(LatencyDropbox):
+    # every commit also holds the namespace for COMMIT seconds, as on Dropbox's side
+    def __init__(self, fail=(), reject=()):
+        super().__init__(fail)
+        self.reject = set(reject)
+        self.namespace = threading.Lock()
+        self.commits = 0
+
+    def upload(self, path, file, overwrite=False, progress=None):
+        res = super().upload(path, file, overwrite)
+        with self.namespace:
+            self.commits += 1
+            time.sleep(COMMIT)
+        return res
+
+    def start_batch_upload(self, path, file, overwrite=False):
+        return super().upload(path, file, overwrite)
+
+    def finish_batch_upload(self, entries):
+        with self.namespace:
+            self.commits += 1
+            time.sleep(COMMIT)
+        return [None if entry.id in self.reject else entry for entry in entries]
+
+
+def make_uploader(interface, workers, files=FILES, cache="/tmp/cache", **kwargs):
+    metadata = MetadataContainer()
+    uploader = UploadingThread(
+        interface, threading.RLock(), metadata, synchronizeInterval=0, workers=workers, **kwargs
+    )
+    for i in range(files):
+        file = f"/f{i}.txt"
+        metadata.insert(file, MetadataEntry(file[1:], 1, EntryType.FILE, 1.0, True, file), f"local:{i}")
+        uploader.addTask(str(cache) + file, file)
+    return uploader, metadata
+
+
+@pytest.fixture
+def cache(tmp_path):
+    # batches are chosen by the size of the cached files
+    for i in range(FILES):
+        (tmp_path / f"f{i}.txt").write_bytes(b"x")
+    return tmp_path
+
+
+def synchronize(uploader):
+    start = time.monotonic()
+    uploader.synchronize()
+    return time.monotonic() - start
+
+
+@pytest.mark.parametrize("workers", [1, 16])
+def test_all_files_uploaded(workers):
+    uploader, metadata = make_uploader(LatencyDropbox(), workers, files=20)
+    synchronize(uploader)
+    uploader.stop()
+
+    assert uploader.stats() == {"queued": 0, "uploaded": 20, "failed": 0, "retrying": 0, "batches": 0}
+    assert all(metadata[f"/f{i}.txt"]["uploaded"] for i in range(20))
+    assert metadata.path_to_id["/f3.txt"] == "id:/f3.txt"
+
+
+def test_failed_file_does_not_stop_the_others():
+    interface = LatencyDropbox(fail=["/f1.txt"])
+    uploader, metadata = make_uploader(interface, 4, files=5)
+    synchronize(uploader)
+
+    assert uploader.stats() == {"queued": 1, "uploaded": 4, "failed": 1, "retrying": 1, "batches": 0}
+    assert not metadata["/f1.txt"]["uploaded"]
+    assert metadata["/f4.txt"]["uploaded"]
+
+    # retried at the next synchronization
+    synchronize(uploader)
+    uploader.stop()
+    assert metadata["/f1.txt"]["uploaded"]
+    assert uploader.stats()["retrying"] == 0
+
+
+def test_file_is_given_up_after_its_retries():
+    interface = LatencyDropbox()
+    interface.upload = lambda path, file, overwrite=False, progress=None: None
+    uploader, _ = make_uploader(interface, 2, files=1)
+    for _ in range(uploader.retries + 1):
+        synchronize(uploader)
+    uploader.stop()
+    assert uploader.stats() == {"queued": 0, "uploaded": 0, "failed": uploader.retries + 1, "retrying": 0, "batches": 0}
+
+
+def test_file_without_retries_is_given_up_at_once():
+    interface = LatencyDropbox(fail=["/f0.txt"])
+    uploader, metadata = make_uploader(interface, 2, files=2, retries=0)
+    synchronize(uploader)
+    uploader.stop()
+    assert uploader.stats() == {"queued": 0, "uploaded": 1, "failed": 1, "retrying": 0, "batches": 0}
+    assert not metadata["/f0.txt"]["uploaded"]
+    assert interface.calls.count("/f0.txt") == 1
+
+    # on a worker the error would only end up in the discarded future
+    uploader.uploadFailed("/tmp/cache/f1.txt", "/f1.txt")
+    assert uploader.stats()["retrying"] == 0
+
+
+def test_stop_uploads_what_is_still_queued():
+    uploader, metadata = make_uploader(LatencyDropbox(), 4, files=10)
+    uploader.synInterval = 0.2
+    errors = []
+
+    def loop():
+        try:
+            uploader()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+    # the loop wakes up to upload the files after stop
+    time.sleep(0.05)
+    uploader.stop()
+    thread.join()
+
+    assert errors == []
+    assert uploader.stats()["queued"] == 0
+    assert all(metadata[f"/f{i}.txt"]["uploaded"] for i in range(10))
+
+
+def test_pool_throughput():
+    serial, _ = make_uploader(LatencyDropbox(), 1)
+    serial_time = synchronize(serial)
+    serial.stop()
+
+    pooled, _ = make_uploader(LatencyDropbox(), 16)
+    pooled_time = synchronize(pooled)
+    pooled.stop()
+
+    print(
+        f"\n{FILES} files at {LATENCY * 1000:.0f} ms each: "
+        f"1 worker {FILES / serial_time:.0f} files/s, 16 workers {FILES / pooled_time:.0f} files/s"
+    )
+    assert pooled_time * 4 < serial_time
+
+
+def test_small_files_are_committed_in_batches(cache):
+    interface = CommitDropbox(fail=["/f2.txt"], reject=["id:/f3.txt"])
+    uploader, metadata = make_uploader(interface, 8, files=25, cache=cache, batchSize=10)
+    synchronize(uploader)
+
+    assert interface.commits == 3
+    stats = uploader.stats()
+    assert (stats["uploaded"], stats["failed"], stats["batches"]) == (23, 2, 3)
+    assert metadata.path_to_id["/f4.txt"] == "id:/f4.txt"
+    assert not metadata["/f3.txt"]["uploaded"]
+
+    # the failed start and the rejected commit are retried, as a batch of two
+    interface.reject.clear()
+    synchronize(uploader)
+    uploader.stop()
+    assert interface.commits == 4
+    assert all(metadata[f"/f{i}.txt"]["uploaded"] for i in range(25))
+
+
+def test_large_files_are_not_batched(cache):
+    (cache / "f0.txt").write_bytes(b"x" * 100)
+    interface = CommitDropbox()
+    uploader, _ = make_uploader(interface, 4, files=3, cache=cache, batchMaxFileSize=10)
+    synchronize(uploader)
+    uploader.stop()
+    # f0 on its own, f1 and f2 together
+    assert (interface.commits, uploader.stats()["batches"]) == (2, 1)
+
+
+def test_batch_throughput(cache):
+    single, _ = make_uploader(CommitDropbox(), 16, cache=cache, batchSize=0)
+    single_time = synchronize(single)
+    single.stop()
+
+    batched, _ = make_uploader(CommitDropbox(), 16, cache=cache)
+    batched_time = synchronize(batched)
+    batched.stop()
+
+    print(
+        f"\n{FILES} files, {COMMIT * 1000:.0f} ms per commit: "
+        f"single uploads {FILES / single_time:.0f} files/s, batched {FILES / batched_time:.0f} files/s"
+    )
+    assert batched_time * 3 < single_time
+
+
+class SessionDropbox:
+    # the upload session calls of dropbox.Dropbox, each request taking latency seconds
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.sent = []
+        self.appends = []
+        self.inflight = 0
+        self.max_inflight = 0
+        self.mutex = threading.Lock()
+
+    def request(self, data):
+        with self.mutex:
+            self.sent.append(len(data))
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+        time.sleep(self.latency)
+        with self.mutex:
+            self.inflight -= 1
+
+    def files_upload_session_start(self, f, close=False, session_type=None):
+        self.session_type = session_type
+        self.request(f)
+        return SimpleNamespace(session_id="sid")
+
+    def files_upload_session_append_v2(self, f, cursor, close=False):
+        self.request(f)
+        with self.mutex:
+            self.appends.append((cursor.offset, len(f), close))
+
+    def files_upload_session_finish(self, f, cursor, commit):
+        self.request(f)
+        self.finished = (len(f), cursor.offset)
+        return SimpleNamespace(name="big.bin", id="id:big.bin")
+
+
+@pytest.fixture
+def big(tmp_path):
+    big = tmp_path / "big.bin"
+    with open(big, "wb") as f:
+        for _ in range(LARGE_FILE // CHUNK):
+            f.write(os.urandom(CHUNK))
+    return str(big)
+
+
+def test_streaming_upload_memory(big):
+    interface = DropboxInterface("fake_token", chunk_size=CHUNK, parallelism=1)
+    interface.dbx = SessionDropbox()
+    progress = []
+
+    tracemalloc.start()
+    res = interface.upload(big, "/big.bin", True, progress=lambda sent, size: progress.append(sent))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"\n{LARGE_FILE >> 20} MiB upload in {CHUNK >> 20} MiB chunks: peak {peak / (1 << 20):.1f} MiB allocated")
+    assert res.id == "id:big.bin"
+    assert interface.dbx.sent == [CHUNK] * (LARGE_FILE // CHUNK)
+    assert progress == sorted(progress) and progress[-1] == LARGE_FILE
+    assert peak < 3 * CHUNK
+
+
+def test_concurrent_session_upload(big):
+    interface = DropboxInterface("fake_token", chunk_size=SESSION_CHUNK, parallelism=4)
+    interface.dbx = SessionDropbox(latency=0.01)
+    progress = []
+
+    res = interface.upload(big, "/big.bin", True, progress=lambda sent, size: progress.append(sent))
+
+    assert res.id == "id:big.bin"
+    assert interface.dbx.session_type.is_concurrent()
+    chunks = LARGE_FILE // SESSION_CHUNK
+    offsets = [offset for offset, length, _ in interface.dbx.appends]
+    assert sorted(offsets) == [i * SESSION_CHUNK for i in range(chunks)]
+    # only the last chunk closes the session, after every other one was acknowledged
+    assert interface.dbx.appends[-1] == (LARGE_FILE - SESSION_CHUNK, SESSION_CHUNK, True)
+    assert not any(close for _, _, close in interface.dbx.appends[:-1])
+    assert interface.dbx.finished == (0, LARGE_FILE)
+    assert 1 < interface.dbx.max_inflight <= 4
+    assert progress == sorted(progress) and progress[-1] == LARGE_FILE
+
+
+def test_failed_chunk_fails_the_upload(big):
+    interface = DropboxInterface("fake_token", chunk_size=SESSION_CHUNK, parallelism=4)
+    interface.dbx = SessionDropbox()
+
+    def append(f, cursor, close=False):
+        if cursor.offset == SESSION_CHUNK:
+            raise ConnectionError("append interrupted")
+        SessionDropbox.files_upload_session_append_v2(interface.dbx, f, cursor, close)
+
+    interface.dbx.files_upload_session_append_v2 = append
+    with pytest.raises(ConnectionError):
+        interface.upload(big, "/big.bin", True)
+    assert not any(close for _, _, close in interface.dbx.appends)
+
+
+def test_concurrent_session_throughput(big):
+    sequential = DropboxInterface("fake_token", chunk_size=SESSION_CHUNK, parallelism=1)
+    sequential.dbx = SessionDropbox(latency=APPEND_LATENCY)
+    start = time.monotonic()
+    sequential.upload(big, "/big.bin", True)
+    sequential_time = time.monotonic() - start
+
+    concurrent = DropboxInterface("fake_token", chunk_size=SESSION_CHUNK, parallelism=4)
+    concurrent.dbx = SessionDropbox(latency=APPEND_LATENCY)
+    start = time.monotonic()
+    concurrent.upload(big, "/big.bin", True)
+    concurrent_time = time.monotonic() - start
+
+    mb = LARGE_FILE / (1 << 20)
+    print(
+        f"\n{mb:.0f} MiB in {SESSION_CHUNK >> 20} MiB chunks at {APPEND_LATENCY * 1000:.0f} ms per request: "
+        f"one session chunk at a time {mb / sequential_time:.0f} MiB/s, 4 in flight {mb / concurrent_time:.0f} MiB/s"
+    )
+    assert concurrent_time * 2 < sequential_time
@@ -0,0 +1,86 @@
+# writes through one handle reach the model once per flush instead of once per write
+import os
+import pytest
+
+try:
+    from src.fuselayer.fuselayer import FuseDropBox
+    from src.fuselayer.dirty_handles import DirtyHandles
+except (ImportError, OSError) as e:
+    # src.lib needs libfuse to be installed
+    pytest.skip(f"fuse not available: {e}", allow_module_level=True)
+
+CHUNK = 128 * 1024
+CHUNKS = 64
+
+
+class CountingModel:
+    def __init__(self):
+        self.written = []
+        self.invalidated = 0
+
+    def write(self, path, new_size, mtime=None):
+        self.written.append((path, new_size, mtime))
+        return 0
+
+    def invalidateAttr(self, path, subtree=False):
+        self.invalidated += 1
+
+
+@pytest.fixture
+def fs(tmp_path):
+    fs = FuseDropBox(str(tmp_path), CountingModel())
+    fd = os.open(tmp_path / "out.bin", os.O_CREAT | os.O_RDWR, 0o644)
+    # the tests close fd through release
+    return fs, fd
+
+
+def test_sequential_writes_schedule_one_upload(fs):
+    fs, fd = fs
+    data = os.urandom(CHUNK)
+    for i in range(CHUNKS):
+        assert fs.write("/out.bin", data, i * CHUNK, fd) == CHUNK
+    assert fs.db.written == []
+    # every write grew the file, so the cached attributes were dropped each time
+    assert fs.db.invalidated == CHUNKS
+
+    assert fs.flush("/out.bin", fd) == 0
+    assert fs.release("/out.bin", fd) == 0
+    (path, size, mtime), = fs.db.written
+    assert (path, size) == ("/out.bin", CHUNKS * CHUNK)
+    assert mtime is not None
+
+
+def test_rewrite_inside_the_file_reports_its_full_size(fs):
+    fs, fd = fs
+    fs.write("/out.bin", b"x" * 100, 0, fd)
+    fs.fsync("/out.bin", False, fd)
+    fs.write("/out.bin", b"y" * 10, 20, fd)
+    fs.write("/out.bin", b"z" * 10, 0, fd)
+    fs.release("/out.bin", fd)
+    assert [size for _, size, _ in fs.db.written] == [100, 100]
+
+
+def test_truncate_after_write_reports_the_truncated_size(fs):
+    fs, fd = fs
+    fs.write("/out.bin", b"x" * 100, 0, fd)
+    fs.truncate("/out.bin", 10, fd)
+    fs.release("/out.bin", fd)
+    assert fs.db.written[-1][1] == 10
+
+
+def test_read_only_handles_schedule_nothing(fs):
+    fs, fd = fs
+    fs.flush("/out.bin", fd)
+    fs.release("/out.bin", fd)
+    assert fs.db.written == []
+
+
+def test_dirty_handles():
+    dirty = DirtyHandles()
+    assert dirty.mark(3, "/a", 10)
+    assert not dirty.mark(3, "/a", 5)
+    assert dirty.mark(3, "/a", 20)
+    assert len(dirty) == 1
+    path, size, _ = dirty.pop(3)
+    assert (path, size) == ("/a", 20)
+    assert dirty.pop(3) is None
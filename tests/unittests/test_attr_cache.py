@@ -0,0 +1,115 @@
+import time
+import unittest
+from src.model.attr_cache import AttrCache, NegativeCache
+
+
+class TestAttrCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = AttrCache(ttl=10)
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get("/a"))
+        self.cache.put("/a", {"st_size": 1})
+
+        self.assertEqual(self.cache.get("/a"), {"st_size": 1})
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_returns_copies(self):
+        self.cache.put("/a", {"st_size": 1})
+
+        self.cache.get("/a")["st_size"] = 2
+
+        self.assertEqual(self.cache.get("/a"), {"st_size": 1})
+
+    def test_entries_expire(self):
+        self.cache.ttl = 0.05
+        self.cache.put("/a", {"st_size": 1})
+
+        time.sleep(0.1)
+
+        self.assertIsNone(self.cache.get("/a"))
+
+    def test_invalidate_subtree(self):
+        for path in ["/a", "/a/x", "/a/b/y", "/ab"]:
+            self.cache.put(path, {})
+
+        self.cache.invalidate("/a/x")
+        self.assertIsNone(self.cache.get("/a/x"))
+        self.assertIsNotNone(self.cache.get("/a/b/y"))
+
+        self.cache.invalidate("/a", subtree=True)
+        self.assertEqual(list(self.cache.entries), ["/ab"])
+
+    def test_attrs_computed_before_an_invalidation_are_dropped(self):
+        generation = self.cache.generation
+        self.cache.clear()
+
+        self.cache.put("/a", {"st_size": 1}, generation)
+        self.assertIsNone(self.cache.get("/a"))
+
+        self.cache.put("/a", {"st_size": 1}, self.cache.generation)
+        self.assertEqual(self.cache.get("/a"), {"st_size": 1})
+
+    def test_bounded(self):
+        self.cache.maxsize = 2
+        self.cache.put("/a", {})
+        self.cache.put("/b", {})
+        self.cache.get("/a")
+        self.cache.put("/c", {})
+
+        self.assertEqual(list(self.cache.entries), ["/a", "/c"])
+
+
+class TestNegativeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = NegativeCache()
+
+    def test_remembers_misses(self):
+        self.assertNotIn("/a/x.py", self.cache)
+        self.cache.add("/a/x.py")
+
+        self.assertIn("/a/x.py", self.cache)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "size": 1})
+
+    def test_invalidate_dir(self):
+        for path in ["/a/x", "/a/y", "/a/b/z", "/ab/x"]:
+            self.cache.add(path)
+
+        self.cache.invalidate_dir("/a")
+
+        self.assertEqual(set(self.cache.entries), {"/a/b/z", "/ab/x"})
+        self.cache.invalidate_dir("/a", subtree=True)
+        self.assertEqual(set(self.cache.entries), {"/ab/x"})
+
+    def test_miss_computed_before_an_invalidation_is_dropped(self):
+        generation = self.cache.generation
+        self.cache.invalidate_dir("/a")
+
+        self.cache.add("/a/x", generation)
+        self.assertNotIn("/a/x", self.cache)
+
+        self.cache.add("/a/x", self.cache.generation)
+        self.assertIn("/a/x", self.cache)
+
+    def test_misses_expire(self):
+        self.cache.ttl = 0.05
+        self.cache.add("/a/x")
+
+        time.sleep(0.1)
+
+        self.assertNotIn("/a/x", self.cache)
+        self.assertEqual(self.cache.by_parent, {})
+
+    def test_bounded(self):
+        self.cache.maxsize = 2
+        for path in ["/x", "/y", "/z"]:
+            self.cache.add(path)
+
+        self.assertEqual(list(self.cache.entries), ["/y", "/z"])
+        self.assertEqual(self.cache.by_parent, {"/": {"/y", "/z"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
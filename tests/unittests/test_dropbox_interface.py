@@ -1,4 +1,5 @@
 
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock, mock_open
 import dropbox
@@ -16,22 +17,66 @@ class TestDropboxInterface(unittest.TestCase):
         mock_entry = MagicMock()
         mock_entry.name = 'test_file.txt'
         mock_response.entries = [mock_entry]
+        mock_response.has_more = False
+        mock_response.cursor = 'cursor'
         mock_dropbox.return_value.files_list_folder.return_value = mock_response
 
         dbx_interface = DropboxInterface('fake_token')
-        result = dbx_interface.list_folder('')
+        listing = dbx_interface.list_folder('')
+        result = list(listing)
  
-        self.assertIn('test_file.txt', result)
-        self.assertEqual(mock_entry, result['test_file.txt'])
+        self.assertEqual(result, [mock_entry])
+        self.assertEqual(listing.cursor, 'cursor')
+
+    @patch('src.data.data.dropbox.Dropbox')
+    def test_list_folder_follows_has_more(self, mock_dropbox):
+        pages = [
+            MagicMock(entries=['a', 'b'], has_more=True, cursor='c1'),
+            MagicMock(entries=['c'], has_more=True, cursor='c2'),
+            MagicMock(entries=['d'], has_more=False, cursor='c3'),
+        ]
+        mock_dropbox.return_value.files_list_folder.return_value = pages[0]
+        mock_dropbox.return_value.files_list_folder_continue.side_effect = pages[1:]
+
+        dbx_interface = DropboxInterface('fake_token')
+        listing = dbx_interface.list_folder('', recursive=True)
+        entries = iter(listing)
+
+        # the first page is yielded before the next one is requested
+        self.assertEqual([next(entries), next(entries)], ['a', 'b'])
+        mock_dropbox.return_value.files_list_folder_continue.assert_not_called()
+        self.assertEqual(list(entries), ['c', 'd'])
+        self.assertEqual(listing.cursor, 'c3')
+        mock_dropbox.return_value.files_list_folder.assert_called_once_with('', recursive=True)
+        self.assertEqual(
+            [c.args for c in mock_dropbox.return_value.files_list_folder_continue.call_args_list],
+            [('c1',), ('c2',)],
+        )
+
+    @patch('src.data.data.dropbox.Dropbox')
+    def test_get_updates_follows_has_more(self, mock_dropbox):
+        pages = [
+            MagicMock(entries=['a'], has_more=True, cursor='c1'),
+            MagicMock(entries=['b'], has_more=False, cursor='c2'),
+        ]
+        mock_dropbox.return_value.files_list_folder_continue.side_effect = pages
+
+        dbx_interface = DropboxInterface('fake_token')
+        updates = dbx_interface.getUpdates('c0')
+
+        self.assertEqual(list(updates), ['a', 'b'])
+        self.assertEqual(updates.cursor, 'c2')
 
 
     @patch('src.data.data.dropbox.files.WriteMode')
     @patch('src.data.data.os.path.getmtime')
     @patch('src.data.data.time.gmtime')
+    @patch('src.data.data.os.stat')
     @patch('src.data.data.open', new_callable=unittest.mock.mock_open, read_data=b'some data')
     @patch('src.data.data.dropbox.Dropbox')
-    def test_upload_small_file(self, mock_dropbox, mock_open, mock_gmtime, mock_getmtime, mock_write_mode):
+    def test_upload_small_file(self, mock_dropbox, mock_open, mock_stat, mock_gmtime, mock_getmtime, mock_write_mode):
       
+        mock_stat.return_value.st_size = len(b'some data')
         mock_getmtime.return_value = 1000  
         mock_gmtime.return_value = (2020, 1, 1, 0, 0, 0)
         mock_response = MagicMock()
@@ -44,28 +89,80 @@ class TestDropboxInterface(unittest.TestCase):
         mock_dropbox().files_upload.assert_called_once()
         self.assertEqual(result.name, 'test_file.txt')
 
-    @patch('src.data.data.dropbox.files.UploadSessionCursor')
-    @patch('src.data.data.dropbox.files.CommitInfo')
     @patch('src.data.data.dropbox.Dropbox')
-    def test_upload_large_file(self, mock_dropbox, mock_commit_info, mock_upload_session_cursor):
+    def test_upload_large_file(self, mock_dropbox):
 
         mock_session_start_response = MagicMock()
         mock_session_start_response.session_id = 'fake_session_id'
         mock_dropbox().files_upload_session_start.return_value = mock_session_start_response
 
         file_content = b'a' * (8 * 1024 * 1024 + 1)  # 8MB + 1bytes
-        m_open = mock_open(read_data=file_content)
-
-        m_open.return_value.tell.side_effect = [0, 4 * 1024 * 1024, 4 * 1024 * 1024, 8 * 1024 * 1024, 8 * 1024 * 1024, 8 * 1024 * 1024 + 1, 8 * 1024 * 1024 + 1]
+        progress = MagicMock()
 
-        with patch('src.data.data.open', m_open, create=True):
-            dbx_interface = DropboxInterface('fake_token')
-            dbx_interface.upload_large_file('fake_file_path', '/fake_dropbox_path', 8 * 1024 * 1024 + 1)
+        # chunks are read into a buffer, which mock_open cannot fill
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(file_content)
+            f.flush()
+            dbx_interface = DropboxInterface('fake_token', chunk_size=4 * 1024 * 1024)
+            dbx_interface.upload_large_file(f.name, '/fake_dropbox_path', 8 * 1024 * 1024 + 1, progress=progress)
 
             mock_dropbox().files_upload_session_start.assert_called_once()
-            mock_dropbox().files_upload_session_append_v2.assert_called()
+            mock_dropbox().files_upload_session_append_v2.assert_called_once()
             mock_dropbox().files_upload_session_finish.assert_called_once()
+            # each request carries one chunk, never the whole file
+            data, cursor, _ = mock_dropbox().files_upload_session_finish.call_args.args
+            self.assertEqual((len(data), cursor.offset), (1, 8 * 1024 * 1024))
+            self.assertEqual(progress.call_args.args, (8 * 1024 * 1024 + 1, 8 * 1024 * 1024 + 1))
+            # the SDK only takes bytes
+            data, = mock_dropbox().files_upload_session_start.call_args.args
+            self.assertEqual((type(data), len(data)), (bytes, 4 * 1024 * 1024))
+
+    @patch('src.data.data.os.path.getmtime', return_value=1000)
+    @patch('src.data.data.os.stat')
+    @patch('src.data.data.dropbox.Dropbox')
+    def test_upload_streams_files_above_one_chunk(self, mock_dropbox, mock_stat, mock_getmtime):
+        mock_stat.return_value.st_size = 5
+
+        dbx_interface = DropboxInterface('fake_token', chunk_size=4)
+        with patch.object(dbx_interface, 'commit_info') as commit_info, \
+                patch.object(dbx_interface, 'upload_large_file') as upload_large_file:
+            dbx_interface.upload('fake_file_path', '/fake_dropbox_path', True)
+
+        mock_dropbox().files_upload.assert_not_called()
+        upload_large_file.assert_called_once_with(
+            'fake_file_path', '/fake_dropbox_path', 5, commit_info.return_value, None
+        )
 
+    @patch('src.data.data.os.path.getmtime', return_value=1000)
+    @patch('src.data.data.open', new_callable=unittest.mock.mock_open, read_data=b'some data')
+    @patch('src.data.data.dropbox.Dropbox')
+    def test_start_batch_upload(self, mock_dropbox, mock_open, mock_getmtime):
+        mock_dropbox().files_upload_session_start.return_value = MagicMock(session_id='sid')
+
+        dbx_interface = DropboxInterface('fake_token')
+        entry = dbx_interface.start_batch_upload('fake_file_path', '/fake_dropbox_path', True)
+
+        mock_dropbox().files_upload_session_start.assert_called_once_with(b'some data', close=True)
+        self.assertEqual(entry.cursor.session_id, 'sid')
+        self.assertEqual(entry.cursor.offset, len(b'some data'))
+        self.assertEqual(entry.commit.path, '/fake_dropbox_path')
+        self.assertTrue(entry.commit.mode.is_overwrite())
+
+    @patch('src.data.data.dropbox.Dropbox')
+    def test_finish_batch_upload(self, mock_dropbox):
+        ok = MagicMock()
+        ok.is_success.return_value = True
+        ok.get_success.return_value = 'metadata'
+        failed = MagicMock()
+        failed.is_success.return_value = False
+        mock_dropbox().files_upload_session_finish_batch_v2.return_value = MagicMock(entries=[ok, failed])
+        entries = [MagicMock(), MagicMock()]
+
+        dbx_interface = DropboxInterface('fake_token')
+        results = dbx_interface.finish_batch_upload(entries)
+
+        mock_dropbox().files_upload_session_finish_batch_v2.assert_called_once_with(entries)
+        self.assertEqual(results, ['metadata', None])
     
     @patch('src.data.data.dropbox.Dropbox')
     def test_download(self, mock_dropbox):
@@ -90,6 +187,14 @@ class TestDropboxInterface(unittest.TestCase):
         mock_zipfile.assert_called_once_with('fake_file.zip', 'r')
         mock_remove.assert_called_once_with('fake_file.zip')
    
+    @patch('src.data.data.dropbox.Dropbox')
+    def test_close_stops_the_chunk_workers(self, mock_dropbox):
+        dbx_interface = DropboxInterface('fake_token', chunk_size=4 * 1024 * 1024, parallelism=4)
+        dbx_interface.close()
+        self.assertRaises(RuntimeError, dbx_interface.chunk_workers.submit, print)
+        # nothing to stop without concurrent sessions
+        DropboxInterface('fake_token', parallelism=1).close()
+
     @patch('src.data.data.dropbox.Dropbox')
     def test_mkdir(self, mock_dropbox):
         
@@ -0,0 +1,57 @@
+import unittest
+from src.fuselayer.inode_table import InodeTable, ROOT_INO
+
+
+class TestInodeTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = InodeTable()
+
+    def test_child_paths(self):
+        ino = self.table.remember("/a")
+
+        self.assertEqual(self.table.child(ROOT_INO, "a"), "/a")
+        self.assertEqual(self.table.child(ino, "b.txt"), "/a/b.txt")
+
+    def test_forget_drops_after_last_reference(self):
+        ino = self.table.remember("/a")
+        self.assertEqual(self.table.remember("/a"), ino)
+
+        self.table.forget(ino, 1)
+        self.assertEqual(self.table.path(ino), "/a")
+        self.table.forget(ino, 1)
+
+        self.assertRaises(KeyError, self.table.path, ino)
+        self.assertNotEqual(self.table.remember("/a"), ino)
+
+    def test_root_is_never_forgotten(self):
+        self.table.forget(ROOT_INO, 10)
+        self.assertEqual(self.table.path(ROOT_INO), "/")
+
+    def test_rename_moves_subtree(self):
+        a = self.table.remember("/a")
+        x = self.table.remember("/a/b/x")
+        ab = self.table.remember("/ab")
+
+        self.table.rename("/a", "/c")
+
+        self.assertEqual(self.table.path(a), "/c")
+        self.assertEqual(self.table.path(x), "/c/b/x")
+        self.assertEqual(self.table.path(ab), "/ab")
+        self.assertEqual(self.table.find("/c/b/x"), x)
+
+    def test_discard_keeps_referenced_inodes_unresolvable(self):
+        held = self.table.remember("/a/x")
+        listed = self.table.remember("/a/y")
+
+        self.table.discard("/a")
+
+        self.assertRaises(KeyError, self.table.path, held)
+        self.table.forget(listed, 1)
+        self.assertNotIn(listed, self.table.paths)
+        self.table.forget(held, 1)
+        self.assertEqual(len(self.table), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from src.model.listing_cache import DirectoryListingCache
+
+
+class TestDirectoryListingCache(unittest.TestCase):
+
+    def test_unlimited_never_evicts(self):
+        cache = DirectoryListingCache()
+        cache.add("/a", 1000)
+        cache.add("/b", 1000)
+
+        self.assertIsNone(cache.pop_victim("/b"))
+        self.assertEqual(cache.entries, 2000)
+
+    def test_evicts_least_recently_used(self):
+        cache = DirectoryListingCache(budget=25)
+        cache.add("/a", 10)
+        cache.add("/b", 10)
+        cache.touch("/a")
+        cache.add("/c", 10)
+
+        self.assertEqual(cache.pop_victim("/c"), "/b")
+        self.assertIsNone(cache.pop_victim("/c"))
+        self.assertNotIn("/b", cache)
+        self.assertEqual(cache.entries, 20)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_keeps_ancestors_of_current_directory(self):
+        cache = DirectoryListingCache(budget=5)
+        cache.add("/", 3)
+        cache.add("/a", 3)
+        cache.add("/other", 3)
+        cache.add("/a/b", 3)
+
+        self.assertEqual(cache.pop_victim("/a/b"), "/other")
+        self.assertIsNone(cache.pop_victim("/a/b"))
+        self.assertEqual(list(cache), ["/", "/a", "/a/b"])
+
+    def test_touch_reports_listed(self):
+        cache = DirectoryListingCache()
+        self.assertFalse(cache.touch("/a"))
+        cache.add("/a", 1)
+        self.assertTrue(cache.touch("/a"))
+
+    def test_discard_all_and_readd(self):
+        cache = DirectoryListingCache()
+        cache.add("/a", 4)
+        cache.add("/a/b", 4)
+        cache.add("/a", 2)
+
+        cache.discard_all(["/a/b", "/a/b/c.txt"])
+
+        self.assertEqual(list(cache), ["/a"])
+        self.assertEqual(cache.entries, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+import time
+import unittest
+from src.model.metadata_flusher import MetadataFlusher
+
+
+class TestMetadataFlusher(unittest.TestCase):
+
+    def setUp(self):
+        self.writes = 0
+        self.flushed = threading.Event()
+
+        def flush():
+            self.writes += 1
+            self.flushed.set()
+
+        self.flusher = MetadataFlusher(flush, debounce=0.2, maxDelay=2)
+        self.flusher.start()
+
+    def tearDown(self):
+        self.flusher.stop()
+
+    def test_burst_is_coalesced(self):
+        for _ in range(10000):
+            self.flusher.request()
+
+        self.assertTrue(self.flushed.wait(5))
+        time.sleep(0.3)
+
+        self.assertEqual(self.flusher.requested, 10000)
+        self.assertEqual(self.flusher.performed, 1)
+        self.assertEqual(self.writes, 1)
+
+    def test_flush_now_writes_pending_changes(self):
+        self.flusher.debounce = 10
+        self.flusher.maxDelay = 10
+        self.flusher.request()
+
+        self.flusher.flush_now()
+
+        self.assertEqual(self.writes, 1)
+        self.assertEqual(self.flusher.stats(), {"requested": 1, "performed": 1})
+
+    def test_flush_now_is_noop_when_clean(self):
+        self.flusher.flush_now()
+
+        self.assertEqual(self.writes, 0)
+        self.assertEqual(self.flusher.performed, 0)
+
+    def test_stop_flushes_pending_changes(self):
+        self.flusher.debounce = 10
+        self.flusher.maxDelay = 10
+        self.flusher.request()
+
+        self.flusher.stop()
+
+        self.assertEqual(self.writes, 1)
+        self.assertFalse(self.flusher.thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
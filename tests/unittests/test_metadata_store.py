@@ -0,0 +1,197 @@
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import uuid
+from src.model.metadata import MetadataContainer
+from src.model.metadata_store import MetadataStore
+
+
+class TestMetadataStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "metadata.db")
+        self.pkl_path = os.path.join(self.tmpdir, "metadata.pkl")
+        self.store = MetadataStore(self.db_path, legacy_pickle_path=self.pkl_path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def entry(self, path, type="file"):
+        return {
+            "name": os.path.basename(path),
+            "size": 10,
+            "type": type,
+            "mtime": 1.0,
+            "uploaded": True,
+            "path": path,
+        }
+
+    def test_wal_mode(self):
+        mode = self.store.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_save_and_load_round_trip(self):
+        metadata = MetadataContainer()
+        metadata["/dir"] = self.entry("/dir", "folder")
+        metadata.update_id("/dir", "id:dir")
+        metadata["/dir/a.txt"] = self.entry("/dir/a.txt")
+        local_id = metadata.path_to_id["/dir/a.txt"]
+
+        self.store.save(metadata)
+        loaded = MetadataStore(self.db_path).load()
+
+        self.assertEqual(loaded.path_to_id["/dir"], "id:dir")
+        self.assertEqual(loaded.path_to_id["/dir/a.txt"], local_id)
+        self.assertIsInstance(loaded.path_to_id["/dir/a.txt"], uuid.UUID)
+        self.assertEqual(loaded["/dir/a.txt"], metadata["/dir/a.txt"])
+        self.assertEqual(loaded.children_of("/dir"), ["/dir/a.txt"])
+
+    def test_save_writes_only_changed_rows(self):
+        metadata = MetadataContainer()
+        for i in range(100):
+            metadata[f"/f{i}"] = self.entry(f"/f{i}")
+        self.store.save(metadata)
+        ids = {path: metadata.path_to_id[path] for path in ["/f1", "/f2", "/f3"]}
+
+        metadata["/f1"]["size"] = 99
+        metadata.mark_dirty("/f1")
+        metadata.update_path("/f2", "/g2")
+        metadata.pop("/f3")
+        rows, removed = self.store.collect(metadata)
+        self.store.write((rows, removed))
+
+        self.assertEqual({row[0] for row in rows}, {str(ids["/f1"]), str(ids["/f2"])})
+        self.assertEqual(set(removed), {ids["/f3"]})
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 99)
+        self.assertEqual(loaded["/f1"]["size"], 99)
+        self.assertIn("/g2", loaded)
+        self.assertNotIn("/f2", loaded)
+        self.assertNotIn("/f3", loaded)
+
+    def test_update_id_replaces_row(self):
+        metadata = MetadataContainer()
+        metadata["/a.txt"] = self.entry("/a.txt")
+        self.store.save(metadata)
+
+        metadata.update_id("/a.txt", "id:remote")
+        self.store.save(metadata)
+
+        count = self.store.conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        self.assertEqual(count, 1)
+        self.assertEqual(self.store.load().path_to_id["/a.txt"], "id:remote")
+
+    def test_directory_rename_writes_one_row(self):
+        metadata = MetadataContainer()
+        metadata["/dir"] = self.entry("/dir", "folder")
+        for i in range(100):
+            metadata[f"/dir/sub/f{i}"] = self.entry(f"/dir/sub/f{i}")
+        self.store.save(metadata)
+
+        metadata.update_path("/dir", "/renamed")
+        rows, removed = self.store.collect(metadata)
+        self.store.write((rows, removed))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(removed, [])
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 101)
+        self.assertIn("/renamed/sub/f42", loaded)
+        self.assertEqual(loaded["/renamed/sub/f42"]["path"], "/renamed/sub/f42")
+        # the placeholder for /dir/sub is stored so its children stay linked
+        self.assertEqual(len(loaded.children_of("/renamed/sub")), 100)
+
+    def test_upgrades_path_keyed_tables(self):
+        # the store opens its database lazily, write an old one first
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE metadata (id TEXT PRIMARY KEY, path TEXT NOT NULL UNIQUE, "
+            "name TEXT, size INTEGER, type TEXT, mtime REAL, uploaded INTEGER)"
+        )
+        conn.execute(
+            "INSERT INTO metadata VALUES ('id:a', '/dir/a.txt', 'a.txt', 10, 'file', 1.0, 1)"
+        )
+        conn.commit()
+        conn.close()
+
+        loaded = MetadataStore(self.db_path).load()
+
+        self.assertEqual(loaded.path_to_id["/dir/a.txt"], "id:a")
+        self.assertEqual(loaded["/dir/a.txt"]["size"], 10)
+        self.assertNotIn("/dir", loaded)
+
+    def test_migrates_legacy_pickle_once(self):
+        legacy = MetadataContainer()
+        legacy["/old.txt"] = self.entry("/old.txt")
+        legacy.update_id("/old.txt", "id:old")
+        with open(self.pkl_path, "wb") as f:
+            pickle.dump(legacy, f)
+
+        loaded = self.store.load()
+
+        self.assertEqual(loaded.path_to_id["/old.txt"], "id:old")
+        self.assertFalse(os.path.exists(self.pkl_path))
+        self.assertTrue(os.path.exists(self.pkl_path + ".migrated"))
+
+    def test_snapshot_round_trip(self):
+        self.assertEqual(self.store.load_snapshot(), (None, None))
+        remote = MetadataContainer()
+        remote["/a.txt"] = self.entry("/a.txt")
+        remote.update_id("/a.txt", "id:a")
+
+        self.store.save_snapshot(remote, "cursor1", replace=True)
+        snapshot, cursor = MetadataStore(self.db_path).load_snapshot()
+
+        self.assertEqual(cursor, "cursor1")
+        self.assertEqual(snapshot.path_to_id["/a.txt"], "id:a")
+        self.assertEqual(snapshot["/a.txt"], remote["/a.txt"])
+        # the local table is separate from the snapshot
+        self.assertEqual(len(self.store.load()), 0)
+
+    def test_snapshot_delta_and_replace(self):
+        remote = MetadataContainer()
+        remote["/a.txt"] = self.entry("/a.txt")
+        remote["/b.txt"] = self.entry("/b.txt")
+        self.store.save_snapshot(remote, "cursor1", replace=True)
+
+        remote.pop("/a.txt")
+        remote["/c.txt"] = self.entry("/c.txt")
+        self.store.save_snapshot(remote, "cursor2")
+        snapshot, cursor = self.store.load_snapshot()
+
+        self.assertEqual(cursor, "cursor2")
+        self.assertEqual(set(snapshot.keys()), {"/b.txt", "/c.txt"})
+
+        relisted = MetadataContainer()
+        relisted["/d.txt"] = self.entry("/d.txt")
+        self.store.save_snapshot(relisted, "cursor3", replace=True)
+        snapshot, cursor = self.store.load_snapshot()
+
+        self.assertEqual(cursor, "cursor3")
+        self.assertEqual(set(snapshot.keys()), {"/d.txt"})
+
+    def test_snapshot_rows_and_cursor_commit_together(self):
+        remote = MetadataContainer()
+        remote["/a.txt"] = self.entry("/a.txt")
+        self.store.save_snapshot(remote, "cursor1", replace=True)
+
+        remote["/b.txt"] = self.entry("/b.txt")
+        with self.assertRaises(sqlite3.Error):
+            # a cursor that cannot be bound fails the whole transaction
+            self.store.save_snapshot(remote, object())
+        snapshot, cursor = self.store.load_snapshot()
+
+        self.assertEqual(cursor, "cursor1")
+        self.assertEqual(set(snapshot.keys()), {"/a.txt"})
+        # the failed change is written by the next save
+        self.store.save_snapshot(remote, "cursor2")
+        self.assertEqual(set(self.store.load_snapshot()[0].keys()), {"/a.txt", "/b.txt"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+from src.model.path_locks import PathLockManager
+
+
+class TestPathLockManager(unittest.TestCase):
+
+    def setUp(self):
+        self.locks = PathLockManager()
+
+    def hold(self, lock, seconds, done):
+        def run():
+            with lock:
+                time.sleep(seconds)
+            done.append(time.monotonic())
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_disjoint_paths_run_in_parallel(self):
+        # pick two paths on different stripes
+        paths = ["/a/x"]
+        paths.append(next(
+            f"/b/{i}" for i in range(100)
+            if self.locks.stripe(f"/b/{i}") is not self.locks.stripe("/a/x")
+        ))
+        done = []
+        start = time.monotonic()
+        threads = [self.hold(self.locks.path(p), 0.3, done) for p in paths]
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(max(done) - start, 0.5)
+
+    def test_same_path_is_serialized(self):
+        done = []
+        start = time.monotonic()
+        threads = [self.hold(self.locks.path("a/x"), 0.2, done) for _ in range(2)]
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(max(done) - start, 0.4)
+
+    def test_subtree_waits_for_paths_below(self):
+        done = []
+        inner = self.hold(self.locks.path("/a/b/x"), 0.3, done)
+        time.sleep(0.05)
+
+        with self.locks.subtree("/a"):
+            self.assertEqual(len(done), 1)
+        inner.join()
+
+    def test_subtree_keeps_new_paths_out(self):
+        order = []
+        with self.locks.subtree("/a", "/c"):
+            def below():
+                with self.locks.path("/c/y"):
+                    order.append("below")
+
+            def beside():
+                with self.locks.path("/ab"):
+                    order.append("beside")
+
+            threads = [threading.Thread(target=below), threading.Thread(target=beside)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+            order.append("released")
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ["beside", "released", "below"])
+        self.assertEqual(self.locks.stats(), {"active": 0, "subtrees": 0, "waits": 1})
+
+    def test_overlapping_subtrees_exclude_each_other(self):
+        done = []
+        outer = self.hold(self.locks.subtree("/"), 0.2, done)
+        time.sleep(0.05)
+
+        with self.locks.subtree("/a/b"):
+            self.assertEqual(len(done), 1)
+        outer.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
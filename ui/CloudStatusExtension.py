@@ -2,7 +2,7 @@ import os
 import gi
 gi.require_version('Nemo', '3.0')
 from gi.repository import Nemo, GObject
-import pickle
+import sqlite3
 import sys
 path = os.path.expanduser('~/Desktop/.config')
 sys.path.append(path)
@@ -12,15 +12,24 @@ src = importlib.import_module('src')
 class CloudStatusExtension(GObject.GObject, Nemo.InfoProvider):
     def __init__(self):
         self.local_paths = []
-        self.metadata_file_path = os.path.expanduser('~/Desktop/.config/metadata.pkl')
+        self.metadata_file_path = os.path.expanduser('~/Desktop/.config/metadata.db')
         self.target_dir_path = os.path.expanduser('~/Desktop/dropbox')
         self.load_local_paths()
     
     def load_local_paths(self):
         try:
-            with open(self.metadata_file_path, 'rb') as f:
-                tmp_paths = list(pickle.load(f).keys())
-                self.local_paths = [s.lstrip('/') for s in tmp_paths]
+            conn = sqlite3.connect(f'file:{self.metadata_file_path}?mode=ro', uri=True)
+            try:
+                # rows link to their parent id, build the paths from the root down
+                tmp_paths = [row[0] for row in conn.execute(
+                    "WITH RECURSIVE tree(id, path, type) AS ("
+                    " SELECT id, '/' || name, type FROM metadata WHERE parent = '/'"
+                    " UNION ALL SELECT m.id, tree.path || '/' || m.name, m.type"
+                    " FROM metadata m JOIN tree ON m.parent = tree.id)"
+                    " SELECT path FROM tree WHERE type IS NOT NULL")]
+            finally:
+                conn.close()
+            self.local_paths = [s.lstrip('/') for s in tmp_paths]
         except Exception as e:
             self.local_paths = []
         